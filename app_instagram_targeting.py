@@ -5,12 +5,23 @@ Matches Instagram's actual ad targeting parameters
 November 21, 2025
 """
 
-from flask import Flask, render_template_string, request, jsonify
-import json, re, base64, os, tempfile, io
-from openai import OpenAI
-import anthropic
-import google.generativeai as genai
-import PIL.Image
+from flask import Flask, Response, g, render_template_string, request, jsonify
+import json, os, time, contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout, as_completed
+from score_cache import ScoreCache, content_hash
+from score_store import open_store
+from media_intake import PreparedImage, SpoolingRequest, spool_upload
+from jobs import JobManager
+from rate_limit import estimate_tokens, limiter_snapshot
+from deadline import DEFAULT_DEADLINE, JOB_DEADLINE, Deadline, DeadlineExceeded, current_deadline, deadline_scope, remaining
+from resilience import PROVIDER_TIMEOUT, VIDEO_TIMEOUT, breaker_snapshot, call_provider
+from transport import pool_snapshot
+import providers
+import metrics
+import structured
+import cascade
+import tracing
+import warmup
 
 # API Keys from environment variables (set in Railway dashboard)
 OPENAI_KEY = os.getenv('OPENAI_API_KEY', '')
@@ -19,65 +30,424 @@ GOOGLE_KEY = os.getenv('GOOGLE_API_KEY', '')
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB
+app.request_class = SpoolingRequest  # uploads stream to one spool file on disk
 
-openai_client = OpenAI(api_key=OPENAI_KEY)
-claude_client = anthropic.Anthropic(api_key=CLAUDE_KEY)
-genai.configure(api_key=GOOGLE_KEY)
-gemini_model = genai.GenerativeModel('gemini-3-pro-preview')
+# Provider fan-out: all three models are called at once, bounded by a shared pool
+CONCURRENT_SCORING = os.getenv('CONCURRENT_SCORING', '1') != '0'
+PROVIDER_WORKERS = int(os.getenv('PROVIDER_WORKERS', '12'))
+provider_pool = ThreadPoolExecutor(max_workers=PROVIDER_WORKERS, thread_name_prefix='provider')
 
-def extract_frame(video_bytes):
+# Repeat submissions of the same caption/media/targeting are served from memory,
+# backed by the on-disk score store shared by all workers (SCORE_STORE_PATH).
+# Bump PROMPT_VERSION whenever a scoring or recommendation prompt changes.
+PROMPT_VERSION = 'ig-targeting-2025-11-21'
+score_cache = ScoreCache(max_entries=int(os.getenv('SCORE_CACHE_SIZE', '512')),
+                         ttl=float(os.getenv('SCORE_CACHE_TTL', '3600')),
+                         store=open_store())
+metrics.add_collector(score_cache.collect)
+
+# Largest number of variants accepted by one POST /analyze/batch
+MAX_BATCH_VARIANTS = int(os.getenv('MAX_BATCH_VARIANTS', '50'))
+
+# Seconds of the request deadline kept back for the recommendations call
+RECOMMENDATION_RESERVE = float(os.getenv('RECOMMENDATION_RESERVE', '4'))
+
+# ?cascade=1 (or CASCADE=1): this model scores first and the other two only run
+# when it is unsure (cascade.py). GPT-5.1 has the lowest list price of the three.
+CASCADE_FIRST = os.getenv('CASCADE_FIRST', 'gpt')  # gpt, claude or gemini
+
+# Background executor for ?mode=job analyses (video uploads, long Gemini waits)
+jobs = JobManager(max_workers=int(os.getenv('JOB_WORKERS', '8')), ttl=float(os.getenv('JOB_TTL', '600')))
+
+# Retries are left to the hedging/breaker layer (resilience.py), not the SDKs.
+# Built on first use or by the warm-up, so importing the app stays fast.
+openai_client = providers.lazy(providers.openai_client, OPENAI_KEY, timeout=PROVIDER_TIMEOUT, max_retries=0)
+claude_client = providers.lazy(providers.anthropic_client, CLAUDE_KEY, timeout=PROVIDER_TIMEOUT, max_retries=0)
+genai = providers.lazy(providers.gemini_sdk, GOOGLE_KEY)  # PROVIDER_BACKEND=mock swaps in offline stand-ins
+gemini_model = providers.lazy(providers.gemini_model, GOOGLE_KEY, 'gemini-3-pro-preview')
+
+# GET /ready stays 503 until this worker has imported the SDKs and codecs
+warm = warmup.WarmUp({'openai': openai_client, 'anthropic': claude_client, 'gemini': gemini_model})
+app.extensions['warm_up'] = warm
+
+@metrics.timed('extract_frame')
+@tracing.traced('extract_frame')
+def extract_frame(video_path):
     try:
         import cv2, numpy as np
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as tmp:
-            tmp.write(video_bytes)
-            path = tmp.name
-        cap = cv2.VideoCapture(path)
+        import PIL.Image
+        cap = cv2.VideoCapture(video_path)
         ret, frame = cap.read()
         cap.release()
-        os.unlink(path)
         if ret:
             rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
             img = PIL.Image.fromarray(rgb)
             img.thumbnail((800, 800))
-            buf = io.BytesIO()
-            img.save(buf, format='JPEG', quality=80)
-            return buf.getvalue()
+            return PreparedImage.from_pil(img)  # JPEG-encoded only if a provider asks for bytes
     except: pass
     return None
 
-def parse_json(txt):
-    m = re.search(r'```json\s*(.*?)\s*```', txt, re.DOTALL)
-    if m: txt = m.group(1)
-    elif '{' in txt: txt = txt[txt.find('{'):txt.rfind('}')+1]
-    return json.loads(txt)
-
-def score_gpt(text, img_data, targeting_context):
-    uc = [{"type": "text", "text": f"Rate this social media post for virality.\n\nTargeting: {targeting_context}\nCaption: {text}\n\nProvide realistic scores (most content is 40-80/100). JSON: overall_score, text_quality, visual_appeal, emotional_resonance, clarity, brand_alignment, reasoning (all 0-100)"}]
-    if img_data:
-        uc.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64.b64encode(img_data).decode()}"}})
-    r = openai_client.chat.completions.create(model="gpt-5.1", messages=[{"role":"user","content":uc}], max_completion_tokens=400, temperature=0.2)
-    return parse_json(r.choices[0].message.content)
-
-def score_claude(text, img_data, targeting_context):
-    cb = [{"type":"text","text":f"Rate this social media post for virality.\n\nTargeting: {targeting_context}\nCaption: {text}\n\nProvide realistic scores (most content is 40-80/100). JSON: overall_score, text_quality, visual_appeal, emotional_resonance, clarity, brand_alignment, reasoning"}]
-    if img_data:
-        # Compress image for Claude (5MB limit)
-        img = PIL.Image.open(io.BytesIO(img_data))
-        if img.width > 1024 or img.height > 1024:
-            img.thumbnail((1024, 1024))
-        buf = io.BytesIO()
-        img.save(buf, format='JPEG', quality=80)
-        compressed = buf.getvalue()
-        cb.append({"type":"image","source":{"type":"base64","media_type":"image/jpeg","data":base64.b64encode(compressed).decode()}})
-    r = claude_client.messages.create(model="claude-sonnet-4-20250514", max_tokens=400, messages=[{"role":"user","content":cb}])
-    return parse_json(r.content[0].text)
-
-def score_gemini(text, img_data, targeting_context):
-    parts = [f"Rate this social media post for virality.\n\nTargeting: {targeting_context}\nCaption: {text}\n\nProvide realistic scores (most content is 40-80/100). JSON: overall_score, text_quality, visual_appeal, emotional_resonance, clarity, brand_alignment, reasoning"]
-    if img_data:
-        parts.append(PIL.Image.open(io.BytesIO(img_data)))
-    r = gemini_model.generate_content(parts)
-    return parse_json(r.text)
+@metrics.timed('parse_json')
+def parse_json(reply, model, schema=structured.SCORE):
+    # Validated against the schema; raises structured.ParseError (the model gets an error score)
+    return structured.parse(reply, schema, model)
+
+# Fast mode (?fast=1) swaps the reply format for this: scores only, a fraction of the output tokens.
+# Gemini 3 counts its thinking against max_output_tokens, so only GPT and Claude are capped.
+FAST_ASK = "JSON: overall_score, text_quality, visual_appeal, emotional_resonance, clarity, brand_alignment (integers 0-100, no reasoning)"
+
+# Added for a cascade's first model, whose confidence decides whether the others run
+CONFIDENCE_ASK = " Also confidence (0-100): how sure you are of overall_score."
+
+def score_schema(fast, rated=False):
+    if rated:
+        return structured.SCORE_FAST_RATED if fast else structured.SCORE_RATED
+    return structured.SCORE_FAST if fast else structured.SCORE
+
+def score_gpt(text, image, targeting_context, fast=False, rated=False):
+    ask = FAST_ASK if fast else "JSON: overall_score, text_quality, visual_appeal, emotional_resonance, clarity, brand_alignment, reasoning (all 0-100)"
+    ask += CONFIDENCE_ASK if rated else ''
+    max_tokens = structured.FAST_MAX_TOKENS if fast else 400
+    uc = [{"type": "text", "text": f"Rate this social media post for virality.\n\nTargeting: {targeting_context}\nCaption: {text}\n\nProvide realistic scores (most content is 40-80/100). {ask}"}]
+    if image:
+        data = image.b64()
+        metrics.PAYLOAD_BYTES.set(len(data), kind='openai_image')
+        tracing.annotate(bytes_sent=len(uc[0]["text"]) + len(data))
+        uc.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{data}"}})
+    r = call_provider('openai', estimate_tokens(uc[0]["text"], len(uc) - 1, max_tokens), openai_client.chat.completions.create,
+                      model="gpt-5.1", messages=[{"role":"user","content":uc}], max_completion_tokens=max_tokens, temperature=0.2,
+                      **structured.openai_kwargs(score_schema(fast, rated)))
+    return parse_json(r.choices[0].message.content, 'gpt-5.1', score_schema(fast, rated))
+
+def score_claude(text, image, targeting_context, fast=False, rated=False):
+    ask = FAST_ASK if fast else "JSON: overall_score, text_quality, visual_appeal, emotional_resonance, clarity, brand_alignment, reasoning"
+    ask += CONFIDENCE_ASK if rated else ''
+    max_tokens = structured.FAST_MAX_TOKENS if fast else 400
+    cb = [{"type":"text","text":f"Rate this social media post for virality.\n\nTargeting: {targeting_context}\nCaption: {text}\n\nProvide realistic scores (most content is 40-80/100). {ask}"}]
+    if image:
+        # Compressed JPEG for Claude (5MB limit)
+        data = image.jpeg_b64(1024)
+        metrics.PAYLOAD_BYTES.set(len(data), kind='anthropic_image')
+        tracing.annotate(bytes_sent=len(cb[0]["text"]) + len(data))
+        cb.append({"type":"image","source":{"type":"base64","media_type":"image/jpeg","data":data}})
+    r = call_provider('anthropic', estimate_tokens(cb[0]["text"], len(cb) - 1, max_tokens), claude_client.messages.create,
+                      model="claude-sonnet-4-20250514", max_tokens=max_tokens, messages=[{"role":"user","content":cb}],
+                      **structured.anthropic_kwargs(score_schema(fast, rated)))
+    return parse_json(structured.anthropic_reply(r), 'claude-sonnet-4-20250514', score_schema(fast, rated))
+
+def score_gemini(text, image, targeting_context, fast=False, rated=False):
+    ask = FAST_ASK if fast else "JSON: overall_score, text_quality, visual_appeal, emotional_resonance, clarity, brand_alignment, reasoning"
+    ask += CONFIDENCE_ASK if rated else ''
+    parts = [f"Rate this social media post for virality.\n\nTargeting: {targeting_context}\nCaption: {text}\n\nProvide realistic scores (most content is 40-80/100). {ask}"]
+    if image:
+        blob = image.blob()
+        metrics.PAYLOAD_BYTES.set(len(blob['data']), kind='gemini_image')
+        tracing.annotate(bytes_sent=len(parts[0]) + len(blob['data']))
+        parts.append(blob)
+    r = call_provider('gemini', estimate_tokens(parts[0], len(parts) - 1, 400), gemini_model.generate_content,
+                      parts, generation_config=structured.gemini_config(score_schema(fast, rated)),
+                      request_options={'timeout': PROVIDER_TIMEOUT})
+    return parse_json(r.text, 'gemini-3-pro-preview', score_schema(fast, rated))
+
+# A video counts as this many images in the Gemini tokens/min estimate
+VIDEO_TOKENS_AS_IMAGES = 10
+
+# Frame fallbacks are not cached so the next submit retries the full video
+VIDEO_FALLBACK_NOTE = "[Video Frame Only - Full video analysis unavailable]"
+
+def score_gemini_video(text, video_path, frame_data, targeting_context, progress=None, fast=False, rated=False):
+    # Gemini: Try FULL video analysis, fallback to frame
+    cut_short = False  # gave up waiting for processing because of the deadline
+    try:
+        print("  Attempting Gemini FULL VIDEO analysis...")
+
+        # Upload the spooled file to Gemini
+        if progress: progress('status', 'Uploading video to Gemini...')
+        # Breaker only: a duplicate upload would just double the wait
+        with metrics.stage('video_upload'), tracing.span('gemini upload', bytes_sent=os.path.getsize(video_path)):
+            video_file = call_provider('gemini', 0, genai.upload_file, path=video_path, hedge=False)
+        print(f"  Uploaded to Gemini, state: {video_file.state.name}")
+
+        # Wait for processing (max 30 seconds)
+        max_wait = 30
+        waited = 0
+        # ...and stop early if the request deadline would leave no time for the frame fallback
+        with metrics.stage('video_processing'):
+            while video_file.state.name == "PROCESSING" and waited < max_wait and remaining(max_wait) > 5:
+                with tracing.span('gemini poll') as poll:
+                    time.sleep(2)
+                    waited += 2
+                    video_file = genai.get_file(video_file.name)
+                    poll.set(waited=waited, state=video_file.state.name)
+                print(f"  Waiting... {waited}s (state: {video_file.state.name})")
+                if progress: progress('status', f"Gemini processing video... {waited}s")
+
+        if video_file.state.name == "ACTIVE":
+            # Analyze FULL VIDEO
+            prompt = f"Analyze this VIDEO for Instagram virality.\n\nTargeting: {targeting_context}\nCaption: {text}\n\nAnalyze: motion, pacing, audio/sound, hooks, storytelling, visual flow. {FAST_ASK if fast else 'JSON: overall_score, text_quality, visual_appeal, emotional_resonance, clarity, brand_alignment, reasoning (0-100)'}{CONFIDENCE_ASK if rated else ''}"
+
+            response = call_provider('gemini', estimate_tokens(prompt, VIDEO_TOKENS_AS_IMAGES, 400), gemini_model.generate_content,
+                                     [video_file, prompt], hedge=False, generation_config=structured.gemini_config(score_schema(fast, rated)),
+                                     request_options={'timeout': VIDEO_TIMEOUT})
+            result = parse_json(response.text, 'gemini-3-pro-preview', score_schema(fast, rated))
+            result['reasoning'] = f"[FULL VIDEO Analysis - Motion/Audio/Pacing] {result.get('reasoning', '')}"
+            return result
+        else:
+            cut_short = video_file.state.name == "PROCESSING" and waited < max_wait
+            raise Exception(f"Video processing failed: {video_file.state.name}")
+
+    except Exception as e:
+        print(f"  Video analysis failed: {e}")
+        print(f"  Falling back to frame analysis...")
+        # Fallback to frame
+        if frame_data:
+            result = score_gemini(text, frame_data, f"{targeting_context} (video frame)", fast, rated)
+            result['reasoning'] = f"{VIDEO_FALLBACK_NOTE} {result.get('reasoning', '')}"
+            if cut_short or isinstance(e, DeadlineExceeded):
+                result['partial'] = True  # the deadline, not the video, forced the fallback
+            return result
+        raise Exception('Video processing failed')
+
+def error_score(reason):
+    return {'overall_score':0,'text_quality':0,'visual_appeal':0,'emotional_resonance':0,'clarity':0,'brand_alignment':0,'reasoning':reason}
+
+MODEL_LABELS = {'gpt': 'GPT', 'claude': 'Claude', 'gemini': 'Gemini'}
+
+def frame_analysis(score_fn):
+    def score(text, image, targeting_context, fast=False, rated=False):
+        result = score_fn(text, image, targeting_context, fast, rated)
+        result['reasoning'] = f"[Frame Analysis] {result.get('reasoning', '')}"
+        return result
+    return score
+
+def cacheable(result):
+    return not result.get('reasoning', '').startswith(VIDEO_FALLBACK_NOTE)
+
+@metrics.timed('scoring')
+@tracing.traced('scoring')
+def run_models(calls, chash=None, progress=None):
+    """Run {model: (fn, args)} and return {model: score}; a failing model gets an error score.
+
+    With a content hash, cached scores are reused and fresh ones are cached.
+    progress('score', {'model', 'score'}) fires as soon as each model finishes.
+    Under a deadline, models still running when it expires are abandoned and
+    get an error score with 'timed_out': True.
+    """
+    scores = {}
+    deadline = current_deadline()
+
+    def finish(m, result, fresh):
+        if isinstance(result, DeadlineExceeded):
+            print(f"⏱ {MODEL_LABELS[m]}: {result}")
+            scores[m] = dict(error_score(str(result)), timed_out=True)
+        elif isinstance(result, Exception):
+            print(f"✗ {MODEL_LABELS[m]}: {result}")
+            scores[m] = error_score(str(result))
+        else:
+            scores[m] = result
+            print(f"✓ {MODEL_LABELS[m]}: {result.get('overall_score')}/100")
+            if chash and fresh and cacheable(result):
+                score_cache.put(m, chash, result)
+        if progress:
+            progress('score', {'model': m, 'score': scores[m]})
+
+    if chash:
+        for m in calls:
+            cached = score_cache.get(m, chash)
+            if cached is not None:
+                print(f"⚡ {MODEL_LABELS[m]}: cache hit")
+                finish(m, cached, fresh=False)
+        calls = {m: call for m, call in calls.items() if m not in scores}
+        tracing.annotate(cache_hits=len(scores))
+    
+    # One span per model, in whichever thread runs it
+    calls = {m: (tracing.traced(f"score {m}")(fn), args) for m, (fn, args) in calls.items()}
+
+    if CONCURRENT_SCORING:
+        # copy_context() carries the request deadline into the pool threads
+        futures = {provider_pool.submit(contextvars.copy_context().run, fn, *args): m for m, (fn, args) in calls.items()}
+        try:
+            for fut in as_completed(futures, timeout=deadline.remaining() if deadline else None):
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    result = e
+                finish(futures[fut], result, fresh=True)
+        except FuturesTimeout:  # not the builtin TimeoutError before Python 3.11
+            for fut, m in futures.items():
+                if m not in scores:
+                    fut.cancel()  # stragglers already running stop at their own deadline check
+                    finish(m, DeadlineExceeded(f"no answer within the {deadline.seconds:g}s deadline"), fresh=True)
+    else:
+        for m, (fn, args) in calls.items():
+            try:
+                if deadline:
+                    deadline.check(MODEL_LABELS[m])
+                result = fn(*args)
+            except Exception as e:
+                result = e
+            finish(m, result, fresh=True)
+
+    # Keep the usual gpt/claude/gemini order for callers and logs
+    return {m: scores[m] for m in sorted(scores, key=list(MODEL_LABELS).index)}
+
+@metrics.timed('recommendations')
+@tracing.traced('recommendations')
+def generate_recommendations(text, media_type, media_image, targeting_context, gemini_score):
+    # Generate CONTENT-SPECIFIC recommendations using GEMINI 3 PRO
+    gemini_baseline = gemini_score.get('overall_score', 50)
+    gemini_reasoning = gemini_score.get('reasoning', '')
+    print(f"\nGenerating SPECIFIC recommendations with GEMINI 3 PRO (baseline: {gemini_baseline}/100)...")
+    recs = []
+    
+    try:
+        # Build context from what Gemini saw
+        content_description = gemini_reasoning if gemini_reasoning else f"Content type: {media_type}"
+        
+        # Calculate how much room for improvement exists
+        max_possible_gain = 100 - gemini_baseline
+        # Cap total recommendations to ~15-18 points OR 60% of max possible gain, whichever is lower
+        total_budget = min(18, int(max_possible_gain * 0.6))
+        
+        # Ask Gemini for SPECIFIC recommendations based on what it analyzed
+        # Key: We feed back its OWN reasoning and ask it to address the weaknesses it identified
+        if media_type == "video":
+            rec_prompt_parts = [f"""You just analyzed this specific video and gave it {gemini_baseline}/100.
+
+YOUR EXACT ANALYSIS: "{content_description}"
+
+CAPTION: {text if text else "(no caption provided)"}
+TARGETING: {targeting_context}
+
+TASK: Based on YOUR analysis above, identify the specific weaknesses you mentioned and provide 5 recommendations to fix them.
+
+CRITICAL RULES:
+1. Each recommendation MUST directly address a weakness from YOUR analysis above
+2. Quote or reference the specific issue you identified (e.g., "You noted 'shaky camera work' - apply stabilization...")
+3. TOTAL impact of all 5 recommendations combined MUST NOT exceed {total_budget} points
+4. Distribute impacts realistically: e.g., +5, +4, +4, +3, +2 = {total_budget} total
+5. Be specific to THIS content, not generic advice
+
+Return JSON array (total impacts must sum to ≤{total_budget}):
+[
+  {{"weakness_addressed": "<quote from your analysis>", "recommendation": "<specific fix>", "impact": <number>}},
+  ...5 items...
+]"""]
+            
+            # If we have video file reference, include it
+            if media_image:
+                rec_prompt_parts.append(media_image.blob())
+        
+        elif media_type == "image":
+            rec_prompt_parts = [f"""You just analyzed this specific image and gave it {gemini_baseline}/100.
+
+YOUR EXACT ANALYSIS: "{content_description}"
+
+CAPTION: {text if text else "(no caption provided)"}
+TARGETING: {targeting_context}
+
+TASK: Based on YOUR analysis above, identify the specific weaknesses you mentioned and provide 5 recommendations to fix them.
+
+CRITICAL RULES:
+1. Each recommendation MUST directly address a weakness from YOUR analysis above
+2. Reference the specific issue you identified
+3. TOTAL impact of all 5 recommendations combined MUST NOT exceed {total_budget} points
+4. Distribute impacts realistically: e.g., +5, +4, +4, +3, +2 = {total_budget} total
+
+Return JSON array (total impacts must sum to ≤{total_budget}):
+[
+  {{"weakness_addressed": "<issue from your analysis>", "recommendation": "<specific fix>", "impact": <number>}},
+  ...5 items...
+]"""]
+            if media_image:
+                rec_prompt_parts.append(media_image.blob())
+        
+        else:
+            rec_prompt_parts = [f"""You analyzed this text-only post and gave it {gemini_baseline}/100.
+
+YOUR EXACT ANALYSIS: "{content_description}"
+
+CAPTION: {text}
+TARGETING: {targeting_context}
+
+TASK: Based on YOUR analysis above, identify the specific weaknesses you mentioned and provide 5 recommendations to fix them.
+
+CRITICAL RULES:
+1. Each recommendation MUST directly address a weakness from YOUR analysis
+2. TOTAL impact of all 5 recommendations combined MUST NOT exceed {total_budget} points
+3. Distribute impacts: e.g., +5, +4, +4, +3, +2 = {total_budget} total
+
+Return JSON array (total impacts must sum to ≤{total_budget}):
+[
+  {{"weakness_addressed": "<issue from your analysis>", "recommendation": "<specific fix>", "impact": <number>}},
+  ...5 items...
+]"""]
+        
+        # Generate recommendations
+        rec_response = call_provider('gemini', estimate_tokens(rec_prompt_parts[0], len(rec_prompt_parts) - 1, 1000),
+                                     gemini_model.generate_content, rec_prompt_parts,
+                                     generation_config=structured.gemini_config(structured.RECOMMENDATIONS),
+                                     request_options={'timeout': PROVIDER_TIMEOUT})
+        rec_text = rec_response.text
+        
+        # Parse response
+        suggestions = parse_json(rec_text, 'gemini-3-pro-preview', structured.RECOMMENDATIONS)
+        
+        print(f"  Got {len(suggestions)} recommendations from Gemini (budget: {total_budget})")
+        
+        # Collect raw impacts and normalize if needed
+        raw_recs = []
+        for item in suggestions[:5]:
+            rec_text_item = item.get('recommendation', item.get('suggestion', ''))
+            raw_impact = item.get('impact', item.get('estimated_impact', 3))
+            weakness = item.get('weakness_addressed', '')
+            
+            if not rec_text_item:
+                continue
+            
+            raw_recs.append({
+                'suggestion': rec_text_item,
+                'weakness': weakness,
+                'impact': max(raw_impact, 1)
+            })
+        
+        # Calculate total and normalize if exceeds budget
+        total_raw = sum(r['impact'] for r in raw_recs)
+        if total_raw > total_budget and total_raw > 0:
+            # Scale down proportionally
+            scale = total_budget / total_raw
+            for r in raw_recs:
+                r['impact'] = max(1, round(r['impact'] * scale))
+            print(f"  Scaled impacts from {total_raw} to fit budget {total_budget}")
+        
+        # Ensure we don't exceed budget after rounding
+        while sum(r['impact'] for r in raw_recs) > total_budget and raw_recs:
+            # Reduce the last impact above 1 by 1; once all are +1, drop the last recommendation
+            reducible = [r for r in raw_recs if r['impact'] > 1]
+            if reducible:
+                reducible[-1]['impact'] -= 1
+            else:
+                raw_recs.pop()
+        
+        for r in raw_recs:
+            recs.append({
+                'suggestion': r['suggestion'],
+                'impact': r['impact']
+            })
+            print(f"    - {r['suggestion'][:60]}... (+{r['impact']})")
+        
+    except Exception as e:
+        print(f"  Recommendation generation failed: {e}")
+        metrics.STAGE_ERRORS.inc(stage='recommendations')
+        import traceback
+        traceback.print_exc()
+    
+    # Sort by impact (highest first)
+    recs.sort(key=lambda x: x['impact'], reverse=True)
+    print(f"  Final: {len(recs)} recommendations")
+    
+    print(f"\n✓ Done! Gemini baseline: {gemini_baseline}/100, {len(recs)} recommendations\n{'='*80}\n")
+    return recs
 
 HTML = """<!DOCTYPE html>
 <html><head><title>Multimodal Agentic System</title>
@@ -283,6 +653,7 @@ async function analyze() {
     
     loading.style.display = 'block';
     results.style.display = 'none';
+    results.innerHTML = '';
     
     const fd = new FormData();
     fd.append('text', document.getElementById('text').value);
@@ -298,442 +669,546 @@ async function analyze() {
     if (file) fd.append('media', file);
     
     try {
-        const resp = await fetch('/analyze', {method: 'POST', body: fd});
-        const data = await resp.json();
-        
-        loading.style.display = 'none';
-        
-        let targeting = 'Broad Audience (No Targeting)';
-        const params = [];
-        if (data.targeting.location !== 'None (Worldwide)') params.push(data.targeting.location);
-        if (data.targeting.age !== 'None (All Ages)') params.push(data.targeting.age);
-        if (data.targeting.gender !== 'None (All Genders)') params.push(data.targeting.gender);
-        if (data.targeting.interest !== 'None (No Interest Targeting)') params.push(data.targeting.interest);
-        if (params.length > 0) targeting = params.join(' / ');
-        
-        const mediaLabels = {video: 'VIDEO', image: 'IMAGE', none: 'TEXT ONLY', unknown: 'UNKNOWN'};
-        const mediaLabel = mediaLabels[data.media_type] || '';
-        
-        let html = `<div class="info-bar">
-            <div><span class="info-label">Target Audience:</span> <span class="info-value">${targeting}</span></div>
-            <div><span class="info-label">Media:</span> <span class="info-value">${mediaLabel}</span></div>
-        </div>`;
-        
-        if (data.media_type === 'video') {
-            html += '<div class="note-bar">Gemini analyzes full video (motion, pacing, audio). GPT and Claude analyze keyframe visuals.</div>';
-        }
-        
-        html += '<div class="model-card"><div style="font-size:1.3em;font-weight:600;margin-bottom:20px;color:#1a2a6c;">Virality Scores</div>';
-        
-        ['gpt', 'claude', 'gemini'].forEach(m => {
-            if (data[m]) {
-                const names = {gpt:'GPT-5.1', claude:'Claude Sonnet 4.5', gemini:'Gemini 3 Pro'};
-                const s = data[m];
-                const scoreVal = Math.round(s.overall_score);
-                const scoreColor = getScoreColor(scoreVal);
-                
-                html += `<div style="margin:20px 0;padding:20px;background:#f8f9fa;border-radius:12px;">
-                    <div class="model-title">${names[m]}</div>
-                    <div class="score-huge" style="color:${scoreColor};">${scoreVal}<span style="font-size:0.4em;color:#666;">/100</span></div>
-                    <div class="score-bar">
-                        <div class="score-indicator" style="left:${scoreVal}%;color:${scoreColor};"></div>
-                    </div>
-                    <div class="components">
-                        <div class="comp"><div class="comp-val" style="color:${getScoreColor(s.text_quality)};">${Math.round(s.text_quality)}</div><div class="comp-label">Text</div></div>
-                        <div class="comp"><div class="comp-val" style="color:${getScoreColor(s.visual_appeal)};">${Math.round(s.visual_appeal)}</div><div class="comp-label">Visual</div></div>
-                        <div class="comp"><div class="comp-val" style="color:${getScoreColor(s.emotional_resonance)};">${Math.round(s.emotional_resonance)}</div><div class="comp-label">Emotional</div></div>
-                        <div class="comp"><div class="comp-val" style="color:${getScoreColor(s.clarity)};">${Math.round(s.clarity)}</div><div class="comp-label">Clarity</div></div>
-                    </div>
-                    <div class="reasoning">${s.reasoning}</div>
-                </div>`;
-            }
-        });
-        
-        html += '</div>';
-        
-        // RECOMMENDATIONS SECTION - Always show if we have any
-        if (data.recommendations && data.recommendations.length > 0) {
-            const sorted = data.recommendations.sort((a,b) => b.impact - a.impact).slice(0, 5);
-            
-            html += `<div class="rec-card">
-                <div class="rec-title">Top 5 Recommendations</div>`;
-            
-            sorted.forEach((rec, idx) => {
-                const impact = Math.round(rec.impact);
-                const sign = impact > 0 ? '+' : '';
-                html += `<div class="rec-item">
-                    <div class="rec-text">${rec.suggestion}</div>
-                    <div class="rec-impact positive">${sign}${impact}</div>
-                </div>`;
-            });
-            
-            html += `<div class="rec-note">Impact scores are real re-evaluations. Sorted by highest potential improvement.</div>`;
-            html += '</div>';
-        } else {
-            // Show placeholder if no recommendations
-            html += `<div class="rec-card">
-                <div class="rec-title">Top 5 Recommendations</div>
-                <div style="color:#666;padding:20px;text-align:center;">Generating recommendations...</div>
-            </div>`;
-        }
-        
-        results.innerHTML = html;
-        results.style.display = 'block';
-        results.scrollIntoView({behavior: 'smooth'});
-        
+        // Job mode: the server answers at once and we follow progress over SSE
+        const resp = await fetch('/analyze?mode=job', {method: 'POST', body: fd});
+        const job = await resp.json();
+        if (!resp.ok) throw new Error(job.error || resp.statusText);
+        renderResults(await followJob(job));
     } catch (e) {
         loading.style.display = 'none';
         alert('Error: ' + e.message);
         console.error(e);
     }
 }
-</script>
-</body></html>"""
 
-@app.route('/')
-def index():
-    return render_template_string(HTML)
+function followJob(job) {
+    const status = document.getElementById('status');
+    return new Promise((resolve, reject) => {
+        const events = new EventSource(job.events_url);
+        events.addEventListener('status', e => { status.textContent = JSON.parse(e.data); });
+        // Partial results: cards fill in as each model finishes
+        events.addEventListener('meta', e => renderMeta(JSON.parse(e.data)));
+        events.addEventListener('score', e => { const d = JSON.parse(e.data); renderScore(d.model, d.score); });
+        events.addEventListener('recommendations', e => renderRecs(JSON.parse(e.data)));
+        events.addEventListener('done', e => { events.close(); resolve(JSON.parse(e.data)); });
+        events.addEventListener('error', e => {
+            events.close();
+            if (e.data) { reject(new Error(JSON.parse(e.data).error)); return; }
+            // Stream dropped: fall back to polling the job
+            const poll = async () => {
+                const r = await (await fetch(job.status_url)).json();
+                if (r.status === 'done') resolve(r.result);
+                else if (r.status === 'error') reject(new Error(r.error));
+                else setTimeout(poll, 2000);
+            };
+            poll().catch(reject);
+        });
+    });
+}
 
-@app.route('/analyze', methods=['POST'])
-def analyze():
-    text = request.form.get('text', '')
-    
-    # Instagram targeting parameters
-    location = request.form.get('location', 'None (Worldwide)')
-    age = request.form.get('age', 'None (All Ages)')
-    gender = request.form.get('gender', 'None (All Genders)')
-    interest = request.form.get('interest', 'None (No Interest Targeting)')
-    language = request.form.get('language', 'None (All Languages)')
-    device = request.form.get('device', 'None (All Devices)')
-    
-    # Build targeting context
-    targeting_parts = []
-    if 'None' not in location: targeting_parts.append(f"Location: {location}")
-    if 'None' not in age: targeting_parts.append(f"Age: {age}")
-    if 'None' not in gender: targeting_parts.append(f"Gender: {gender}")
-    if 'None' not in interest: targeting_parts.append(f"Interest: {interest}")
-    if 'None' not in language: targeting_parts.append(f"Language: {language}")
-    if 'None' not in device: targeting_parts.append(f"Device: {device}")
-    
-    targeting_context = '; '.join(targeting_parts) if targeting_parts else "Broad audience (no targeting)"
+const MODEL_NAMES = {gpt:'GPT-5.1', claude:'Claude Sonnet 4.5', gemini:'Gemini 3 Pro'};
+
+// Page skeleton: info bar, one slot per model, recommendations placeholder
+function renderMeta(data) {
+    const loading = document.getElementById('loading');
+    const results = document.getElementById('results');
+    loading.style.display = 'none';
     
-    # Get media and detect type
-    media_image = None
-    media_video_bytes = None
-    media_type = "none"
+    let targeting = 'Broad Audience (No Targeting)';
+    const params = [];
+    if (data.targeting.location !== 'None (Worldwide)') params.push(data.targeting.location);
+    if (data.targeting.age !== 'None (All Ages)') params.push(data.targeting.age);
+    if (data.targeting.gender !== 'None (All Genders)') params.push(data.targeting.gender);
+    if (data.targeting.interest !== 'None (No Interest Targeting)') params.push(data.targeting.interest);
+    if (params.length > 0) targeting = params.join(' / ');
     
-    if 'media' in request.files:
-        f = request.files['media']
-        if f.filename:
-            fb = f.read()
-            
-            # DETECT media type automatically
-            if f.filename.lower().endswith(('.mp4','.mov','.avi','.webm','.mkv')):
-                media_type = "video"
-                media_video_bytes = fb
-                media_image = extract_frame(fb)  # Also extract frame for GPT/Claude
-                print(f"📹 Detected: VIDEO ({len(fb)/1024/1024:.1f}MB)")
-            elif f.filename.lower().endswith(('.jpg','.jpeg','.png','.gif','.webp','.bmp')):
-                media_type = "image"
-                media_image = fb
-                print(f"📸 Detected: IMAGE ({len(fb)/1024:.0f}KB)")
-            else:
-                media_type = "unknown"
-                media_image = fb
-                print(f"❓ Detected: UNKNOWN file type")
+    const mediaLabels = {video: 'VIDEO', image: 'IMAGE', none: 'TEXT ONLY', unknown: 'UNKNOWN'};
+    const mediaLabel = mediaLabels[data.media_type] || '';
     
-    print(f"\n{'='*80}\nANALYZING\nText: {text[:50]}...\nTargeting: {targeting_context}\nMedia Type: {media_type.upper()}\n{'='*80}\n")
+    let html = `<div class="info-bar">
+        <div><span class="info-label">Target Audience:</span> <span class="info-value">${targeting}</span></div>
+        <div><span class="info-label">Media:</span> <span class="info-value">${mediaLabel}</span></div>
+    </div>`;
     
-    # Score with all 3 models - DIFFERENTLY for video vs image
-    scores = {}
-    baseline = 50
+    if (data.media_type === 'video') {
+        html += '<div class="note-bar">Gemini analyzes full video (motion, pacing, audio). GPT and Claude analyze keyframe visuals.</div>';
+    }
     
-    if media_type == "video":
-        print("\n🎥 VIDEO MODE: Gemini analyzes full video, GPT/Claude analyze keyframe\n")
-        
-        # GPT-5.1: Image frame analysis
-        try:
-            scores['gpt'] = score_gpt(text, media_image, f"{targeting_context} (analyzing video keyframe)")
-            baseline = scores['gpt']['overall_score']
-            scores['gpt']['reasoning'] = f"[Frame Analysis] {scores['gpt'].get('reasoning', '')}"
-            print(f"✓ GPT (frame): {baseline}/100")
-        except Exception as e:
-            print(f"✗ GPT: {e}")
-            scores['gpt'] = {'overall_score':0,'text_quality':0,'visual_appeal':0,'emotional_resonance':0,'clarity':0,'brand_alignment':0,'reasoning':str(e)}
-        
-        # Claude: Image frame analysis
-        try:
-            scores['claude'] = score_claude(text, media_image, f"{targeting_context} (analyzing video keyframe)")
-            scores['claude']['reasoning'] = f"[Frame Analysis] {scores['claude'].get('reasoning', '')}"
-            print(f"✓ Claude (frame): {scores['claude']['overall_score']}/100")
-        except Exception as e:
-            print(f"✗ Claude: {e}")
-            scores['claude'] = {'overall_score':0,'text_quality':0,'visual_appeal':0,'emotional_resonance':0,'clarity':0,'brand_alignment':0,'reasoning':str(e)}
-        
-        # Gemini: Try FULL video analysis, fallback to frame
-        try:
-            print("  Attempting Gemini FULL VIDEO analysis...")
-            
-            # Save video temporarily
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as tmp:
-                tmp.write(media_video_bytes)
-                video_path = tmp.name
-            
-            # Upload to Gemini
-            video_file = genai.upload_file(path=video_path)
-            print(f"  Uploaded to Gemini, state: {video_file.state.name}")
-            
-            # Wait for processing (max 30 seconds)
-            import time
-            max_wait = 30
-            waited = 0
-            while video_file.state.name == "PROCESSING" and waited < max_wait:
-                time.sleep(2)
-                waited += 2
-                video_file = genai.get_file(video_file.name)
-                print(f"  Waiting... {waited}s (state: {video_file.state.name})")
-            
-            os.unlink(video_path)
-            
-            if video_file.state.name == "ACTIVE":
-                # Analyze FULL VIDEO
-                prompt = f"Analyze this VIDEO for Instagram virality.\n\nTargeting: {targeting_context}\nCaption: {text}\n\nAnalyze: motion, pacing, audio/sound, hooks, storytelling, visual flow. JSON: overall_score, text_quality, visual_appeal, emotional_resonance, clarity, brand_alignment, reasoning (0-100)"
-                
-                response = gemini_model.generate_content([video_file, prompt])
-                scores['gemini'] = parse_json(response.text)
-                scores['gemini']['reasoning'] = f"[FULL VIDEO Analysis - Motion/Audio/Pacing] {scores['gemini'].get('reasoning', '')}"
-                print(f"✓ Gemini (FULL VIDEO): {scores['gemini']['overall_score']}/100")
-            else:
-                raise Exception(f"Video processing failed: {video_file.state.name}")
-            
-        except Exception as e:
-            print(f"  Video analysis failed: {e}")
-            print(f"  Falling back to frame analysis...")
-            # Fallback to frame
-            if media_image:
-                scores['gemini'] = score_gemini(text, media_image, f"{targeting_context} (video frame)")
-                scores['gemini']['reasoning'] = f"[Video Frame Only - Full video analysis unavailable] {scores['gemini'].get('reasoning', '')}"
-                print(f"✓ Gemini (frame fallback): {scores['gemini']['overall_score']}/100")
-            else:
-                scores['gemini'] = {'overall_score':0,'text_quality':0,'visual_appeal':0,'emotional_resonance':0,'clarity':0,'brand_alignment':0,'reasoning':'Video processing failed'}
+    html += '<div class="model-card"><div style="font-size:1.3em;font-weight:600;margin-bottom:20px;color:#1a2a6c;">Virality Scores</div>';
+    ['gpt', 'claude', 'gemini'].forEach(m => {
+        html += `<div id="score-${m}" style="margin:20px 0;padding:20px;background:#f8f9fa;border-radius:12px;">
+            <div class="model-title">${MODEL_NAMES[m]}</div>
+            <div style="color:#666;">Scoring...</div>
+        </div>`;
+    });
+    html += '</div>';
     
-    elif media_type == "image":
-        print("\n📸 IMAGE MODE: All 3 models analyze image\n")
-        
-        # All 3 models analyze the image
-        try:
-            scores['gpt'] = score_gpt(text, media_image, targeting_context)
-            baseline = scores['gpt']['overall_score']
-            print(f"✓ GPT: {baseline}/100")
-        except Exception as e:
-            print(f"✗ GPT: {e}")
-            scores['gpt'] = {'overall_score':0,'text_quality':0,'visual_appeal':0,'emotional_resonance':0,'clarity':0,'brand_alignment':0,'reasoning':str(e)}
-        
-        try:
-            scores['claude'] = score_claude(text, media_image, targeting_context)
-            print(f"✓ Claude: {scores['claude']['overall_score']}/100")
-        except Exception as e:
-            print(f"✗ Claude: {e}")
-            scores['claude'] = {'overall_score':0,'text_quality':0,'visual_appeal':0,'emotional_resonance':0,'clarity':0,'brand_alignment':0,'reasoning':str(e)}
-        
-        try:
-            scores['gemini'] = score_gemini(text, media_image, targeting_context)
-            print(f"✓ Gemini: {scores['gemini']['overall_score']}/100")
-        except Exception as e:
-            print(f"✗ Gemini: {e}")
-            scores['gemini'] = {'overall_score':0,'text_quality':0,'visual_appeal':0,'emotional_resonance':0,'clarity':0,'brand_alignment':0,'reasoning':str(e)}
+    // Show placeholder until recommendations arrive
+    html += `<div class="rec-card" id="recs">
+        <div class="rec-title">Top 5 Recommendations</div>
+        <div style="color:#666;padding:20px;text-align:center;">Generating recommendations...</div>
+    </div>`;
     
-    else:
-        print("\n📝 TEXT-ONLY MODE: Analyzing text without media\n")
-        
-        # Text-only analysis
-        try:
-            scores['gpt'] = score_gpt(text, None, targeting_context)
-            baseline = scores['gpt']['overall_score']
-            print(f"✓ GPT: {baseline}/100")
-        except Exception as e:
-            scores['gpt'] = {'overall_score':0,'text_quality':0,'visual_appeal':0,'emotional_resonance':0,'clarity':0,'brand_alignment':0,'reasoning':str(e)}
-        
-        try:
-            scores['claude'] = score_claude(text, None, targeting_context)
-            print(f"✓ Claude: {scores['claude']['overall_score']}/100")
-        except Exception as e:
-            scores['claude'] = {'overall_score':0,'text_quality':0,'visual_appeal':0,'emotional_resonance':0,'clarity':0,'brand_alignment':0,'reasoning':str(e)}
-        
-        try:
-            scores['gemini'] = score_gemini(text, None, targeting_context)
-            print(f"✓ Gemini: {scores['gemini']['overall_score']}/100")
-        except Exception as e:
-            scores['gemini'] = {'overall_score':0,'text_quality':0,'visual_appeal':0,'emotional_resonance':0,'clarity':0,'brand_alignment':0,'reasoning':str(e)}
+    results.innerHTML = html;
+    results.style.display = 'block';
+    results.scrollIntoView({behavior: 'smooth'});
+}
+
+function renderScore(m, s) {
+    const scoreVal = Math.round(s.overall_score);
+    const scoreColor = getScoreColor(scoreVal);
     
-    # Generate CONTENT-SPECIFIC recommendations using GEMINI 3 PRO
-    gemini_baseline = scores.get('gemini', {}).get('overall_score', 50)
-    gemini_reasoning = scores.get('gemini', {}).get('reasoning', '')
-    print(f"\nGenerating SPECIFIC recommendations with GEMINI 3 PRO (baseline: {gemini_baseline}/100)...")
-    recs = []
+    document.getElementById('score-' + m).innerHTML = `<div class="model-title">${MODEL_NAMES[m]}</div>
+        <div class="score-huge" style="color:${scoreColor};">${scoreVal}<span style="font-size:0.4em;color:#666;">/100</span></div>
+        <div class="score-bar">
+            <div class="score-indicator" style="left:${scoreVal}%;color:${scoreColor};"></div>
+        </div>
+        <div class="components">
+            <div class="comp"><div class="comp-val" style="color:${getScoreColor(s.text_quality)};">${Math.round(s.text_quality)}</div><div class="comp-label">Text</div></div>
+            <div class="comp"><div class="comp-val" style="color:${getScoreColor(s.visual_appeal)};">${Math.round(s.visual_appeal)}</div><div class="comp-label">Visual</div></div>
+            <div class="comp"><div class="comp-val" style="color:${getScoreColor(s.emotional_resonance)};">${Math.round(s.emotional_resonance)}</div><div class="comp-label">Emotional</div></div>
+            <div class="comp"><div class="comp-val" style="color:${getScoreColor(s.clarity)};">${Math.round(s.clarity)}</div><div class="comp-label">Clarity</div></div>
+        </div>
+        <div class="reasoning">${s.reasoning}</div>`;
+}
+
+function renderRecs(recommendations) {
+    if (!recommendations || recommendations.length === 0) {
+        // Failed, skipped or empty: don't leave "Generating..." up
+        document.getElementById('recs').innerHTML = `<div class="rec-title">Top 5 Recommendations</div>
+            <div style="color:#666;padding:20px;text-align:center;">No recommendations</div>`;
+        return;
+    }
+    const sorted = recommendations.sort((a,b) => b.impact - a.impact).slice(0, 5);
     
-    try:
-        # Build context from what Gemini saw
-        content_description = gemini_reasoning if gemini_reasoning else f"Content type: {media_type}"
-        
-        # Calculate how much room for improvement exists
-        max_possible_gain = 100 - gemini_baseline
-        # Cap total recommendations to ~15-18 points OR 60% of max possible gain, whichever is lower
-        total_budget = min(18, int(max_possible_gain * 0.6))
-        
-        # Ask Gemini for SPECIFIC recommendations based on what it analyzed
-        # Key: We feed back its OWN reasoning and ask it to address the weaknesses it identified
-        if media_type == "video":
-            rec_prompt_parts = [f"""You just analyzed this specific video and gave it {gemini_baseline}/100.
+    let html = '<div class="rec-title">Top 5 Recommendations</div>';
+    sorted.forEach((rec, idx) => {
+        const impact = Math.round(rec.impact);
+        const sign = impact > 0 ? '+' : '';
+        html += `<div class="rec-item">
+            <div class="rec-text">${rec.suggestion}</div>
+            <div class="rec-impact positive">${sign}${impact}</div>
+        </div>`;
+    });
+    html += `<div class="rec-note">Impact scores are real re-evaluations. Sorted by highest potential improvement.</div>`;
+    document.getElementById('recs').innerHTML = html;
+}
 
-YOUR EXACT ANALYSIS: "{content_description}"
+function renderSkipped(m, cascade) {
+    document.getElementById('score-' + m).innerHTML = `<div class="model-title">${MODEL_NAMES[m]}</div>
+        <div style="color:#666;">Not needed: ${MODEL_NAMES[cascade.first]} was confident in its score.</div>`;
+}
 
-CAPTION: {text if text else "(no caption provided)"}
-TARGETING: {targeting_context}
+function renderResults(data) {
+    if (!document.getElementById('recs')) renderMeta(data);
+    ['gpt', 'claude', 'gemini'].forEach(m => {
+        if (data[m]) renderScore(m, data[m]);
+        else if (data.cascade) renderSkipped(m, data.cascade);
+    });
+    renderRecs(data.recommendations);
+}
+</script>
+</body></html>"""
 
-TASK: Based on YOUR analysis above, identify the specific weaknesses you mentioned and provide 5 recommendations to fix them.
+@app.route('/')
+def index():
+    return render_template_string(HTML)
 
-CRITICAL RULES:
-1. Each recommendation MUST directly address a weakness from YOUR analysis above
-2. Quote or reference the specific issue you identified (e.g., "You noted 'shaky camera work' - apply stabilization...")
-3. TOTAL impact of all 5 recommendations combined MUST NOT exceed {total_budget} points
-4. Distribute impacts realistically: e.g., +5, +4, +4, +3, +2 = {total_budget} total
-5. Be specific to THIS content, not generic advice
+@app.route('/limits')
+def provider_limits():
+    return jsonify(limiter_snapshot())
 
-Return JSON array (total impacts must sum to ≤{total_budget}):
-[
-  {{"weakness_addressed": "<quote from your analysis>", "recommendation": "<specific fix>", "impact": <number>}},
-  ...5 items...
-]"""]
-            
-            # If we have video file reference, include it
-            if media_image:
-                rec_prompt_parts.append(PIL.Image.open(io.BytesIO(media_image)))
-        
-        elif media_type == "image":
-            rec_prompt_parts = [f"""You just analyzed this specific image and gave it {gemini_baseline}/100.
+@app.route('/ready')
+def readiness():
+    warm.start()  # no-op once started (gunicorn starts it in post_worker_init)
+    status = warm.status()
+    return jsonify(status), 200 if status['ready'] else 503
 
-YOUR EXACT ANALYSIS: "{content_description}"
+@app.route('/parse/stats')
+def parse_stats():
+    return jsonify(structured.parse_snapshot())
 
-CAPTION: {text if text else "(no caption provided)"}
-TARGETING: {targeting_context}
+@app.route('/cascade/stats')
+def cascade_stats():
+    return jsonify(cascade.snapshot())
 
-TASK: Based on YOUR analysis above, identify the specific weaknesses you mentioned and provide 5 recommendations to fix them.
+@app.route('/transport')
+def transport_stats():
+    return jsonify(pool_snapshot())
 
-CRITICAL RULES:
-1. Each recommendation MUST directly address a weakness from YOUR analysis above
-2. Reference the specific issue you identified
-3. TOTAL impact of all 5 recommendations combined MUST NOT exceed {total_budget} points
-4. Distribute impacts realistically: e.g., +5, +4, +4, +3, +2 = {total_budget} total
+@app.route('/health/providers')
+def provider_health():
+    return jsonify(breaker_snapshot())
 
-Return JSON array (total impacts must sum to ≤{total_budget}):
-[
-  {{"weakness_addressed": "<issue from your analysis>", "recommendation": "<specific fix>", "impact": <number>}},
-  ...5 items...
-]"""]
-            if media_image:
-                rec_prompt_parts.append(PIL.Image.open(io.BytesIO(media_image)))
-        
-        else:
-            rec_prompt_parts = [f"""You analyzed this text-only post and gave it {gemini_baseline}/100.
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(score_cache.stats())
 
-YOUR EXACT ANALYSIS: "{content_description}"
+@app.before_request
+def assign_request_id():
+    g.request_id = tracing.request_id(request.headers.get('X-Request-ID'))
 
-CAPTION: {text}
-TARGETING: {targeting_context}
+@app.after_request
+def add_request_id(response):
+    response.headers['X-Request-ID'] = g.request_id
+    return response
 
-TASK: Based on YOUR analysis above, identify the specific weaknesses you mentioned and provide 5 recommendations to fix them.
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
-CRITICAL RULES:
-1. Each recommendation MUST directly address a weakness from YOUR analysis
-2. TOTAL impact of all 5 recommendations combined MUST NOT exceed {total_budget} points
-3. Distribute impacts: e.g., +5, +4, +4, +3, +2 = {total_budget} total
+TARGETING_DEFAULTS = {
+    'location': 'None (Worldwide)',
+    'age': 'None (All Ages)',
+    'gender': 'None (All Genders)',
+    'interest': 'None (No Interest Targeting)',
+    'language': 'None (All Languages)',
+    'device': 'None (All Devices)',
+}
 
-Return JSON array (total impacts must sum to ≤{total_budget}):
-[
-  {{"weakness_addressed": "<issue from your analysis>", "recommendation": "<specific fix>", "impact": <number>}},
-  ...5 items...
-]"""]
-        
-        # Generate recommendations
-        rec_response = gemini_model.generate_content(rec_prompt_parts)
-        rec_text = rec_response.text
-        
-        # Parse response
-        rec_data = parse_json(rec_text)
-        
-        if isinstance(rec_data, list):
-            suggestions = rec_data
-        elif isinstance(rec_data, dict):
-            suggestions = rec_data.get('recommendations', rec_data.get('suggestions', [rec_data]))
-        else:
-            suggestions = []
-        
-        print(f"  Got {len(suggestions)} recommendations from Gemini (budget: {total_budget})")
-        
-        # Collect raw impacts and normalize if needed
-        raw_recs = []
-        for item in suggestions[:5]:
-            rec_text_item = item.get('recommendation', item.get('suggestion', ''))
-            raw_impact = item.get('impact', item.get('estimated_impact', 3))
-            weakness = item.get('weakness_addressed', '')
-            
-            if not rec_text_item:
-                continue
-            
-            raw_recs.append({
-                'suggestion': rec_text_item,
-                'weakness': weakness,
-                'impact': max(raw_impact, 1)
-            })
-        
-        # Calculate total and normalize if exceeds budget
-        total_raw = sum(r['impact'] for r in raw_recs)
-        if total_raw > total_budget and total_raw > 0:
-            # Scale down proportionally
-            scale = total_budget / total_raw
-            for r in raw_recs:
-                r['impact'] = max(1, round(r['impact'] * scale))
-            print(f"  Scaled impacts from {total_raw} to fit budget {total_budget}")
-        
-        # Ensure we don't exceed budget after rounding
-        while sum(r['impact'] for r in raw_recs) > total_budget and raw_recs:
-            # Reduce the smallest impact by 1
-            raw_recs[-1]['impact'] = max(1, raw_recs[-1]['impact'] - 1)
-        
-        for r in raw_recs:
-            recs.append({
-                'suggestion': r['suggestion'],
-                'impact': r['impact']
-            })
-            print(f"    - {r['suggestion'][:60]}... (+{r['impact']})")
-        
-    except Exception as e:
-        print(f"  Recommendation generation failed: {e}")
-        import traceback
-        traceback.print_exc()
+def no_progress(event, data):
+    pass
+
+def build_targeting_context(targeting):
+    targeting_parts = []
+    if 'None' not in targeting['location']: targeting_parts.append(f"Location: {targeting['location']}")
+    if 'None' not in targeting['age']: targeting_parts.append(f"Age: {targeting['age']}")
+    if 'None' not in targeting['gender']: targeting_parts.append(f"Gender: {targeting['gender']}")
+    if 'None' not in targeting['interest']: targeting_parts.append(f"Interest: {targeting['interest']}")
+    if 'None' not in targeting['language']: targeting_parts.append(f"Language: {targeting['language']}")
+    if 'None' not in targeting['device']: targeting_parts.append(f"Device: {targeting['device']}")
     
-    # Sort by impact (highest first)
-    recs.sort(key=lambda x: x['impact'], reverse=True)
-    print(f"  Final: {len(recs)} recommendations")
+    return '; '.join(targeting_parts) if targeting_parts else "Broad audience (no targeting)"
+
+def detect_media(media, progress=no_progress):
+    """(media_type, image for GPT/Claude, video path for Gemini) of a spooled upload"""
+    if media is None:
+        return "none", None, None
+    metrics.PAYLOAD_BYTES.set(media.size, kind='upload')
     
-    print(f"\n✓ Done! Gemini baseline: {gemini_baseline}/100, {len(recs)} recommendations\n{'='*80}\n")
+    # DETECT media type automatically
+    if media.filename.lower().endswith(('.mp4','.mov','.avi','.webm','.mkv')):
+        progress('status', 'Extracting keyframe...')
+        frame = extract_frame(media.path)  # Also extract frame for GPT/Claude
+        print(f"📹 Detected: VIDEO ({media.size/1024/1024:.1f}MB)")
+        return "video", frame, media.path
+    elif media.filename.lower().endswith(('.jpg','.jpeg','.png','.gif','.webp','.bmp')):
+        print(f"📸 Detected: IMAGE ({media.size/1024:.0f}KB)")
+        return "image", PreparedImage(media.read_bytes()), None
+    else:
+        print(f"❓ Detected: UNKNOWN file type")
+        return "unknown", PreparedImage(media.read_bytes()), None
+
+def model_calls(text, media_type, media_image, media_video_path, targeting_context, progress=no_progress, fast=False,
+                rated=False):
+    """{model: (fn, args)} for one post - DIFFERENTLY for video vs image; rated also asks for confidence"""
+    if media_type == "video":
+        # Gemini analyzes full video, GPT/Claude analyze keyframe
+        frame_context = f"{targeting_context} (analyzing video keyframe)"
+        return {
+            'gpt': (frame_analysis(score_gpt), (text, media_image, frame_context, fast, rated)),
+            'claude': (frame_analysis(score_claude), (text, media_image, frame_context, fast, rated)),
+            'gemini': (score_gemini_video, (text, media_video_path, media_image, targeting_context, progress, fast, rated)),
+        }
+    # Unknown file types are scored as text only
+    image = media_image if media_type == "image" else None
+    return {
+        'gpt': (score_gpt, (text, image, targeting_context, fast, rated)),
+        'claude': (score_claude, (text, image, targeting_context, fast, rated)),
+        'gemini': (score_gemini, (text, image, targeting_context, fast, rated)),
+    }
+
+def run_cascade(post, chash, progress=None, fast=False):
+    """Score with CASCADE_FIRST alone, then the other two only if cascade.POLICY escalates.
+
+    post is model_calls' positional arguments. Returns (scores, cascade info);
+    models the cascade skipped have None for a score.
+    """
+    rated = model_calls(*post, fast=fast, rated=True)
+    first = run_models({CASCADE_FIRST: rated[CASCADE_FIRST]}, content_hash(chash, 'rated'), progress)
+    answer = first[CASCADE_FIRST]
+    reason = cascade.POLICY.reason(answer.get('overall_score', 0), answer.get('confidence'))
+    cascade.record('score', reason)
+    rest = [m for m in MODEL_LABELS if m != CASCADE_FIRST]
+    if reason is None:
+        print(f"✓ Cascade settled on {MODEL_LABELS[CASCADE_FIRST]} (confidence {answer['confidence']})")
+        scores = dict(first, **dict.fromkeys(rest))
+    else:
+        print(f"↑ Cascade escalating ({reason}) to {', '.join(MODEL_LABELS[m] for m in rest)}")
+        calls = model_calls(*post, fast=fast)
+        scores = dict(first, **run_models({m: calls[m] for m in rest}, chash, progress))
+    tracing.annotate(cascade=reason or 'settled')
+    return scores, {'first': CASCADE_FIRST, 'escalated': reason is not None, 'reason': reason,
+                    'skipped': [] if reason else rest}
+
+def truthy(value):
+    return str(value).lower() in ('1', 'true', 'yes', 'on')
+
+def score_version(fast):
+    """Cache-key version: fast scores (no reasoning) are kept apart from full ones"""
+    return f"{PROMPT_VERSION}:fast" if fast else PROMPT_VERSION
+
+def request_deadline(default=DEFAULT_DEADLINE):
+    """Deadline for this request: the `deadline` form field (seconds) or `default`; 0 (no deadline) for 0"""
+    seconds = request.form.get('deadline', type=float)
+    if seconds is None:
+        seconds = default
+    return Deadline(seconds) if seconds > 0 else 0
+
+@metrics.timed('analysis')
+def run_analysis(text, targeting, media=None, progress=no_progress, deadline=None, fast=False, use_cascade=False):
+    """Score a post with all 3 models and build recommendations; returns the /analyze JSON.
+
+    progress(event, data) receives status updates as the analysis moves along.
+    deadline (a Deadline or seconds, default ANALYZE_DEADLINE) caps the whole
+    analysis; models that miss it are listed in 'missing' and 'partial' is set.
+    fast asks for integer scores only: no reasoning and no recommendations
+    (submit again without fast to get them). use_cascade scores with
+    CASCADE_FIRST first and calls the other models only when it is unsure.
+    """
+    # Build targeting context
+    targeting_context = build_targeting_context(targeting)
+    
+    # Get media and detect type
+    media_type, media_image, media_video_path = detect_media(media, progress)
+    digest = media.digest if media is not None else ''
+    metrics.ANALYSES.inc(media_type=media_type)
     
-    return jsonify({
+    print(f"\n{'='*80}\nANALYZING\nText: {text[:50]}...\nTargeting: {targeting_context}\nMedia Type: {media_type.upper()}\n{'='*80}\n")
+    progress('meta', {'media_type': media_type, 'targeting': targeting})
+    progress('status', 'Scoring with GPT-5.1, Claude 4, Gemini 3...')
+    
+    # Score with all 3 models - DIFFERENTLY for video vs image
+    # All provider calls are sent at once; each model fails independently
+    if media_type == "video":
+        print("\n🎥 VIDEO MODE: Gemini analyzes full video, GPT/Claude analyze keyframe\n")
+    elif media_type == "image":
+        print("\n📸 IMAGE MODE: All 3 models analyze image\n")
+    else:
+        print("\n📝 TEXT-ONLY MODE: Analyzing text without media\n")
+    chash = content_hash(score_version(fast), media_type, text, digest, targeting_context)
+    with deadline_scope(deadline) as budget:
+        # Scoring must finish early enough to leave time for the recommendations
+        with deadline_scope(budget.shortened(RECOMMENDATION_RESERVE) if budget and not fast else 0):
+            post = (text, media_type, media_image, media_video_path, targeting_context, progress)
+            if use_cascade:
+                scores, cascaded = run_cascade(post, chash, progress, fast)
+            else:
+                scores, cascaded = run_models(model_calls(*post, fast=fast), chash, progress), None
+        missing = [m for m, s in scores.items() if s and s.get('timed_out')]
+        
+        # Generate CONTENT-SPECIFIC recommendations using GEMINI 3 PRO
+        # (they build on Gemini's reasoning, which fast mode leaves out;
+        # when a cascade skipped Gemini they build on the first model's)
+        recs = []
+        if not fast:
+            progress('status', 'Generating recommendations...')
+            basis = scores['gemini'] or scores[CASCADE_FIRST]
+            rec_key = content_hash(chash, json.dumps(basis, sort_keys=True))
+            recs = score_cache.get('recs', rec_key)
+            if recs is None:
+                recs = generate_recommendations(text, media_type, media_image, targeting_context, basis)
+                if recs:
+                    score_cache.put('recs', rec_key, recs)
+        progress('recommendations', recs)
+        partial = bool(missing) or any(s and s.get('partial') for s in scores.values()) or bool(budget and budget.expired())
+    tracing.annotate(media_type=media_type, partial=partial, fast=fast)
+    if partial:
+        cut = missing + [f"{m} full video" for m, s in scores.items() if s and s.get('partial')]
+        print(f"⏱ Partial result at the deadline (missing: {', '.join(cut) or 'recommendations'})")
+    
+    return {
         'gpt': scores['gpt'],
         'claude': scores['claude'],
         'gemini': scores['gemini'],
         'recommendations': recs,
         'media_type': media_type,  # Tell frontend what type was detected
-        'targeting': {
-            'location': location,
-            'age': age,
-            'gender': gender,
-            'interest': interest,
-            'language': language,
-            'device': device
-        }
-    })
+        'targeting': targeting,
+        'partial': partial,
+        'missing': missing,
+        'fast': fast,
+        'cascade': cascaded
+    }
+
+def analysis_job(text, targeting, media, deadline=None, request_id=None, fast=False, use_cascade=False,
+                 progress=no_progress):
+    # The job owns the claimed spool file and removes it when done
+    try:
+        # Traced on its own (same request id): the POST that started it has already answered
+        with tracing.trace('analysis job', request_id or tracing.request_id()):
+            return run_analysis(text, targeting, media, progress, deadline, fast, use_cascade)
+    finally:
+        if media is not None:
+            media.close()
+
+@app.route('/analyze', methods=['POST'])
+def analyze():
+    with tracing.trace('POST /analyze', g.request_id, mode=request.args.get('mode', 'sync')):
+        return analyze_request()
+
+def analyze_request():
+    with metrics.stage('upload'):
+        text = request.form.get('text', '')  # parsing the body streams any upload to its spool file
+    
+    # Instagram targeting parameters
+    targeting = {k: request.form.get(k, default) for k, default in TARGETING_DEFAULTS.items()}
+    
+    # Starts now, so time spent queued as a job counts too; background runs get the
+    # longer JOB_DEADLINE so a video's full processing wait fits
+    background = request.args.get('mode') in ('job', 'stream')
+    deadline = request_deadline(JOB_DEADLINE if background else DEFAULT_DEADLINE)
+    fast = truthy(request.values.get('fast'))  # ?fast=1 or a `fast` form field: scores only
+    use_cascade = truthy(request.values['cascade']) if 'cascade' in request.values else cascade.ENABLED
+    
+    media = None
+    if 'media' in request.files:
+        f = request.files['media']
+        if f.filename:
+            # Spooled to disk while the body was parsed; removed when the request closes
+            media = spool_upload(f, request)
+    
+    # ?mode=stream: NDJSON lines (meta, each model's score, recommendations, done) as they happen
+    if request.args.get('mode') == 'stream':
+        job = jobs.submit(analysis_job, text, targeting, media.claim() if media else None, deadline, g.request_id, fast,
+                          use_cascade)
+        return Response(jobs.stream(job, fmt='ndjson'), mimetype='application/x-ndjson',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    
+    # ?mode=job: answer with a job id now and do the work in the background
+    if request.args.get('mode') == 'job':
+        job = jobs.submit(analysis_job, text, targeting, media.claim() if media else None, deadline, g.request_id, fast,
+                          use_cascade)
+        return jsonify({
+            'job_id': job.id,
+            'status_url': f"/jobs/{job.id}",
+            'events_url': f"/jobs/{job.id}/events"
+        }), 202
+    
+    return jsonify(run_analysis(text, targeting, media, deadline=deadline, fast=fast, use_cascade=use_cascade))
+
+@app.route('/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """Score many variants that share one targeting; NDJSON lines in completion order.
+
+    Body: JSON {"variants": [{"id", "text"}], <targeting fields>}, or multipart with a
+    `variants` JSON field whose items may name an uploaded file field in "media".
+    Each line is {"variant", "model", "score"}; the last is {"event": "done", ...}.
+    "fast": true (or ?fast=1) scores without reasoning, for cheap high-volume runs.
+    """
+    payload = request.get_json(silent=True)
+    if payload is None:
+        payload = {k: request.form[k] for k in TARGETING_DEFAULTS if k in request.form}
+        try:
+            payload['variants'] = json.loads(request.form.get('variants', '[]'))
+        except ValueError:
+            return jsonify({'error': 'variants must be a JSON list'}), 400
+    variants = payload.get('variants')
+    if not isinstance(variants, list) or not variants:
+        return jsonify({'error': 'variants must be a non-empty list'}), 400
+    if len(variants) > MAX_BATCH_VARIANTS:
+        return jsonify({'error': f"at most {MAX_BATCH_VARIANTS} variants per batch"}), 400
+    for i, v in enumerate(variants):
+        if not isinstance(v, dict):
+            return jsonify({'error': f"variant {i} must be an object"}), 400
+        if not isinstance(v.get('text', ''), str) or not isinstance(v.get('media') or '', str):
+            return jsonify({'error': f"variant {i}: text and media must be strings"}), 400
+    
+    targeting = {k: payload.get(k) or default for k, default in TARGETING_DEFAULTS.items()}
+    targeting_context = build_targeting_context(targeting)
+    fast = truthy(payload.get('fast') or request.values.get('fast'))
+    
+    # Media is prepared once per distinct file (digest), however many variants use it
+    spooled = {}    # form field -> SpooledMedia
+    prepared = {}   # digest -> (media_type, media_image, media_video_path)
+    groups = {}     # content hash -> {'calls', 'ids'}: identical variants share provider calls
+    for i, v in enumerate(variants):
+        vid = str(v.get('id', i))
+        text = v.get('text', '')
+        field = v.get('media')
+        media = None
+        if field:
+            if field not in spooled:
+                f = request.files.get(field)
+                if f is None or not f.filename:
+                    return jsonify({'error': f"variant {vid}: no uploaded file '{field}'"}), 400
+                spooled[field] = spool_upload(f, request)
+            media = spooled[field]
+        digest = media.digest if media is not None else ''
+        if digest not in prepared:
+            prepared[digest] = detect_media(media)
+        media_type, media_image, media_video_path = prepared[digest]
+        
+        chash = content_hash(score_version(fast), media_type, text, digest, targeting_context)
+        if chash not in groups:
+            groups[chash] = {'calls': model_calls(text, media_type, media_image, media_video_path, targeting_context,
+                                                  fast=fast),
+                             'ids': []}
+        groups[chash]['ids'].append(vid)
+    
+    print(f"\n📦 BATCH: {len(variants)} variants, {len(groups)} distinct, {len(prepared)} distinct media\n")
+    
+    def lines(chash, m, score):
+        for vid in groups[chash]['ids']:
+            yield json.dumps({'variant': vid, 'model': m, 'score': score}) + '\n'
+    
+    # The response body outlives the request, so take the spool files off its cleanup list;
+    # the response removes them when the server closes it, even if the body never started
+    for media in spooled.values():
+        media.claim()
+    
+    def generate():
+        futures = {}
+        cached = 0
+        for chash, group in groups.items():
+            for m, (fn, args) in group['calls'].items():
+                hit = score_cache.get(m, chash)
+                if hit is not None:
+                    cached += 1
+                    yield from lines(chash, m, hit)
+                else:
+                    futures[provider_pool.submit(fn, *args)] = (chash, m)
+        
+        errors = 0
+        for fut in as_completed(futures):
+            chash, m = futures[fut]
+            try:
+                score = fut.result()
+                if cacheable(score):
+                    score_cache.put(m, chash, score)
+            except Exception as e:
+                print(f"✗ {MODEL_LABELS[m]}: {e}")
+                score = error_score(str(e))
+                errors += 1
+            yield from lines(chash, m, score)
+        
+        yield json.dumps({'event': 'done', 'variants': len(variants), 'distinct_variants': len(groups),
+                          'distinct_media': len([d for d in prepared if d]), 'provider_calls': len(futures),
+                          'cache_hits': cached, 'errors': errors, 'fast': fast}) + '\n'
+    
+    def close_spooled():
+        for media in spooled.values():
+            media.close()
+    
+    response = Response(generate(), mimetype='application/x-ndjson',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(close_spooled)
+    return response
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'unknown job'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'unknown job'}), 404
+    since = int(request.headers.get('Last-Event-ID') or request.args.get('since') or 0)
+    return Response(jobs.stream(job, since), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 if __name__ == '__main__':
     print("""
@@ -752,5 +1227,7 @@ if __name__ == '__main__':
 
 ⏱️  ~20-30 seconds | 💰 ~$0.20 | 🎯 NO FAKING
 """)
-    app.run(host='0.0.0.0', port=8080, debug=False)
+    warm.start()
+    # Development server; production runs gunicorn (see gunicorn.conf.py / Procfile)
+    app.run(host='0.0.0.0', port=int(os.getenv('PORT', '8080')), debug=False)
 
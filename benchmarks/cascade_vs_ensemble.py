@@ -0,0 +1,77 @@
+"""
+Cascade vs full ensemble A/B prediction
+
+Runs every A/B pair through predict_ab_winner with mode='ensemble' (every
+model on both variants) and mode='cascade' (the cheapest model first, the
+rest only when cascade.POLICY escalates). Reports how often the two pick the
+same winner, latency and provider calls per mode, and how often the cascade
+escalated and why.
+
+    python benchmarks/cascade_vs_ensemble.py --repeat 3
+    python benchmarks/cascade_vs_ensemble.py --pairs pairs.jsonl --min-confidence 60 --ab-margin 15
+
+Pairs use the format of pairwise_vs_independent.py. The score store is
+bypassed so each mode really calls the providers.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import cascade
+from multimodal_system import MultimodalAgenticABSystem
+from pairwise_vs_independent import load_pairs, run_pair, summarize
+
+
+async def main(args):
+    policy = cascade.POLICY
+    if args.min_confidence is not None:
+        policy.min_confidence = args.min_confidence
+    if args.ab_margin is not None:
+        policy.ab_margin = args.ab_margin
+    system = MultimodalAgenticABSystem()
+    system.scoring_agent.store = None
+    pairs = load_pairs(args.pairs)
+
+    results = {'ensemble': ([], []), 'cascade': ([], [])}
+    agree = 0
+    runs = 0
+    for _ in range(args.repeat):
+        for pair in pairs:
+            full, t_full = await run_pair(system, pair, 'ensemble')
+            cheap, t_cheap = await run_pair(system, pair, 'cascade')
+            for mode, prediction, seconds in (('ensemble', full, t_full), ('cascade', cheap, t_cheap)):
+                results[mode][0].append(seconds)
+                results[mode][1].append(prediction)
+            agree += full.winner == cheap.winner
+            runs += 1
+            print(f"{pair['a']['id']} vs {pair['b']['id']}: ensemble={full.winner} ({t_full:.1f}s) "
+                  f"cascade={cheap.winner} ({t_cheap:.1f}s, {cheap.calls_made} calls)")
+
+    report = {
+        'runs': runs,
+        'winner_agreement': round(agree / runs, 3),
+        'ensemble': summarize(*results['ensemble']),
+        'cascade': summarize(*results['cascade']),
+        'escalations': cascade.snapshot(policy)['kinds'].get('ab'),
+        'policy': cascade.snapshot(policy)['policy'],
+    }
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--pairs', help='JSONL file of A/B pairs (default: built-in samples)')
+    parser.add_argument('--repeat', type=int, default=1, help='Passes over the pairs')
+    parser.add_argument('--min-confidence', type=float, help='Override CASCADE_MIN_CONFIDENCE')
+    parser.add_argument('--ab-margin', type=float, help='Override CASCADE_AB_MARGIN')
+    parser.add_argument('--out', help='Also write the JSON report here')
+    asyncio.run(main(parser.parse_args()))
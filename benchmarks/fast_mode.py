@@ -0,0 +1,157 @@
+"""
+Fast mode vs full scoring: latency, output tokens and cost per provider
+
+    python benchmarks/fast_mode.py --runs 20
+    python benchmarks/fast_mode.py --live --runs 5 --price openai=1.25/10
+
+Calls the app's score_gpt / score_claude / score_gemini directly, once with
+the full reply (scores plus reasoning) and once with fast=True (integer
+scores only, FAST_MAX_TOKENS output), over a few sample captions. Latency is
+wall time per call. Token counts come from the provider span of each call's
+trace (the usage the SDK reports). Cost uses --price, in $ per 1M input /
+output tokens.
+
+Mock providers by default, with MOCK_OUTPUT_TPS set so output length shows up
+in latency. Those numbers only show the shape of the saving. --live calls the
+real APIs and needs the keys in the environment.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PRICES = {'openai': (1.25, 10.0), 'anthropic': (3.0, 15.0), 'gemini': (2.0, 12.0)}
+SCORERS = {'openai': 'score_gpt', 'anthropic': 'score_claude', 'gemini': 'score_gemini'}
+
+SAMPLE_POSTS = [
+    "Cozy atmosphere perfect for your lunch break! ☕🥗 Come relax with us today.",
+    "Made fresh daily! 🍔✨ Our signature burger is calling your name. Order now!",
+    "20% off all pastries before 10am. Early birds win 🥐",
+    "Pho or ramen on a rainy day? Tell us below 👇🍜",
+    "New noodle menu available now. Visit us.",
+]
+TARGETING = "Location: Los Angeles, CA; Age: 25-40; Interests: food, coffee"
+
+
+def parse_price(value):
+    provider, _, rates = value.partition('=')
+    cost_in, _, cost_out = rates.partition('/')
+    return provider, (float(cost_in), float(cost_out))
+
+
+def load_app(args, trace_file):
+    os.environ.update(TRACE_FILE=trace_file, HEDGING='0', SCORE_STORE_PATH='', WARM_UP='0')
+    if not args.live:
+        os.environ.update(PROVIDER_BACKEND='mock', MOCK_TIME_SCALE=str(args.time_scale),
+                          MOCK_OUTPUT_TPS=os.getenv('MOCK_OUTPUT_TPS', str(args.output_tps)))
+        for key in ('OPENAI_API_KEY', 'CLAUDE_API_KEY', 'GOOGLE_API_KEY'):
+            os.environ.setdefault(key, 'sk-mock')
+    import importlib
+    return importlib.import_module(args.app)
+
+
+def provider_usage(trace_file, request_id, provider):
+    """(input_tokens, output_tokens) of the provider span in one trace"""
+    with open(trace_file) as f:
+        for line in f:
+            record = json.loads(line)
+            if record['request_id'] != request_id:
+                continue
+            for span in record['spans']:
+                if span['name'] == provider and 'output_tokens' in span['attributes']:
+                    return span['attributes'].get('input_tokens', 0), span['attributes']['output_tokens']
+    return 0, 0
+
+
+def measure(app, trace_file, provider, fast, runs):
+    import tracing
+    scorer = getattr(app, SCORERS[provider])
+    rows = []
+    for i in range(runs):
+        text = SAMPLE_POSTS[i % len(SAMPLE_POSTS)]
+        request_id = uuid.uuid4().hex
+        started = time.perf_counter()
+        with tracing.trace('benchmark', request_id, provider=provider, fast=fast):
+            try:
+                scorer(text, None, TARGETING, fast=fast)
+                ok = True
+            except Exception as e:
+                print(f"  {provider} fast={fast}: {e}")
+                ok = False
+        seconds = time.perf_counter() - started
+        tokens_in, tokens_out = provider_usage(trace_file, request_id, provider)
+        rows.append({'seconds': seconds, 'input_tokens': tokens_in, 'output_tokens': tokens_out, 'ok': ok})
+    return rows
+
+
+def summarize(rows, price):
+    ok = [r for r in rows if r['ok']] or rows
+    tokens_in = statistics.fmean(r['input_tokens'] for r in ok)
+    tokens_out = statistics.fmean(r['output_tokens'] for r in ok)
+    return {
+        'p50_seconds': round(statistics.median(r['seconds'] for r in ok), 3),
+        'mean_seconds': round(statistics.fmean(r['seconds'] for r in ok), 3),
+        'input_tokens': round(tokens_in, 1),
+        'output_tokens': round(tokens_out, 1),
+        'usd_per_1k_calls': round((tokens_in * price[0] + tokens_out * price[1]) / 1e6 * 1000, 4),
+        'errors': sum(not r['ok'] for r in rows),
+    }
+
+
+def saving(full, fast, key):
+    return f"{(1 - fast[key] / full[key]) * 100:.0f}%" if full[key] else '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fast mode latency and cost benchmark')
+    parser.add_argument('--app', default='app_instagram_targeting')
+    parser.add_argument('--runs', type=int, default=20, help='Calls per provider and mode')
+    parser.add_argument('--providers', default='openai,anthropic,gemini')
+    parser.add_argument('--live', action='store_true', help='Call the real provider APIs')
+    parser.add_argument('--time-scale', type=float, default=0.1, help='MOCK_TIME_SCALE (mock only)')
+    parser.add_argument('--output-tps', type=float, default=60, help='MOCK_OUTPUT_TPS (mock only)')
+    parser.add_argument('--price', action='append', type=parse_price, default=[],
+                        help='provider=IN/OUT in $ per 1M tokens, e.g. openai=1.25/10')
+    parser.add_argument('--out', help='Also write the JSON results here')
+    args = parser.parse_args()
+    prices = dict(PRICES, **dict(args.price))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        trace_file = os.path.join(tmp, 'traces.jsonl')
+        app = load_app(args, trace_file)
+        results = {}
+        for provider in args.providers.split(','):
+            for fast in (False, True):
+                print(f"▶ {provider} {'fast' if fast else 'full'} ({args.runs} calls)")
+                rows = measure(app, trace_file, provider, fast, args.runs)
+                results.setdefault(provider, {})['fast' if fast else 'full'] = summarize(rows, prices[provider])
+
+    backend = 'live APIs' if args.live else f"mock, MOCK_TIME_SCALE={args.time_scale}, MOCK_OUTPUT_TPS={os.environ['MOCK_OUTPUT_TPS']}"
+    print(f"\nFull vs fast scoring ({backend}, {args.runs} calls each)\n")
+    print("| Provider | Mode | p50 (s) | Mean (s) | Input tokens | Output tokens | $ / 1k calls |")
+    print("|----------|------|---------|----------|--------------|---------------|--------------|")
+    for provider, modes in results.items():
+        for mode, r in modes.items():
+            print(f"| {provider} | {mode} | {r['p50_seconds']} | {r['mean_seconds']} | {r['input_tokens']} | "
+                  f"{r['output_tokens']} | {r['usd_per_1k_calls']} |")
+    print("\n| Provider | Latency saved (p50) | Output tokens saved | Cost saved |")
+    print("|----------|---------------------|---------------------|------------|")
+    for provider, modes in results.items():
+        full, fast = modes['full'], modes['fast']
+        print(f"| {provider} | {saving(full, fast, 'p50_seconds')} | {saving(full, fast, 'output_tokens')} | "
+              f"{saving(full, fast, 'usd_per_1k_calls')} |")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'backend': backend, 'prices': prices, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+"""
+Load test for POST /analyze
+
+Drives the Flask app with the scenarios in a workload file (one JSON object
+per line, see benchmarks/workloads.jsonl) at each of their concurrency
+levels, and reports per scenario/level: throughput, p50/p95/p99 latency,
+peak RSS, HTTP error rate and the share of model scores that came back as
+errors. Providers are mocked (PROVIDER_BACKEND=mock) unless --live is given.
+
+    python benchmarks/load_test.py --out results.json
+    python benchmarks/load_test.py --baseline baseline.json        # exit 1 on regression
+    python benchmarks/load_test.py --save-baseline baseline.json
+    python benchmarks/load_test.py --url http://localhost:8080 --server-pid 1234
+
+Workload fields: scenario, text ("{i}" is replaced by the concurrency level
+and request number so requests don't hit the score cache), requests, concurrency (list), optional
+targeting {field: value} and media {"type": "image"|"video", "width",
+"height", "seconds"}.
+"""
+
+import argparse
+import io
+import itertools
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Relative slack before a metric counts as a regression against the baseline
+DEFAULT_TOLERANCE = 0.2
+
+
+def say(message):
+    # progress goes to stderr; the app's own prints are silenced unless --verbose
+    print(message, file=sys.stderr, flush=True)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)] if ordered else None
+
+
+def rss_mb(pid='self'):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if pid == 'self':
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # peak, Linux reports kB
+    return None
+
+
+class RssSampler:
+    """Peak RSS of a process while the block runs"""
+
+    def __init__(self, pid='self', interval=0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = rss_mb(self.pid)
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def make_media(spec, directory):
+    """(filename, bytes) for a synthetic image or video"""
+    import numpy as np
+    width, height = spec.get('width', 1080), spec.get('height', 1080)
+    rng = np.random.default_rng(0)
+    if spec['type'] == 'image':
+        import PIL.Image
+        pixels = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)  # noise: realistic JPEG size
+        buf = io.BytesIO()
+        PIL.Image.fromarray(pixels).save(buf, format='JPEG', quality=90)
+        return 'load.jpg', buf.getvalue()
+    import cv2
+    path = os.path.join(directory, 'load.mp4')
+    fps = 24
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    for _ in range(int(spec.get('seconds', 3) * fps)):
+        writer.write(rng.integers(0, 255, (height, width, 3), dtype=np.uint8))
+    writer.release()
+    with open(path, 'rb') as f:
+        return 'load.mp4', f.read()
+
+
+class InProcessClient:
+    """POSTs through Flask's test client; one per load thread"""
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def post(self, fields, media):
+        data = dict(fields)
+        if media:
+            data['media'] = (io.BytesIO(media[1]), media[0])
+        response = self._client.post('/analyze', data=data)
+        return response.status_code, response.data
+
+
+class HttpClient:
+    """POSTs multipart/form-data to a running server"""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/') + '/analyze'
+
+    def post(self, fields, media):
+        boundary = uuid.uuid4().hex
+        body = io.BytesIO()
+        for name, value in fields.items():
+            body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+        if media:
+            body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="media"; filename="{media[0]}"\r\n'
+                       f'Content-Type: application/octet-stream\r\n\r\n'.encode())
+            body.write(media[1])
+            body.write(b'\r\n')
+        body.write(f'--{boundary}--\r\n'.encode())
+        req = urllib.request.Request(self.url, data=body.getvalue(), method='POST',
+                                     headers={'Content-Type': f'multipart/form-data; boundary={boundary}'})
+        try:
+            with urllib.request.urlopen(req, timeout=120) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+def model_errors(body):
+    """(error scores, scores) in an /analyze response"""
+    try:
+        result = json.loads(body)
+    except ValueError:
+        return 0, 0
+    scores = [result.get(m) for m in ('gpt', 'claude', 'gemini') if isinstance(result.get(m), dict)]
+    errors = [s for s in scores if s.get('overall_score') == 0 or s.get('timed_out')]
+    return len(errors), len(scores)
+
+
+def run_level(make_client, workload, concurrency, media, rss_pid):
+    total = workload.get('requests', 20)
+    counter = itertools.count()
+    latencies, failures, errored, scored = [], [0], [0], [0]
+    lock = threading.Lock()
+
+    def worker():
+        client = make_client()
+        while True:
+            i = next(counter)
+            if i >= total:
+                return
+            fields = {'text': workload.get('text', '').replace('{i}', f'{concurrency}.{i}'), **workload.get('targeting', {})}
+            started = time.perf_counter()
+            try:
+                status, body = client.post(fields, media)
+            except Exception as e:
+                say(f"  request failed: {e}")
+                status, body = None, b''
+            elapsed = time.perf_counter() - started
+            bad, n = model_errors(body) if status == 200 else (0, 0)
+            with lock:
+                latencies.append(elapsed)
+                failures[0] += status != 200
+                errored[0] += bad
+                scored[0] += n
+
+    with RssSampler(rss_pid) as rss:
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - started
+
+    return {
+        'concurrency': concurrency,
+        'requests': total,
+        'throughput_rps': round(total / wall, 3),
+        'p50_seconds': round(percentile(latencies, 0.50), 3),
+        'p95_seconds': round(percentile(latencies, 0.95), 3),
+        'p99_seconds': round(percentile(latencies, 0.99), 3),
+        'peak_rss_mb': round(rss.peak, 1) if rss.peak is not None else None,
+        'error_rate': round(failures[0] / total, 4),
+        'model_error_rate': round(errored[0] / scored[0], 4) if scored[0] else None,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Regression messages for results vs a baseline report"""
+    base = {(r['scenario'], r['concurrency']): r for r in baseline['results']}
+    problems = []
+    for r in results:
+        b = base.get((r['scenario'], r['concurrency']))
+        if b is None:
+            continue
+        name = f"{r['scenario']}@{r['concurrency']}"
+        for key in ('p50_seconds', 'p95_seconds', 'p99_seconds', 'peak_rss_mb'):
+            if r.get(key) is not None and b.get(key) and r[key] > b[key] * (1 + tolerance):
+                problems.append(f"{name}: {key} {b[key]} -> {r[key]}")
+        if r['throughput_rps'] < b['throughput_rps'] * (1 - tolerance):
+            problems.append(f"{name}: throughput_rps {b['throughput_rps']} -> {r['throughput_rps']}")
+        if r['error_rate'] > b['error_rate'] + 0.01:
+            problems.append(f"{name}: error_rate {b['error_rate']} -> {r['error_rate']}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test for POST /analyze')
+    parser.add_argument('--workloads', default=os.path.join(ROOT, 'benchmarks', 'workloads.jsonl'))
+    parser.add_argument('--scenario', action='append', help='Only run these scenarios')
+    parser.add_argument('--app', default='app_instagram_targeting', help='App module to load in-process')
+    parser.add_argument('--url', help='Load a running server instead of the in-process app')
+    parser.add_argument('--server-pid', help='With --url, sample this process for peak RSS')
+    parser.add_argument('--live', action='store_true', help='Call the real providers (costs money)')
+    parser.add_argument('--time-scale', default='1', help='MOCK_TIME_SCALE for the mock providers')
+    parser.add_argument('--out', help='Write the JSON report here')
+    parser.add_argument('--baseline', help='Compare against this report; exit 1 on regression')
+    parser.add_argument('--save-baseline', help='Write the report here as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--verbose', action='store_true', help="Keep the app's log output")
+    args = parser.parse_args()
+    if not args.verbose:
+        sys.stdout = open(os.devnull, 'w')
+
+    if not args.url:
+        if not args.live:
+            os.environ['PROVIDER_BACKEND'] = 'mock'
+            os.environ.setdefault('MOCK_TIME_SCALE', args.time_scale)
+        os.environ.setdefault('SCORE_STORE_PATH', '')  # measure the providers, not last run's scores
+        app = __import__(args.app).app
+        make_client = lambda: InProcessClient(app)
+        rss_pid = 'self'
+    else:
+        make_client = lambda: HttpClient(args.url)
+        rss_pid = args.server_pid
+
+    with open(args.workloads) as f:
+        workloads = [json.loads(line) for line in f if line.strip()]
+    if args.scenario:
+        workloads = [w for w in workloads if w['scenario'] in args.scenario]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for workload in workloads:
+            media = make_media(workload['media'], tmp) if workload.get('media') else None
+            for concurrency in workload.get('concurrency', [1]):
+                say(f"▶ {workload['scenario']} @ {concurrency} ...")
+                result = dict(scenario=workload['scenario'], **run_level(make_client, workload, concurrency, media, rss_pid))
+                say(f"  {result['throughput_rps']} req/s, p50 {result['p50_seconds']}s, "
+                    f"p95 {result['p95_seconds']}s, p99 {result['p99_seconds']}s, "
+                    f"rss {result['peak_rss_mb']}MB, errors {result['error_rate']:.1%}")
+                results.append(result)
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'backend': 'http' if args.url else ('live' if args.live else 'mock'),
+        'mock_time_scale': None if args.url or args.live else float(os.environ['MOCK_TIME_SCALE']),
+        'results': results,
+    }
+    for path in (args.out, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(results, json.load(f), args.tolerance)
+        if problems:
+            say("✗ Regressions against the baseline:")
+            for problem in problems:
+                say(f"  {problem}")
+            sys.exit(1)
+        say("✓ No regressions against the baseline")
+
+
+if __name__ == '__main__':
+    main()
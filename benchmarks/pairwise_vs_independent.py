@@ -0,0 +1,107 @@
+"""
+Pairwise vs independent A/B prediction
+
+Runs every A/B pair through predict_ab_winner in both modes and reports how
+often they pick the same winner, latency per mode, provider calls, and how
+often the pairwise winner was the post shown first (position bias).
+
+    python benchmarks/pairwise_vs_independent.py --pairs pairs.jsonl --repeat 3
+
+pairs.jsonl has one test per line:
+    {"a": {"id", "text", "image_path"}, "b": {...}, "target_audience", "business_category"}
+Without --pairs a few built-in restaurant pairs are used. The score store is
+bypassed so the independent mode really calls the providers every time.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from multimodal_system import ContentVariant, MultimodalAgenticABSystem
+
+SAMPLE_PAIRS = [
+    {"a": {"id": "atmosphere", "text": "Cozy atmosphere perfect for your lunch break! ☕🥗 Come relax with us today."},
+     "b": {"id": "food_quality", "text": "Made fresh daily! 🍔✨ Our signature burger is calling your name. Order now!"},
+     "target_audience": "urban professionals, ages 25-40", "business_category": "fast-casual restaurant"},
+    {"a": {"id": "discount", "text": "20% off all pastries before 10am. Early birds win 🥐"},
+     "b": {"id": "plain", "text": "We sell pastries."},
+     "target_audience": "students and commuters", "business_category": "bakery"},
+    {"a": {"id": "question", "text": "Pho or ramen on a rainy day? Tell us below 👇🍜"},
+     "b": {"id": "menu", "text": "New noodle menu available now. Visit us."},
+     "target_audience": "foodies, ages 18-34", "business_category": "noodle bar"},
+]
+
+
+def load_pairs(path):
+    if not path:
+        return SAMPLE_PAIRS
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def run_pair(system, pair, mode):
+    a, b = ContentVariant(**pair['a']), ContentVariant(**pair['b'])
+    started = time.perf_counter()
+    prediction = await system.apredict_ab_winner(a, b, pair['target_audience'], pair['business_category'], mode=mode)
+    return prediction, time.perf_counter() - started
+
+
+def summarize(latencies, predictions):
+    return {
+        'mean_latency': round(statistics.fmean(latencies), 3),
+        'p50_latency': round(statistics.median(latencies), 3),
+        'max_latency': round(max(latencies), 3),
+        'mean_calls': round(statistics.fmean(p.calls_made for p in predictions), 2),
+        'mean_confidence': round(statistics.fmean(p.confidence for p in predictions), 1),
+    }
+
+
+async def main(args):
+    system = MultimodalAgenticABSystem()
+    system.scoring_agent.store = None
+    system.rng.seed(args.seed)
+    pairs = load_pairs(args.pairs)
+
+    results = {'independent': ([], []), 'pairwise': ([], [])}
+    agree = 0
+    runs = 0
+    for _ in range(args.repeat):
+        for pair in pairs:
+            independent, t_ind = await run_pair(system, pair, 'ensemble')
+            pairwise, t_pair = await run_pair(system, pair, 'pairwise')
+            results['independent'][0].append(t_ind)
+            results['independent'][1].append(independent)
+            results['pairwise'][0].append(t_pair)
+            results['pairwise'][1].append(pairwise)
+            agree += independent.winner == pairwise.winner
+            runs += 1
+            print(f"{pair['a']['id']} vs {pair['b']['id']}: independent={independent.winner} ({t_ind:.1f}s) "
+                  f"pairwise={pairwise.winner} ({t_pair:.1f}s)")
+
+    decided = sum(system.position_wins.values())
+    report = {
+        'runs': runs,
+        'winner_agreement': round(agree / runs, 3),
+        'pairwise_first_position_win_rate': round(system.position_wins[1] / decided, 3) if decided else None,
+        'independent': summarize(*results['independent']),
+        'pairwise': summarize(*results['pairwise']),
+    }
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--pairs', help='JSONL file of A/B pairs (default: built-in samples)')
+    parser.add_argument('--repeat', type=int, default=1, help='Passes over the pairs')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the pairwise order')
+    parser.add_argument('--out', help='Also write the JSON report here')
+    asyncio.run(main(parser.parse_args()))
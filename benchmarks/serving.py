@@ -0,0 +1,112 @@
+"""
+Dev server vs gunicorn throughput
+
+Starts the app under each server in turn (mock providers, so no keys and no
+cost), loads POST /analyze over HTTP at each concurrency level with the
+load_test.py client, and prints throughput and latency side by side.
+
+    python benchmarks/serving.py --time-scale 0.25 --requests 64 --concurrency 1 8 32
+    python benchmarks/serving.py --scenario image --out serving.json
+
+- dev: python app_instagram_targeting.py (Werkzeug, one thread per request)
+- gunicorn: gunicorn -c gunicorn.conf.py app_instagram_targeting:app
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from load_test import HttpClient, make_media, run_level, say
+
+SERVERS = {
+    'dev': lambda app: [sys.executable, f'{app}.py'],
+    'gunicorn': lambda app: [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', f'{app}:app'],
+}
+
+
+def wait_ready(url, timeout=60):
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        try:
+            urllib.request.urlopen(url + '/limits', timeout=2).close()
+            return time.monotonic() - started
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server at {url} did not come up within {timeout}s")
+
+
+def worker_pid(master_pid):
+    """First gunicorn worker of the master, whose RSS is the one that grows"""
+    try:
+        with open(f'/proc/{master_pid}/task/{master_pid}/children') as f:
+            return int(f.read().split()[0])
+    except (OSError, IndexError, ValueError):
+        return master_pid
+
+
+def bench(server, args, workload, media):
+    port = args.port
+    env = dict(os.environ, PORT=str(port), PROVIDER_BACKEND='mock', MOCK_TIME_SCALE=str(args.time_scale),
+               SCORE_STORE_PATH='')
+    proc = subprocess.Popen(SERVERS[server](args.app), cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    try:
+        startup = wait_ready(url)
+        say(f"▶ {server} (ready in {startup:.1f}s)")
+        pid = worker_pid(proc.pid) if server == 'gunicorn' else proc.pid
+        rows = []
+        for concurrency in args.concurrency:
+            result = run_level(lambda: HttpClient(url), workload, concurrency, media, str(pid))
+            say(f"  @{concurrency}: {result['throughput_rps']} req/s, p50 {result['p50_seconds']}s, "
+                f"p95 {result['p95_seconds']}s, errors {result['error_rate']:.1%}")
+            rows.append(dict(server=server, **result))
+        return rows
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dev server vs gunicorn throughput')
+    parser.add_argument('--workloads', default=os.path.join(ROOT, 'benchmarks', 'workloads.jsonl'))
+    parser.add_argument('--scenario', default='text_only')
+    parser.add_argument('--app', default='app_instagram_targeting')
+    parser.add_argument('--requests', type=int, default=64)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--time-scale', type=float, default=0.25, help='MOCK_TIME_SCALE for the servers')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--out', help='Also write the JSON results here')
+    args = parser.parse_args()
+
+    with open(args.workloads) as f:
+        workload = next(w for w in map(json.loads, filter(str.strip, f)) if w['scenario'] == args.scenario)
+    workload = dict(workload, requests=args.requests)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        media = make_media(workload['media'], tmp) if workload.get('media') else None
+        for server in SERVERS:
+            rows.extend(bench(server, args, workload, media))
+
+    print(f"\n{args.scenario}, {args.requests} requests per level, MOCK_TIME_SCALE={args.time_scale}\n")
+    print("| Server | Concurrency | Throughput (req/s) | p50 (s) | p95 (s) | Peak RSS (MB) | Errors |")
+    print("|--------|-------------|--------------------|---------|---------|---------------|--------|")
+    for r in rows:
+        print(f"| {r['server']} | {r['concurrency']} | {r['throughput_rps']} | {r['p50_seconds']} | "
+              f"{r['p95_seconds']} | {r['peak_rss_mb']} | {r['error_rate']:.1%} |")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Cold start: import time, time to ready and first-request latency
+
+    python benchmarks/startup.py --runs 5
+    python benchmarks/startup.py --scenario image --out startup.json
+
+import: imports the app in fresh interpreters (live backend with dummy keys,
+no network), then runs the warm-up steps in-process. That shows what
+importing the app costs now, and what each lazy piece costs the first time
+it is used: an SDK client or the codecs.
+
+server: starts gunicorn with mock providers, once with WARM_UP=0 and once
+with WARM_UP=1. It records when the worker first answers HTTP, when
+GET /ready turns 200, and the latency of the first and second POST /analyze.
+The mocks skip the SDK imports, so the first-request gap here is the codecs
+(cv2 for video); in live mode the client steps from the import phase are
+added on top.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from load_test import HttpClient, make_media, say
+
+DUMMY_KEYS = {'OPENAI_API_KEY': 'sk-startup', 'CLAUDE_API_KEY': 'sk-startup', 'GOOGLE_API_KEY': 'startup'}
+
+IMPORT_SNIPPET = """
+import json, sys, time
+started = time.perf_counter()
+import {app} as app
+imported = time.perf_counter() - started
+app.warm.run()
+print(json.dumps(dict(import_seconds=round(imported, 3), **app.warm.steps)))
+"""
+
+
+def time_imports(args):
+    env = dict(os.environ, PROVIDER_BACKEND='live', SCORE_STORE_PATH='', WARM_UP_CONNECT='0', **DUMMY_KEYS)
+    runs = []
+    for _ in range(args.runs):
+        out = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET.format(app=args.app)], cwd=ROOT, env=env,
+                             capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+    return {k: round(statistics.median(r[k] for r in runs), 3) for k in runs[0]}
+
+
+def poll(url, timeout=60):
+    """Seconds until url answers 200 (None if it never does)"""
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        try:
+            urllib.request.urlopen(url, timeout=2).close()
+            return time.monotonic() - started
+        except urllib.error.HTTPError:
+            time.sleep(0.02)  # up but not ready (503)
+        except OSError:
+            time.sleep(0.02)
+    return None
+
+
+def time_server(args, warm_up, media):
+    env = dict(os.environ, PORT=str(args.port), PROVIDER_BACKEND='mock', MOCK_TIME_SCALE=str(args.time_scale),
+               SCORE_STORE_PATH='', WARM_UP=warm_up)
+    url = f'http://127.0.0.1:{args.port}'
+    started = time.monotonic()
+    proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', f'{args.app}:app'],
+                            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        listening = poll(url + '/limits')
+        ready = poll(url + '/ready')
+        row = dict(warm_up=warm_up, listening_seconds=round(listening, 3),
+                   ready_seconds=round(time.monotonic() - started, 3) if ready is not None else None)
+        client = HttpClient(url)
+        for label, i in (('first', 0), ('second', 1)):
+            t = time.perf_counter()
+            status, _ = client.post({'text': f'Startup check {warm_up}.{i}'}, media)
+            row[f'{label}_request_seconds'] = round(time.perf_counter() - t, 3)
+            row[f'{label}_status'] = status
+        return row
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold start benchmark')
+    parser.add_argument('--app', default='app_instagram_targeting')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters for the import phase')
+    parser.add_argument('--scenario', default='video', choices=['text', 'image', 'video'])
+    parser.add_argument('--time-scale', type=float, default=0.1, help='MOCK_TIME_SCALE for the server phase')
+    parser.add_argument('--port', type=int, default=18081)
+    parser.add_argument('--out', help='Also write the JSON results here')
+    args = parser.parse_args()
+
+    say(f"▶ import ({args.runs} runs)")
+    imports = time_imports(args)
+
+    servers = []
+    with tempfile.TemporaryDirectory() as tmp:
+        spec = {'image': {'type': 'image', 'width': 1080, 'height': 1350},
+                'video': {'type': 'video', 'width': 640, 'height': 360, 'seconds': 3}}.get(args.scenario)
+        media = make_media(spec, tmp) if spec else None
+        for warm_up in ('0', '1'):
+            say(f"▶ gunicorn WARM_UP={warm_up}")
+            servers.append(time_server(args, warm_up, media))
+
+    print(f"\nImport (median of {args.runs}, seconds)\n")
+    print("| Step | Seconds |")
+    print("|------|---------|")
+    for step, seconds in imports.items():
+        print(f"| {step} | {seconds} |")
+    print(f"\nServer ({args.scenario}, mock providers, MOCK_TIME_SCALE={args.time_scale})\n")
+    print("| WARM_UP | Listening (s) | Ready (s) | First request (s) | Second request (s) |")
+    print("|---------|---------------|-----------|-------------------|--------------------|")
+    for r in servers:
+        print(f"| {r['warm_up']} | {r['listening_seconds']} | {r['ready_seconds']} | "
+              f"{r['first_request_seconds']} | {r['second_request_seconds']} |")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'import': imports, 'server': servers}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
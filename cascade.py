@@ -0,0 +1,95 @@
+"""
+Cascade scoring: the cheapest model first, the rest only when it is unsure
+
+A cascade run scores with one model first and asks it how confident it is.
+The other models are called only when that first answer cannot settle things
+on its own. The policy (Policy, defaults from the environment) escalates when:
+
+- the first model failed, or its confidence is below CASCADE_MIN_CONFIDENCE
+  (default 70)
+- its overall score is within CASCADE_MARGIN points (default 5) of one of
+  CASCADE_BOUNDARIES, the score thresholds you act on (comma separated, e.g.
+  "50,70"; none by default)
+- for an A/B prediction, the two variants are less than CASCADE_AB_MARGIN
+  points apart (default 10)
+
+Every decision is counted by kind (score, ab) and result: settled, or the
+escalation reason. snapshot() (GET /cascade/stats) gives the escalation rate
+per kind, and abtest_cascade_total exports the same counts to /metrics.
+CASCADE=1 turns the cascade on for web requests that don't say either way
+(?cascade=0 / 1).
+"""
+
+import os
+import threading
+from dataclasses import asdict, dataclass
+from typing import Optional, Tuple
+
+import metrics
+
+ENABLED = os.getenv('CASCADE', '0') != '0'
+MIN_CONFIDENCE = float(os.getenv('CASCADE_MIN_CONFIDENCE', '70'))
+BOUNDARIES = tuple(float(b) for b in os.getenv('CASCADE_BOUNDARIES', '').split(',') if b.strip())
+MARGIN = float(os.getenv('CASCADE_MARGIN', '5'))
+AB_MARGIN = float(os.getenv('CASCADE_AB_MARGIN', '10'))
+
+DECISIONS = metrics.Counter('abtest_cascade_total', 'Cascade decisions, by kind and result (settled or the '
+                            'escalation reason)', ('kind', 'result'))
+
+_lock = threading.Lock()
+_counts = {}  # kind -> {result: n}
+
+
+@dataclass
+class Policy:
+    """When a cascade escalates past its first model (confidence None = the call failed)"""
+    min_confidence: float = MIN_CONFIDENCE
+    boundaries: Tuple[float, ...] = BOUNDARIES
+    margin: float = MARGIN
+    ab_margin: float = AB_MARGIN
+
+    def reason(self, overall: float, confidence: Optional[float]) -> Optional[str]:
+        """Why one first-model score needs the other models, or None if it stands"""
+        if confidence is None:
+            return 'error'
+        if confidence < self.min_confidence:
+            return 'low_confidence'
+        if any(abs(overall - b) < self.margin for b in self.boundaries):
+            return 'near_boundary'
+        return None
+
+    def ab_reason(self, overall_a: float, confidence_a: Optional[float],
+                  overall_b: float, confidence_b: Optional[float]) -> Optional[str]:
+        """Same for an A/B pair scored by the first model"""
+        for confidence in (confidence_a, confidence_b):
+            if confidence is None:
+                return 'error'
+            if confidence < self.min_confidence:
+                return 'low_confidence'
+        if abs(overall_a - overall_b) < self.ab_margin:
+            return 'close_margin'
+        return None
+
+
+POLICY = Policy()
+
+
+def record(kind: str, reason: Optional[str]) -> None:
+    result = reason or 'settled'
+    DECISIONS.inc(kind=kind, result=result)
+    with _lock:
+        counts = _counts.setdefault(kind, {})
+        counts[result] = counts.get(result, 0) + 1
+
+
+def snapshot(policy: Policy = POLICY):
+    with _lock:
+        counts = {kind: dict(c) for kind, c in _counts.items()}
+    kinds = {}
+    for kind, c in sorted(counts.items()):
+        total = sum(c.values())
+        escalated = total - c.get('settled', 0)
+        kinds[kind] = {'decisions': total, 'escalated': escalated,
+                       'escalation_rate': round(escalated / total, 4) if total else 0.0,
+                       'results': c}
+    return {'default_on': ENABLED, 'policy': asdict(policy), 'kinds': kinds}
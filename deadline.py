@@ -0,0 +1,86 @@
+"""
+Per-request time budgets
+
+A Deadline is set for the duration of a request with deadline_scope() and
+travels in a context variable, so every provider call underneath it (including
+ones in worker threads started with copy_context()) can see how much time is
+left. resilience.call_provider() stops waiting at the deadline, and the
+ensemble runners return whichever models finished, marked partial.
+
+ANALYZE_DEADLINE sets the default budget in seconds (0 = no deadline); callers
+can pass their own per request. JOB_DEADLINE is the default for background
+(?mode=job / stream) analyses. It is longer so that a video can finish
+Gemini's processing wait (up to 30s) and still leave time for the analysis
+call and the recommendations.
+"""
+
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+DEFAULT_DEADLINE = float(os.getenv('ANALYZE_DEADLINE', '15'))
+JOB_DEADLINE = float(os.getenv('JOB_DEADLINE', '90'))
+
+_current = contextvars.ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before this call finished"""
+
+
+class Deadline:
+    """A point in time (monotonic clock) by which the request must answer"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def shortened(self, seconds: float) -> 'Deadline':
+        """A deadline `seconds` earlier than this one, e.g. to reserve time for a later stage"""
+        earlier = Deadline(0)
+        earlier.seconds = max(0.0, self.seconds - seconds)
+        earlier.expires_at = self.expires_at - seconds
+        return earlier
+
+    def check(self, what: str = 'request') -> None:
+        if self.expired():
+            raise DeadlineExceeded(f"{what} exceeded its {self.seconds:g}s deadline")
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+def remaining(default: Optional[float] = None) -> Optional[float]:
+    """Seconds left on the current deadline, or `default` when there is none"""
+    deadline = _current.get()
+    return deadline.remaining() if deadline is not None else default
+
+
+@contextmanager
+def deadline_scope(deadline=None):
+    """Run the block under a deadline (a Deadline or seconds; None = DEFAULT_DEADLINE, 0 = none).
+
+    An enclosing deadline that expires sooner is kept, so nested scopes can
+    only tighten the budget. Yields the deadline in force, or None.
+    """
+    if deadline is None:
+        deadline = DEFAULT_DEADLINE
+    if not isinstance(deadline, Deadline):
+        deadline = Deadline(float(deadline)) if float(deadline) > 0 else None
+    outer = _current.get()
+    if outer is not None and (deadline is None or outer.expires_at <= deadline.expires_at):
+        deadline = outer
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
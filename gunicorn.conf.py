@@ -0,0 +1,59 @@
+"""
+gunicorn settings for production serving
+
+    gunicorn -c gunicorn.conf.py app_instagram_targeting:app
+
+An analysis spends nearly all its time waiting on provider APIs, so each
+worker runs many threads (gthread) instead of adding processes. Jobs
+(?mode=job / ?mode=stream), the in-memory score cache and the rate limiters
+live inside one process, so a single worker is the default. To run more,
+set WEB_CONCURRENCY and route each client to one worker (sticky sessions).
+Otherwise GET /jobs/<id> can land on a worker that never saw the job.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+# Each open SSE stream (/jobs/<id>/events) holds a thread for its whole job
+threads = int(os.getenv('GUNICORN_THREADS', '32'))
+
+# Every analysis sends its three provider calls at once through the shared
+# provider pool; size it so all `threads` requests can be scoring together.
+# Set before the app is imported (preload), which reads these at import time.
+os.environ.setdefault('PROVIDER_WORKERS', str(3 * threads))
+# A hedged provider call runs its primary and its hedge in the attempts pool,
+# so allow two attempts for every provider call that can be in flight
+os.environ.setdefault('HEDGE_WORKERS', str(2 * 3 * threads))
+# Any request thread may start a background analysis (?mode=job / stream)
+os.environ.setdefault('JOB_WORKERS', str(threads))
+
+# Import the app once in the master: a broken deploy fails before any worker
+# starts, and workers fork with the modules already loaded
+preload_app = True
+
+# gthread workers heartbeat from their main thread, so this only catches hung
+# workers; a slow request is not killed for taking longer
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+# On deploy/restart, in-flight requests and video jobs (upload + 30s
+# processing wait + VIDEO_TIMEOUT) get this long to finish
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '180'))
+keepalive = 5
+
+# Recycle workers now and then to cap slow memory growth (PIL/OpenCV buffers).
+# A recycled worker forgets its finished jobs; 0 turns recycling off.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_worker_init(worker):
+    # Each worker warms its own SDK clients and codecs (connections opened in
+    # the master would not survive the fork); GET /ready is 503 until done
+    warm = worker.wsgi.extensions.get('warm_up')
+    if warm is not None:
+        warm.start()
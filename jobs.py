@@ -0,0 +1,132 @@
+"""
+Background jobs for long-running analyses
+
+POST /analyze?mode=job hands the work to a JobManager and returns a job id at
+once, so the Gemini upload/poll wait, the scoring and the recommendations no
+longer hold a web worker thread. Clients poll GET /jobs/<id> or follow
+GET /jobs/<id>/events (Server-Sent Events); POST /analyze?mode=stream sends
+the same events back as NDJSON on the POST response itself.
+
+Jobs live in the memory of the process that accepted them; with several
+worker processes, route a client's requests to the same one.
+"""
+
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, Optional
+
+# Seconds between SSE keep-alive comments while a job is quiet
+HEARTBEAT = 15
+
+
+class Job:
+    """State and ordered progress events of one background job"""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = 'queued'  # queued -> running -> done | error
+        self.created_at = time.time()
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.events = []  # [(seq, event, data)]
+        self._cond = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('done', 'error')
+
+    def emit(self, event: str, data) -> None:
+        """Record a progress event and wake any stream following this job"""
+        with self._cond:
+            self.events.append((len(self.events) + 1, event, data))
+            self._cond.notify_all()
+
+    def _finish(self, status: str, result=None, error: Optional[str] = None) -> None:
+        with self._cond:
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished_at = time.time()
+            event, data = ('done', result) if status == 'done' else ('error', {'error': error})
+            self.events.append((len(self.events) + 1, event, data))
+            self._cond.notify_all()
+
+    def wait_events(self, since: int, timeout: float):
+        """Events after sequence number `since`, blocking up to timeout for new ones"""
+        with self._cond:
+            if len(self.events) <= since and not self.finished:
+                self._cond.wait(timeout)
+            return self.events[since:]
+
+    def to_dict(self) -> Dict:
+        status = {
+            'job_id': self.id,
+            'status': self.status,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'progress': [{'event': e, 'data': d} for _, e, d in self.events if e == 'status'][-1:],
+        }
+        if self.status == 'done':
+            status['result'] = self.result
+        elif self.status == 'error':
+            status['error'] = self.error
+        return status
+
+
+class JobManager:
+    """Runs jobs on a bounded background executor and keeps them for `ttl` seconds"""
+
+    def __init__(self, max_workers: int = 8, ttl: float = 600):
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args) -> Job:
+        """Start fn(*args, progress=job.emit) in the background"""
+        self._reap()
+        job = Job()
+        with self._lock:
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, fn, args)
+        return job
+
+    def _run(self, job: Job, fn, args) -> None:
+        job.status = 'running'
+        job.emit('status', 'Started')
+        try:
+            job._finish('done', result=fn(*args, progress=job.emit))
+        except Exception as e:
+            print(f"✗ Job {job.id}: {e}")
+            job._finish('error', error=str(e))
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stream(self, job: Job, since: int = 0, fmt: str = 'sse') -> Iterator[str]:
+        """Job events after event id `since`, as Server-Sent Events or NDJSON lines"""
+        while True:
+            events = job.wait_events(since, HEARTBEAT)
+            if not events:
+                # keep idle proxies from dropping the connection
+                yield ': keep-alive\n\n' if fmt == 'sse' else '\n'
+                continue
+            for seq, event, data in events:
+                since = seq
+                if fmt == 'sse':
+                    yield f"id: {seq}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+                else:
+                    yield json.dumps({'id': seq, 'event': event, 'data': data}) + '\n'
+            if job.finished and since >= len(job.events):
+                return
+
+    def _reap(self) -> None:
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for job_id in [j.id for j in self._jobs.values() if j.finished and j.finished_at < cutoff]:
+                del self._jobs[job_id]
@@ -0,0 +1,202 @@
+"""
+Streaming media intake
+
+Uploads (up to 500MB) are written straight to a single spool file while the
+multipart body is parsed, instead of being read into memory with f.read().
+Every later stage - frame extraction, the Gemini upload, hashing - works from
+that one path, or from a memory-mapped view of it.
+
+Spool files belong to the request and are deleted when it closes, unless a
+caller claims them with SpooledMedia.claim() to keep them longer.
+
+Images are then wrapped in a PreparedImage, which decodes at most once per
+request and memoizes each provider's derivative (base64, size-capped JPEG,
+Gemini blob) the first time it is asked for.
+"""
+
+import base64
+import hashlib
+import io
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+from typing import Dict, Optional
+
+from flask import Request
+
+import metrics
+
+CHUNK_SIZE = 1024 * 1024
+SPOOL_DIR = os.getenv('MEDIA_SPOOL_DIR') or None  # None = system temp dir
+
+
+def _suffix(filename: Optional[str]) -> str:
+    ext = os.path.splitext(filename or '')[1].lower()
+    return ext if ext.isascii() and 1 < len(ext) <= 6 else '.bin'
+
+
+class SpoolingRequest(Request):
+    """Flask request that parses file uploads straight into named spool files"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Keep the extension so SDKs that sniff the MIME type (Gemini upload) see the right one
+        spool = tempfile.NamedTemporaryFile('wb+', suffix=_suffix(filename), dir=SPOOL_DIR, delete=False)
+        self.__dict__.setdefault('_spooled_paths', set()).add(spool.name)
+        return spool
+
+    def close(self) -> None:
+        super().close()
+        for path in self.__dict__.get('_spooled_paths', ()):
+            _unlink(path)
+
+
+class SpooledMedia:
+    """One uploaded file on disk, with its size and SHA-256 digest"""
+
+    def __init__(self, path: str, filename: str, owner: Optional[Request] = None):
+        self.path = path
+        self.filename = filename
+        self.size = os.path.getsize(path)
+        self._owner = owner
+        self._digest = None
+
+    @property
+    def digest(self) -> str:
+        """SHA-256 of the file, hashed from a memory-mapped view (no copy into Python memory)"""
+        if self._digest is None:
+            if self.size == 0:
+                self._digest = ''
+            else:
+                with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                    self._digest = hashlib.sha256(view).hexdigest()
+        return self._digest
+
+    def read_bytes(self) -> bytes:
+        """Whole file in memory - only for images, which providers need inline anyway"""
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def claim(self) -> 'SpooledMedia':
+        """Take ownership of the file so it outlives the request; call close() when done"""
+        paths = self._owner.__dict__.get('_spooled_paths', set()) if self._owner is not None else set()
+        paths.discard(self.path)
+        self._owner = None
+        return self
+
+    def close(self) -> None:
+        _unlink(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def spool_upload(file_storage, request: Optional[Request] = None) -> SpooledMedia:
+    """SpooledMedia for a werkzeug FileStorage.
+
+    With SpoolingRequest the parser already wrote the upload to a named file
+    and it is used as-is. Anything else (in-memory streams) is copied to a
+    spool file in CHUNK_SIZE pieces.
+    """
+    stream = file_storage.stream
+    path = getattr(stream, 'name', None)
+    if isinstance(path, str) and request is not None and path in request.__dict__.get('_spooled_paths', ()):
+        stream.flush()
+        return SpooledMedia(path, file_storage.filename, owner=request)
+
+    with tempfile.NamedTemporaryFile('wb', suffix=_suffix(file_storage.filename), dir=SPOOL_DIR, delete=False) as spool:
+        stream.seek(0)
+        shutil.copyfileobj(stream, spool, CHUNK_SIZE)
+    if request is not None:
+        request.__dict__.setdefault('_spooled_paths', set()).add(spool.name)
+    return SpooledMedia(spool.name, file_storage.filename, owner=request)
+
+
+class PreparedImage:
+    """An image decoded once, with lazily built, memoized provider derivatives.
+
+    Safe to share between the provider threads of one request.
+    """
+
+    def __init__(self, data: Optional[bytes] = None, image=None):
+        self._data = data
+        self._image = image
+        self._memo = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_pil(cls, image) -> 'PreparedImage':
+        """Wrap an already decoded PIL image (e.g. a video keyframe)"""
+        return cls(image=image)
+
+    def _memoized(self, key, build):
+        with self._lock:
+            if key not in self._memo:
+                self._memo[key] = build()
+            return self._memo[key]
+
+    @property
+    def data(self) -> bytes:
+        """Original bytes, or a JPEG encoding when built from a PIL image"""
+        return self._data if self._data is not None else self.jpeg()
+
+    @property
+    def image(self):
+        """Decoded PIL image (decoded on first use, then reused)"""
+        with self._lock:
+            if self._image is None:
+                import PIL.Image
+                with metrics.stage('decode'):
+                    image = PIL.Image.open(io.BytesIO(self._data))
+                    image.load()
+                self._image = image
+            return self._image
+
+    def _header(self):
+        # Format and size without decoding pixels
+        if self._data is None:
+            return None, self._image.size
+        import PIL.Image
+        with PIL.Image.open(io.BytesIO(self._data)) as header:
+            return header.format, header.size
+
+    def jpeg(self, max_side: Optional[int] = None, quality: int = 80) -> bytes:
+        """JPEG bytes no larger than max_side on either edge"""
+        def build():
+            fmt, (width, height) = self._memoized('header', self._header)
+            if fmt == 'JPEG' and (max_side is None or max(width, height) <= max_side):
+                return self._data  # already a small enough JPEG: no re-encode
+            image = self.image
+            with metrics.stage('recompress'):
+                if max_side is not None and max(image.width, image.height) > max_side:
+                    image = image.copy()
+                    image.thumbnail((max_side, max_side))
+                if image.mode not in ('RGB', 'L'):
+                    image = image.convert('RGB')
+                buf = io.BytesIO()
+                image.save(buf, format='JPEG', quality=quality)
+                return buf.getvalue()
+        return self._memoized(('jpeg', max_side, quality), build)
+
+    def b64(self) -> str:
+        """Base64 of the original bytes"""
+        return self._memoized('b64', lambda: base64.b64encode(self.data).decode())
+
+    def jpeg_b64(self, max_side: Optional[int] = None) -> str:
+        """Base64 of jpeg(max_side)"""
+        return self._memoized(('jpeg_b64', max_side), lambda: base64.b64encode(self.jpeg(max_side)).decode())
+
+    def blob(self, max_side: Optional[int] = None) -> Dict:
+        """Inline Gemini part; the SDK would otherwise re-encode a PIL image on every call"""
+        return {'mime_type': 'image/jpeg', 'data': self.jpeg(max_side)}
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
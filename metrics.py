@@ -0,0 +1,215 @@
+"""
+In-process metrics in the Prometheus text format
+
+Both apps serve these on GET /metrics:
+
+- abtest_stage_seconds{stage}: time in each stage of an analysis (upload,
+  extract_frame, decode, recompress, parse_json, scoring, recommendations,
+  video_upload, video_processing, analysis) and of the agent (ensemble)
+- abtest_stage_errors_total{stage}: stages that raised (or failed to parse)
+- abtest_provider_seconds{provider}: each SDK call, hedges included, timed
+  once it holds a rate-limiter slot
+- abtest_provider_calls_total{provider,result}: ok / error / abandoned /
+  circuit_open per call_provider() call
+- abtest_cache_lookups_total{cache,result}: score cache and store lookups
+- abtest_payload_bytes{kind}: size of the last upload / provider image payload
+- limiter, breaker, cache and HTTP pool state, read from their snapshots at
+  scrape time
+
+No client library: each metric is a dict of label values behind one lock, so
+recording costs a lock and a couple of additions. Numbers are per process;
+with several gunicorn workers each one reports its own.
+"""
+
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Seconds; from cache hits and JSON parsing up to full-video Gemini calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+_metrics = []
+_collectors = []
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _number(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}  # label values -> number (histograms: [bucket counts, sum, count])
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(str(labels.get(n, '')) for n in self.labels)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, key)} {_number(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the block took, whether or not it raised"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return entry[2] if entry else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            values = {key: (list(entry[0]), entry[1], entry[2]) for key, entry in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(round(total, 6))}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+
+def add_collector(collect: Callable[[], Iterable[Tuple[str, str, str, Iterable[Tuple[Dict, float]]]]]) -> None:
+    """Register collect() -> [(name, kind, help, [(labels, value)])], called on every scrape.
+
+    For state other modules already keep (limiter, breakers, caches): nothing
+    is recorded on the hot path, the snapshot is read when /metrics is hit.
+    """
+    _collectors.append(collect)
+
+
+def _render_collected(name, kind, help, samples) -> List[str]:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(labels.keys(), labels.values())} {_number(value)}")
+    return lines
+
+
+def render() -> str:
+    """Every metric and collector in the Prometheus text exposition format"""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collect in _collectors:
+        try:
+            for family in collect():
+                lines.extend(_render_collected(*family))
+        except Exception as e:  # a broken collector must not take /metrics down
+            print(f"Metrics collector failed: {e}")
+    return '\n'.join(lines) + '\n'
+
+
+STAGE_SECONDS = Histogram('abtest_stage_seconds', 'Seconds spent in each analysis stage', ('stage',))
+STAGE_ERRORS = Counter('abtest_stage_errors_total', 'Analysis stages that raised or failed to parse', ('stage',))
+PROVIDER_SECONDS = Histogram('abtest_provider_seconds', 'Seconds per provider SDK call (hedges included)', ('provider',))
+PROVIDER_CALLS = Counter('abtest_provider_calls_total', 'Provider calls by result', ('provider', 'result'))
+CACHE_LOOKUPS = Counter('abtest_cache_lookups_total', 'Score cache / store lookups by result', ('cache', 'result'))
+PAYLOAD_BYTES = Gauge('abtest_payload_bytes', 'Size of the last payload of each kind', ('kind',))
+ANALYSES = Counter('abtest_analyses_total', 'Analyses run, by detected media type', ('media_type',))
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as stage `name`; an exception also counts as a stage error"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=name)
+
+
+def timed(name: str):
+    """Decorator form of stage()"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,308 @@
+"""
+Offline stand-ins for the OpenAI, Anthropic and Gemini SDKs
+
+Selected with PROVIDER_BACKEND=mock (see providers.py). They mimic the parts
+of each SDK this repo uses and answer with schema-valid JSON (single scores,
+pairwise comparisons, recommendation arrays) after a sampled latency:
+
+- latency is log-normal per provider: MOCK_<PROVIDER>_LATENCY is the median in
+  seconds, MOCK_LATENCY_SIGMA the spread, MOCK_TIME_SCALE multiplies all
+  waits (0 = instant)
+- MOCK_OUTPUT_TPS (default 0 = off) adds generation time: output tokens /
+  MOCK_OUTPUT_TPS seconds on top of the sampled latency, so short replies
+  (fast mode) come back sooner
+- MOCK_ERROR_RATE and MOCK_THROTTLE_RATE inject 500s and 429s
+- Gemini uploads stay PROCESSING for MOCK_VIDEO_PROCESSING seconds
+- structured-output requests (response_format, a forced tool, response_schema)
+  get bare JSON or a tool_use block; free-text replies come in ```json fences
+  and MOCK_MALFORMED_RATE of them are cut off mid-JSON
+
+Every draw comes from a generator seeded with MOCK_SEED, the provider, the
+prompt and how many times that prompt was sent, so a run is reproducible
+no matter how the calls interleave across threads.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+SEED = int(os.getenv('MOCK_SEED', '0'))
+TIME_SCALE = float(os.getenv('MOCK_TIME_SCALE', '1'))
+LATENCY_SIGMA = float(os.getenv('MOCK_LATENCY_SIGMA', '0.5'))
+ERROR_RATE = float(os.getenv('MOCK_ERROR_RATE', '0'))
+THROTTLE_RATE = float(os.getenv('MOCK_THROTTLE_RATE', '0'))
+VIDEO_PROCESSING = float(os.getenv('MOCK_VIDEO_PROCESSING', '4'))
+MALFORMED_RATE = float(os.getenv('MOCK_MALFORMED_RATE', '0'))
+OUTPUT_TPS = float(os.getenv('MOCK_OUTPUT_TPS', '0'))
+LATENCY_MEDIAN = {
+    'openai': float(os.getenv('MOCK_OPENAI_LATENCY', '2.0')),
+    'anthropic': float(os.getenv('MOCK_ANTHROPIC_LATENCY', '3.0')),
+    'gemini': float(os.getenv('MOCK_GEMINI_LATENCY', '1.5')),
+}
+
+SCORE_FIELDS = ['overall_score', 'text_quality', 'visual_appeal', 'emotional_resonance',
+                'clarity', 'brand_alignment', 'platform_optimization']
+
+
+class MockAPIError(Exception):
+    """Stand-in for an SDK's server error"""
+
+    def __init__(self, message: str, status_code: int = 500, retry_after: float = 0):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers={'retry-after': str(retry_after)} if retry_after else {})
+
+
+class RateLimitError(MockAPIError):
+    """429, named like the SDK classes so rate_limit.is_throttle_error() spots it"""
+
+
+class APITimeoutError(MockAPIError):
+    pass
+
+
+_sent = {}
+_sent_lock = threading.Lock()
+
+
+def _rng(provider: str, prompt: str) -> random.Random:
+    key = hashlib.sha256(f"{SEED}\0{provider}\0{prompt}".encode('utf-8')).hexdigest()
+    with _sent_lock:
+        n = _sent[key] = _sent.get(key, 0) + 1
+    return random.Random(f"{key}:{n}")
+
+
+def _prompt_text(payload) -> str:
+    """All text in a messages list / content blocks / Gemini parts, in order"""
+    if isinstance(payload, str):
+        return payload
+    if isinstance(payload, dict):
+        if 'text' in payload:
+            return str(payload['text'])
+        if 'content' in payload:
+            return _prompt_text(payload['content'])
+        return ''
+    if isinstance(payload, (list, tuple)):
+        return '\n'.join(_prompt_text(p) for p in payload)
+    return ''
+
+
+def _content_score(text: str, salt: str) -> int:
+    # The same post gets the same "true" quality from every provider
+    return 40 + int(hashlib.sha256(f"{salt}\0{text}".encode('utf-8')).hexdigest()[:8], 16) % 46
+
+
+def _scores(post: str, rng: random.Random, provider: str, reasoning: bool = True) -> dict:
+    base = _content_score(post, 'quality')
+    scores = {f: max(0, min(100, round(base + rng.gauss(0, 6)))) for f in SCORE_FIELDS}
+    if reasoning:
+        scores['reasoning'] = (f"Mock {provider} assessment of a {len(post)}-character post: the hook is clear "
+                               f"and the tone fits the audience. A sharper call to action would lift engagement.")
+    scores['confidence'] = rng.randint(60, 90)
+    return scores
+
+
+def _answer(provider: str, prompt: str, rng: random.Random):
+    """Schema-valid data for whichever prompt this repo sent"""
+    if 'Return JSON array' in prompt:
+        limit = re.search(r'must not exceed (\d+)', prompt, re.IGNORECASE)
+        budget = int(limit.group(1)) if limit else 10
+        recs = [{'weakness_addressed': f"Mock weakness {i + 1}",
+                 'recommendation': f"Mock recommendation {i + 1}: tighten the hook and add a call to action.",
+                 'impact': max(1, budget // 5)} for i in range(5)]
+        return recs
+    if '"post_1"' in prompt:
+        posts = re.findall(r'POST \d+\nText: (.*)', prompt)
+        post_1, post_2 = (posts + ['', ''])[:2]
+        first, second = _scores(post_1, rng, provider), _scores(post_2, rng, provider)
+        winner = 1 if first['overall_score'] >= second['overall_score'] else 2
+        return {'post_1': first, 'post_2': second, 'winner': winner}
+    post = re.search(r'(?:Caption|Text): (.*)', prompt)
+    return _scores(post.group(1) if post else prompt, rng, provider, 'no reasoning' not in prompt)
+
+
+def _render(data, mode: str, rng: random.Random):
+    """The reply as the SDK returns it: tool input (dict), bare JSON or fenced free text"""
+    if mode == 'tool':
+        return data
+    if mode == 'json':
+        return json.dumps(data)
+    text = '```json\n' + json.dumps(data) + '\n```'
+    if rng.random() < MALFORMED_RATE:
+        text = text[:len(text) // 2]  # ran out of tokens mid-object
+    return text
+
+
+def _plan(provider: str, payload, timeout=None, mode='text'):
+    """(seconds to wait, exception to raise or None, answer) for one call"""
+    prompt = _prompt_text(payload)
+    rng = _rng(provider, prompt)
+    latency = rng.lognormvariate(0, LATENCY_SIGMA) * LATENCY_MEDIAN[provider] * TIME_SCALE
+    roll = rng.random()
+    answer = _answer(provider, prompt, rng)
+    if OUTPUT_TPS:
+        latency += _usage(payload, answer)[1] / OUTPUT_TPS * TIME_SCALE
+    error = None
+    if roll < THROTTLE_RATE:
+        latency = min(latency, 0.05 * TIME_SCALE)
+        error = RateLimitError(f"mock {provider}: rate limit exceeded", 429, retry_after=1)
+    elif roll < THROTTLE_RATE + ERROR_RATE:
+        error = MockAPIError(f"mock {provider}: internal server error", 500)
+    if timeout is not None and latency > timeout:
+        latency, error = timeout, APITimeoutError(f"mock {provider}: request timed out", 408)
+    return latency, error, _render(answer, mode, rng)
+
+
+def _usage(prompt_payload, answer):
+    text = answer if isinstance(answer, str) else json.dumps(answer)
+    return len(_prompt_text(prompt_payload)) // 4, len(text) // 4
+
+
+def _call(provider: str, payload, timeout=None, mode='text'):
+    latency, error, answer = _plan(provider, payload, timeout, mode)
+    time.sleep(latency)
+    if error:
+        raise error
+    return answer
+
+
+async def _acall(provider: str, payload, timeout=None, mode='text'):
+    latency, error, answer = _plan(provider, payload, timeout, mode)
+    await asyncio.sleep(latency)
+    if error:
+        raise error
+    return answer
+
+
+def _openai_response(messages, text):
+    prompt_tokens, completion_tokens = _usage(messages, text)
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=text), finish_reason='stop')],
+        usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                              total_tokens=prompt_tokens + completion_tokens))
+
+
+def _anthropic_response(messages, answer, tools=None):
+    input_tokens, output_tokens = _usage(messages, answer)
+    if tools:
+        block = SimpleNamespace(type='tool_use', id=f"toolu_mock{uuid.uuid4().hex[:12]}", name=tools[0]['name'], input=answer)
+        stop_reason = 'tool_use'
+    else:
+        block, stop_reason = SimpleNamespace(type='text', text=answer), 'end_turn'
+    return SimpleNamespace(content=[block], stop_reason=stop_reason,
+                           usage=SimpleNamespace(input_tokens=input_tokens, output_tokens=output_tokens))
+
+
+def _gemini_response(parts, text):
+    prompt_tokens, candidates_tokens = _usage(parts, text)
+    return SimpleNamespace(text=text, usage_metadata=SimpleNamespace(
+        prompt_token_count=prompt_tokens, candidates_token_count=candidates_tokens))
+
+
+class _Completions:
+    def __init__(self, client):
+        self._client = client
+
+    def create(self, messages, timeout=None, response_format=None, **kwargs):
+        mode = 'json' if response_format else 'text'
+        return _openai_response(messages, _call('openai', messages, timeout or self._client.timeout, mode))
+
+
+class _AsyncCompletions(_Completions):
+    async def create(self, messages, timeout=None, response_format=None, **kwargs):
+        mode = 'json' if response_format else 'text'
+        return _openai_response(messages, await _acall('openai', messages, timeout or self._client.timeout, mode))
+
+
+class MockOpenAI:
+    """client.chat.completions.create(...) -> .choices[0].message.content"""
+
+    _completions = _Completions
+
+    def __init__(self, api_key=None, timeout=None, max_retries=None, **kwargs):
+        self.timeout = timeout
+        self.chat = SimpleNamespace(completions=self._completions(self))
+
+
+class MockAsyncOpenAI(MockOpenAI):
+    _completions = _AsyncCompletions
+
+
+class _Messages:
+    def __init__(self, client):
+        self._client = client
+
+    def create(self, messages, timeout=None, tools=None, **kwargs):
+        answer = _call('anthropic', messages, timeout or self._client.timeout, 'tool' if tools else 'text')
+        return _anthropic_response(messages, answer, tools)
+
+
+class _AsyncMessages(_Messages):
+    async def create(self, messages, timeout=None, tools=None, **kwargs):
+        answer = await _acall('anthropic', messages, timeout or self._client.timeout, 'tool' if tools else 'text')
+        return _anthropic_response(messages, answer, tools)
+
+
+class MockAnthropic:
+    """client.messages.create(...) -> .content[0].text (or .input for a forced tool)"""
+
+    _messages = _Messages
+
+    def __init__(self, api_key=None, timeout=None, max_retries=None, **kwargs):
+        self.timeout = timeout
+        self.messages = self._messages(self)
+
+
+class MockAsyncAnthropic(MockAnthropic):
+    _messages = _AsyncMessages
+
+
+class MockGenerativeModel:
+    """genai.GenerativeModel(name).generate_content(parts) -> .text"""
+
+    def __init__(self, model_name=None, **kwargs):
+        self.model_name = model_name
+
+    def generate_content(self, contents, generation_config=None, request_options=None, **kwargs):
+        timeout = (request_options or {}).get('timeout')
+        parts = contents if isinstance(contents, (list, tuple)) else [contents]
+        mode = 'json' if (generation_config or {}).get('response_schema') else 'text'
+        return _gemini_response(parts, _call('gemini', parts, timeout, mode))
+
+
+class MockGenAI:
+    """The google.generativeai module surface: configure, GenerativeModel, upload_file, get_file"""
+
+    GenerativeModel = MockGenerativeModel
+
+    def __init__(self):
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def configure(self, api_key=None, **kwargs):
+        pass
+
+    def _file(self, name):
+        with self._lock:
+            ready_at = self._files[name]
+        state = 'ACTIVE' if time.monotonic() >= ready_at else 'PROCESSING'
+        return SimpleNamespace(name=name, state=SimpleNamespace(name=state), mime_type='video/mp4')
+
+    def upload_file(self, path=None, **kwargs):
+        size = os.path.getsize(path)
+        # upload time grows with the file (~50MB/s), then processing starts
+        time.sleep(min(size / 50e6, 10) * TIME_SCALE)
+        name = f"files/mock-{uuid.uuid4().hex[:12]}"
+        with self._lock:
+            self._files[name] = time.monotonic() + VIDEO_PROCESSING * TIME_SCALE
+        return self._file(name)
+
+    def get_file(self, name):
+        return self._file(name)
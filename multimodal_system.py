@@ -13,14 +13,28 @@ Runs on Mac Pro - no GPU required!
 """
 
 import os
-import json
 import base64
+import asyncio
+import math
+import random
+import statistics
+import threading
 import numpy as np
-from typing import Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 from dataclasses import dataclass, asdict
-from datetime import datetime
-from openai import OpenAI
-import anthropic
+import providers
+import metrics
+import structured
+import cascade
+from score_cache import content_hash, media_digest
+from score_store import open_store
+from rate_limit import estimate_tokens
+from deadline import DeadlineExceeded, current_deadline, deadline_scope
+from resilience import PROVIDER_TIMEOUT, acall_provider, call_provider
+
+if TYPE_CHECKING:  # the SDKs themselves are imported when a client is first used
+    import anthropic
+    from openai import AsyncOpenAI
 
 # ============================================================================
 # CONFIGURATION - YOUR API KEYS
@@ -35,6 +49,30 @@ GPT_MODEL = "gpt-5.1"  # Latest GPT (your API has access!)
 CLAUDE_MODEL = "claude-4-opus-20250514"  # Latest Claude (your API has access!)
 GEMINI_MODEL = "gemini-2.0-flash-exp"  # Latest Gemini (need your key)
 
+# Part of every score-store key; bump when a scoring prompt changes
+PROMPT_VERSION = "agent-2025-11-21"
+
+# Sent as each provider's structured-output format (STRUCTURED_OUTPUT=0: asked for in the prompt only)
+SCORE_SCHEMA = structured.Schema('virality_score', 'Record the virality scores for the post', structured.score_spec(
+    structured.SCORE_FIELDS + ('platform_optimization', 'confidence')))
+SCORE_SCHEMA_FAST = structured.Schema('virality_score', 'Record the virality scores for the post', structured.score_spec(
+    structured.SCORE_FIELDS + ('platform_optimization', 'confidence'), reasoning=False))
+PAIR_SCHEMA = structured.Schema('pair_comparison', "Record both posts' scores and the winner", structured.obj({
+    'post_1': SCORE_SCHEMA.spec, 'post_2': SCORE_SCHEMA.spec,
+    'winner': {'type': 'integer', 'description': '1 or 2'},
+}))
+
+# score_ensemble(fast=True): the reply format asked for instead (scores only, FAST_MAX_TOKENS output)
+FAST_ASK = ("Provide JSON with integer scores only (0-100 each), no reasoning: overall_score, text_quality, "
+            "visual_appeal, emotional_resonance, clarity, brand_alignment, platform_optimization, confidence.")
+
+# Adaptive A/B mode: stop once P(winner) reaches this
+AB_STOP_PROBABILITY = float(os.getenv('AB_STOP_PROBABILITY', '0.95'))
+# rank_variants: most leaders refined with pairwise comparisons
+RANK_MAX_FINALISTS = int(os.getenv('RANK_MAX_FINALISTS', '4'))
+# Typical spread (points) between models scoring the same post; floor for the posterior's noise
+MODEL_NOISE_SD = float(os.getenv('MODEL_NOISE_SD', '8'))
+
 # ============================================================================
 # DATA STRUCTURES
 # ============================================================================
@@ -65,6 +103,7 @@ class ViralityScore:
     reasoning: str
     confidence: float
     model_used: str
+    partial: bool = False  # ensemble built without every model (deadline hit)
 
 @dataclass
 class ABPrediction:
@@ -75,6 +114,37 @@ class ABPrediction:
     reasoning: str
     variant_a_score: ViralityScore
     variant_b_score: ViralityScore
+    calls_made: int = 0  # provider scoring calls used (store hits included)
+    calls_saved: int = 0  # calls skipped vs. scoring both variants with every model
+
+@dataclass
+class RankingResult:
+    """N-variant ranking, best first"""
+    ranking: List[str]  # variant ids
+    scores: Dict[str, ViralityScore]  # ensemble score per variant id
+    confidence: List[float]  # P(rank i truly beats rank i+1), 0-100; one shorter than ranking
+    finalists: List[str]  # leaders that were close enough to be compared pairwise
+    calls_made: int
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def run_sync(coro):
+    """Run coro to completion on the agent's event loop, from sync code.
+
+    One loop thread per process serves every sync wrapper, so the async SDK
+    clients and their connection pools outlive a single call. The caller's
+    context (deadline, trace) goes with the coroutine.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='agent-loop', daemon=True).start()
+    if threading.current_thread().name == 'agent-loop':
+        raise RuntimeError("run_sync() cannot be called from the agent's own event loop")
+    return asyncio.run_coroutine_threadsafe(coro, _loop).result()
 
 # ============================================================================
 # MULTIMODAL SCORING AGENT (November 2025)
@@ -83,64 +153,96 @@ class ABPrediction:
 class MultimodalScoringAgent:
     """
     Scores content using November 2025 multimodal models.
+
+    Every scorer has a sync and an async (``a``-prefixed) form. The async
+    ensemble sends all model calls at once; the sync methods are thin
+    wrappers (run_sync) so existing callers keep working.
     """
     
     def __init__(self):
         # Initialize clients
-        self.openai_client = OpenAI(api_key=OPENAI_API_KEY)
-        self.claude_client = anthropic.Anthropic(api_key=CLAUDE_API_KEY)
+        self.openai_client = providers.lazy(providers.openai_client, OPENAI_API_KEY, timeout=PROVIDER_TIMEOUT, max_retries=0)
+        self.claude_client = providers.lazy(providers.anthropic_client, CLAUDE_API_KEY, timeout=PROVIDER_TIMEOUT, max_retries=0)
+        self._async_clients = None  # (loop, AsyncOpenAI, AsyncAnthropic)
+        self.store = open_store()  # persistent scores shared with the web app workers
         
         self.has_gemini = False
-        if GOOGLE_API_KEY:
-            try:
-                import google.generativeai as genai
-                genai.configure(api_key=GOOGLE_API_KEY)
-                self.gemini_model = genai.GenerativeModel(GEMINI_MODEL)
-                self.has_gemini = True
-                print("✓ Gemini 2.0 Flash initialized")
-            except:
-                pass
+        if GOOGLE_API_KEY or providers.MOCK:
+            self.gemini_model = providers.lazy(providers.gemini_model, GOOGLE_API_KEY, GEMINI_MODEL)
+            self.has_gemini = True
+            print("✓ Gemini 2.0 Flash initialized")
         
         print(f"✓ GPT-5.1 initialized")
         print(f"✓ Claude 4 Opus initialized")
     
+    def _aclients(self) -> Tuple['AsyncOpenAI', 'anthropic.AsyncAnthropic']:
+        """Async clients bound to the running event loop.
+
+        httpx async connection pools cannot be shared across event loops. The
+        sync wrappers all run on one loop (run_sync), so the clients are built
+        once; they are rebuilt only for a caller that brings its own loop.
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_clients is None or self._async_clients[0] is not loop:
+            self._async_clients = (
+                loop,
+                providers.async_openai_client(OPENAI_API_KEY, timeout=PROVIDER_TIMEOUT, max_retries=0),
+                providers.async_anthropic_client(CLAUDE_API_KEY, timeout=PROVIDER_TIMEOUT, max_retries=0),
+            )
+        return self._async_clients[1], self._async_clients[2]
+    
     def _encode_image(self, image_path: str) -> str:
         """Encode image to base64"""
         with open(image_path, 'rb') as f:
-            return base64.b64encode(f.read()).decode('utf-8')
+            data = base64.b64encode(f.read()).decode('utf-8')
+        metrics.PAYLOAD_BYTES.set(len(data), kind='agent_image')
+        return data
     
-    def _parse_json_response(self, text: str, model_name: str) -> ViralityScore:
-        """Parse JSON from model response"""
-        import re
-        
-        # Extract JSON
-        json_match = re.search(r'```json\s*(.*?)\s*```', text, re.DOTALL)
-        if json_match:
-            text = json_match.group(1)
-        elif '{' in text:
-            start = text.find('{')
-            end = text.rfind('}') + 1
-            text = text[start:end]
-        
+    def _parse_json_response(self, reply, model_name: str, schema=SCORE_SCHEMA) -> ViralityScore:
+        """Validate a model reply (JSON text or Claude tool input) into a score"""
         try:
-            data = json.loads(text)
-            return ViralityScore(
-                overall_score=float(data.get('overall_score', 50)),
-                text_quality=float(data.get('text_quality', 50)),
-                visual_appeal=float(data.get('visual_appeal', 50)),
-                emotional_resonance=float(data.get('emotional_resonance', 50)),
-                clarity=float(data.get('clarity', 50)),
-                brand_alignment=float(data.get('brand_alignment', 50)),
-                platform_optimization=float(data.get('platform_optimization', 50)),
-                reasoning=data.get('reasoning', ''),
-                confidence=float(data.get('confidence', 50)),
-                model_used=model_name
-            )
+            with metrics.STAGE_SECONDS.time(stage='parse_json'):
+                return self._score_from_dict(structured.parse(reply, schema, model_name), model_name)
         except Exception as e:
+            metrics.STAGE_ERRORS.inc(stage='parse_json')
             return ViralityScore(50, 50, 50, 50, 50, 50, 50, f"Parse error: {e}", 30, model_name)
     
-    def score_with_gpt51(self, variant: ContentVariant, context: Dict) -> ViralityScore:
-        """Score using GPT-5.1 (November 2025)"""
+    def _score_from_dict(self, data: Dict, model_name: str) -> ViralityScore:
+        return ViralityScore(
+            overall_score=float(data.get('overall_score', 50)),
+            text_quality=float(data.get('text_quality', 50)),
+            visual_appeal=float(data.get('visual_appeal', 50)),
+            emotional_resonance=float(data.get('emotional_resonance', 50)),
+            clarity=float(data.get('clarity', 50)),
+            brand_alignment=float(data.get('brand_alignment', 50)),
+            platform_optimization=float(data.get('platform_optimization', 50)),
+            reasoning=data.get('reasoning', ''),
+            confidence=float(data.get('confidence', 50)),
+            model_used=model_name
+        )
+    
+    def _parse_pair_response(self, reply, model_name: str) -> Tuple[ViralityScore, ViralityScore, int]:
+        """Parse a pairwise answer into (post 1 score, post 2 score, winner 1|2, 0 if unknown)"""
+        try:
+            with metrics.STAGE_SECONDS.time(stage='parse_json'):
+                data = structured.parse(reply, PAIR_SCHEMA, model_name)
+                first = self._score_from_dict(data['post_1'], model_name)
+                second = self._score_from_dict(data['post_2'], model_name)
+                winner = int(data.get('winner', 0))
+            return first, second, winner if winner in (1, 2) else 0
+        except Exception as e:
+            metrics.STAGE_ERRORS.inc(stage='parse_json')
+            error = ViralityScore(50, 50, 50, 50, 50, 50, 50, f"Parse error: {e}", 30, model_name)
+            return error, error, 0
+    
+    def _estimate(self, variant: ContentVariant, max_output: int) -> int:
+        """Token estimate for the shared per-provider rate limiter"""
+        has_image = bool(variant.image_path and os.path.exists(variant.image_path))
+        return estimate_tokens(variant.text, int(has_image), max_output) + 100  # + prompt template
+    
+    def _gpt_messages(self, variant: ContentVariant, context: Dict, fast: bool = False) -> List[Dict]:
+        """Build the GPT-5.1 chat messages for a variant"""
+        ask = FAST_ASK if fast else "Provide JSON with scores (0-100): overall_score, text_quality, visual_appeal, emotional_resonance, clarity, brand_alignment, platform_optimization, reasoning, confidence."
         messages = [{
             "role": "system",
             "content": "You are an expert marketing analyst. Provide virality scores as JSON."
@@ -152,7 +254,7 @@ class MultimodalScoringAgent:
 
 Text: {variant.text}
 
-Provide JSON with scores (0-100): overall_score, text_quality, visual_appeal, emotional_resonance, clarity, brand_alignment, platform_optimization, reasoning, confidence."""
+{ask}"""
         }]
         
         # Add image if available
@@ -163,28 +265,18 @@ Provide JSON with scores (0-100): overall_score, text_quality, visual_appeal, em
             })
         
         messages.append({"role": "user", "content": user_content})
-        
-        try:
-            response = self.openai_client.chat.completions.create(
-                model=GPT_MODEL,
-                messages=messages,
-                max_completion_tokens=1000,  # GPT-5 uses this parameter!
-                temperature=0.2
-            )
-            return self._parse_json_response(response.choices[0].message.content, "GPT-5.1")
-        except Exception as e:
-            print(f"GPT-5.1 error: {e}")
-            return ViralityScore(50, 50, 50, 50, 50, 50, 50, str(e), 20, "GPT-5.1-ERROR")
+        return messages
     
-    def score_with_claude4(self, variant: ContentVariant, context: Dict) -> ViralityScore:
-        """Score using Claude 4 Opus (May 2025 version)"""
+    def _claude_content(self, variant: ContentVariant, context: Dict, fast: bool = False) -> List[Dict]:
+        """Build the Claude 4 content blocks for a variant"""
+        ask = FAST_ASK if fast else "Provide JSON with scores (0-100 each): overall_score, text_quality, visual_appeal, emotional_resonance, clarity, brand_alignment, platform_optimization, reasoning (string), confidence."
         content_blocks = [{
             "type": "text",
             "text": f"""Analyze this {context['business_category']} content for {context['target_audience']}.
 
 Text: {variant.text}
 
-Provide JSON with scores (0-100 each): overall_score, text_quality, visual_appeal, emotional_resonance, clarity, brand_alignment, platform_optimization, reasoning (string), confidence."""
+{ask}"""
         }]
         
         # Add image if available
@@ -197,41 +289,274 @@ Provide JSON with scores (0-100 each): overall_score, text_quality, visual_appea
                     "data": self._encode_image(variant.image_path)
                 }
             })
+        return content_blocks
+    
+    def _gemini_parts(self, variant: ContentVariant, context: Dict, fast: bool = False) -> List:
+        """Build the Gemini prompt parts for a variant"""
+        ask = FAST_ASK if fast else "Provide JSON with scores (0-100 each): overall_score, text_quality, visual_appeal, emotional_resonance, clarity, brand_alignment, platform_optimization, reasoning (string), confidence."
+        parts = [f"""Analyze this {context['business_category']} content for {context['target_audience']}.
+
+Text: {variant.text}
+
+{ask}"""]
         
+        # Add image if available
+        if variant.image_path and os.path.exists(variant.image_path):
+            with open(variant.image_path, 'rb') as f:
+                parts.append({"mime_type": "image/jpeg", "data": f.read()})
+        return parts
+    
+    def _pair_parts(self, first: ContentVariant, second: ContentVariant, context: Dict, provider: str) -> List:
+        """One prompt holding both variants (text and image), in the given provider's part format"""
+        def text(t):
+            return t if provider == 'gemini' else {"type": "text", "text": t}
+        
+        parts = [text(f"Compare these two {context['business_category']} posts for {context['target_audience']}. "
+                      "Score each one on its own merits, on the same scale, then pick the one likely to perform better.")]
+        for n, variant in ((1, first), (2, second)):
+            parts.append(text(f"POST {n}\nText: {variant.text}"))
+            if variant.image_path and os.path.exists(variant.image_path):
+                if provider == 'openai':
+                    parts.append({"type": "image_url",
+                                  "image_url": {"url": f"data:image/jpeg;base64,{self._encode_image(variant.image_path)}"}})
+                elif provider == 'anthropic':
+                    parts.append({"type": "image", "source": {"type": "base64", "media_type": "image/jpeg",
+                                                              "data": self._encode_image(variant.image_path)}})
+                else:
+                    with open(variant.image_path, 'rb') as f:
+                        parts.append({"mime_type": "image/jpeg", "data": f.read()})
+        parts.append(text("""Provide JSON: {"post_1": {...}, "post_2": {...}, "winner": 1 or 2}, where each post has scores (0-100 each): overall_score, text_quality, visual_appeal, emotional_resonance, clarity, brand_alignment, platform_optimization, reasoning (string), confidence."""))
+        return parts
+    
+    async def ascore_pair(self, model: str, first: ContentVariant, second: ContentVariant,
+                          context: Dict) -> Tuple[ViralityScore, ViralityScore, int]:
+        """Score two variants with one call to `model`; returns (first score, second score, winner 1|2 or 0)"""
+        label = {GPT_MODEL: "GPT-5.1", CLAUDE_MODEL: "Claude-4-Opus", GEMINI_MODEL: "Gemini-2.0-Flash"}[model]
+        tokens = self._estimate(first, 0) + self._estimate(second, 1500)
+        try:
+            if model == GPT_MODEL:
+                openai_client, _ = self._aclients()
+                response = await acall_provider(
+                    'openai', tokens, openai_client.chat.completions.create,
+                    model=GPT_MODEL,
+                    messages=[
+                        {"role": "system", "content": "You are an expert marketing analyst. Provide virality scores as JSON."},
+                        {"role": "user", "content": self._pair_parts(first, second, context, 'openai')}
+                    ],
+                    max_completion_tokens=1500,
+                    temperature=0.2,
+                    **structured.openai_kwargs(PAIR_SCHEMA)
+                )
+                text = response.choices[0].message.content
+            elif model == CLAUDE_MODEL:
+                _, claude_client = self._aclients()
+                response = await acall_provider(
+                    'anthropic', tokens, claude_client.messages.create,
+                    model=CLAUDE_MODEL,
+                    max_tokens=1500,
+                    temperature=0.2,
+                    messages=[{"role": "user", "content": self._pair_parts(first, second, context, 'anthropic')}],
+                    **structured.anthropic_kwargs(PAIR_SCHEMA)
+                )
+                text = structured.anthropic_reply(response)
+            else:
+                # blocking SDK in a worker thread, as in ascore_with_gemini
+                response = await asyncio.to_thread(
+                    call_provider, 'gemini', tokens, self.gemini_model.generate_content,
+                    self._pair_parts(first, second, context, 'gemini'),
+                    generation_config=structured.gemini_config(PAIR_SCHEMA, temperature=0.2, max_output_tokens=1500),
+                    request_options={"timeout": PROVIDER_TIMEOUT}
+                )
+                text = response.text
+            return self._parse_pair_response(text, label)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            print(f"{label} pairwise error: {e}")
+            error = ViralityScore(50, 50, 50, 50, 50, 50, 50, str(e), 20, f"{label}-ERROR")
+            return error, error, 0
+    
+    def score_with_gpt51(self, variant: ContentVariant, context: Dict, fast: bool = False) -> ViralityScore:
+        """Score using GPT-5.1 (November 2025)"""
+        messages = self._gpt_messages(variant, context, fast)
+        schema, max_tokens = (SCORE_SCHEMA_FAST, structured.FAST_MAX_TOKENS) if fast else (SCORE_SCHEMA, 1000)
+        try:
+            response = call_provider(
+                'openai', self._estimate(variant, max_tokens), self.openai_client.chat.completions.create,
+                model=GPT_MODEL,
+                messages=messages,
+                max_completion_tokens=max_tokens,  # GPT-5 uses this parameter!
+                temperature=0.2,
+                **structured.openai_kwargs(schema)
+            )
+            return self._parse_json_response(response.choices[0].message.content, "GPT-5.1", schema)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            print(f"GPT-5.1 error: {e}")
+            return ViralityScore(50, 50, 50, 50, 50, 50, 50, str(e), 20, "GPT-5.1-ERROR")
+    
+    def score_with_claude4(self, variant: ContentVariant, context: Dict, fast: bool = False) -> ViralityScore:
+        """Score using Claude 4 Opus (May 2025 version)"""
+        content = self._claude_content(variant, context, fast)
+        schema, max_tokens = (SCORE_SCHEMA_FAST, structured.FAST_MAX_TOKENS) if fast else (SCORE_SCHEMA, 1000)
         try:
-            response = self.claude_client.messages.create(
+            response = call_provider(
+                'anthropic', self._estimate(variant, max_tokens), self.claude_client.messages.create,
                 model=CLAUDE_MODEL,
-                max_tokens=1000,
+                max_tokens=max_tokens,
                 temperature=0.2,
-                messages=[{"role": "user", "content": content_blocks}]
+                messages=[{"role": "user", "content": content}],
+                **structured.anthropic_kwargs(schema)
             )
-            return self._parse_json_response(response.content[0].text, "Claude-4-Opus")
+            return self._parse_json_response(structured.anthropic_reply(response), "Claude-4-Opus", schema)
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             print(f"Claude-4 error: {e}")
             return ViralityScore(50, 50, 50, 50, 50, 50, 50, str(e), 20, "Claude-4-ERROR")
     
-    def score_ensemble(self, variant: ContentVariant, context: Dict) -> ViralityScore:
-        """Ensemble scoring using all available models"""
-        scores = []
-        
-        # GPT-5.1
-        print(f"    → GPT-5.1 scoring...")
-        scores.append(self.score_with_gpt51(variant, context))
-        
-        # Claude 4 Opus
-        print(f"    → Claude 4 Opus scoring...")
-        scores.append(self.score_with_claude4(variant, context))
+    def score_with_gemini(self, variant: ContentVariant, context: Dict, fast: bool = False) -> ViralityScore:
+        """Score using Gemini 2.0 Flash"""
+        parts = self._gemini_parts(variant, context, fast)
+        schema, max_tokens = (SCORE_SCHEMA_FAST, structured.FAST_MAX_TOKENS) if fast else (SCORE_SCHEMA, 1000)
+        try:
+            response = call_provider(
+                'gemini', self._estimate(variant, max_tokens), self.gemini_model.generate_content,
+                parts,
+                generation_config=structured.gemini_config(schema, temperature=0.2, max_output_tokens=max_tokens),
+                request_options={"timeout": PROVIDER_TIMEOUT}
+            )
+            return self._parse_json_response(response.text, "Gemini-2.0-Flash", schema)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            print(f"Gemini error: {e}")
+            return ViralityScore(50, 50, 50, 50, 50, 50, 50, str(e), 20, "Gemini-ERROR")
+    
+    async def ascore_with_gpt51(self, variant: ContentVariant, context: Dict, fast: bool = False) -> ViralityScore:
+        """Async form of score_with_gpt51"""
+        openai_client, _ = self._aclients()
+        messages = self._gpt_messages(variant, context, fast)
+        schema, max_tokens = (SCORE_SCHEMA_FAST, structured.FAST_MAX_TOKENS) if fast else (SCORE_SCHEMA, 1000)
+        try:
+            response = await acall_provider(
+                'openai', self._estimate(variant, max_tokens), openai_client.chat.completions.create,
+                model=GPT_MODEL,
+                messages=messages,
+                max_completion_tokens=max_tokens,
+                temperature=0.2,
+                **structured.openai_kwargs(schema)
+            )
+            return self._parse_json_response(response.choices[0].message.content, "GPT-5.1", schema)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            print(f"GPT-5.1 error: {e}")
+            return ViralityScore(50, 50, 50, 50, 50, 50, 50, str(e), 20, "GPT-5.1-ERROR")
+    
+    async def ascore_with_claude4(self, variant: ContentVariant, context: Dict, fast: bool = False) -> ViralityScore:
+        """Async form of score_with_claude4"""
+        _, claude_client = self._aclients()
+        content = self._claude_content(variant, context, fast)
+        schema, max_tokens = (SCORE_SCHEMA_FAST, structured.FAST_MAX_TOKENS) if fast else (SCORE_SCHEMA, 1000)
+        try:
+            response = await acall_provider(
+                'anthropic', self._estimate(variant, max_tokens), claude_client.messages.create,
+                model=CLAUDE_MODEL,
+                max_tokens=max_tokens,
+                temperature=0.2,
+                messages=[{"role": "user", "content": content}],
+                **structured.anthropic_kwargs(schema)
+            )
+            return self._parse_json_response(structured.anthropic_reply(response), "Claude-4-Opus", schema)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            print(f"Claude-4 error: {e}")
+            return ViralityScore(50, 50, 50, 50, 50, 50, 50, str(e), 20, "Claude-4-ERROR")
+    
+    async def ascore_with_gemini(self, variant: ContentVariant, context: Dict, fast: bool = False) -> ViralityScore:
+        """Async form of score_with_gemini.
+
+        The Gemini SDK's grpc.aio channel is tied to the first loop that uses
+        it, so the blocking call runs in a worker thread instead.
+        """
+        return await asyncio.to_thread(self.score_with_gemini, variant, context, fast)
+    
+    def _content_hash(self, variant: ContentVariant, context: Dict, fast: bool = False) -> str:
+        """Score-store key for a variant in a given context (fast scores apart from full ones)"""
+        image = b''
+        if variant.image_path and os.path.exists(variant.image_path):
+            with open(variant.image_path, 'rb') as f:
+                image = f.read()
+        return content_hash(f"{PROMPT_VERSION}:fast" if fast else PROMPT_VERSION, variant.text, media_digest(image),
+                            context['business_category'], context['target_audience'])
+    
+    async def _ascore_stored(self, model: str, scorer, variant: ContentVariant, context: Dict,
+                             fast: bool = False) -> ViralityScore:
+        """Read-through/write-through the score store around one model call"""
+        if self.store is None:
+            return await scorer(variant, context, fast)
+        chash = self._content_hash(variant, context, fast)
+        try:
+            stored = self.store.get(model, chash)
+            metrics.CACHE_LOOKUPS.inc(cache='agent_store', result='miss' if stored is None else 'hit')
+            if stored is not None:
+                return ViralityScore(**stored)
+        except Exception as e:
+            print(f"Score store read failed: {e}")
         
-        # Gemini (if available)
+        score = await scorer(variant, context, fast)
+        if score.confidence > 30:  # errors and parse failures are retried next time
+            try:
+                self.store.put(model, chash, asdict(score))
+            except Exception as e:
+                print(f"Score store write failed: {e}")
+        return score
+    
+    def _scorers(self) -> List[Tuple[str, str, object]]:
+        """(label, model, async scorer) for every available model"""
+        scorers = [
+            ("GPT-5.1", GPT_MODEL, self.ascore_with_gpt51),
+            ("Claude 4 Opus", CLAUDE_MODEL, self.ascore_with_claude4),
+        ]
         if self.has_gemini:
-            print(f"    → Gemini 2.0 Flash scoring...")
-            # Would add Gemini scoring here
-        
-        # Average scores
+            scorers.append(("Gemini 2.0 Flash", GEMINI_MODEL, self.ascore_with_gemini))
+        return scorers
+    
+    def _cascade_scorer(self) -> Tuple[str, str, object]:
+        """The cheapest, fastest available model: where a cascade starts"""
+        scorers = self._scorers()
+        return scorers[-1] if self.has_gemini else scorers[0]  # Gemini 2.0 Flash, else GPT-5.1
+    
+    def _model_calls(self, variant: ContentVariant, context: Dict, fast: bool = False,
+                     scorers=None) -> List[Tuple[str, object]]:
+        """(label, coroutine) for every available model (or just `scorers`)"""
+        return [(label, self._ascore_stored(model, scorer, variant, context, fast))
+                for label, model, scorer in (self._scorers() if scorers is None else scorers)]
+    
+    async def _await_calls(self, calls: List[Tuple[str, object]], budget) -> Tuple[List[ViralityScore], List[str]]:
+        """(scores, labels that failed or missed the deadline) for concurrent (label, coroutine) calls"""
+        print(f"    → {', '.join(label for label, _ in calls)} scoring...")
+        tasks = {asyncio.ensure_future(coro): label for label, coro in calls}
+        done, pending = await asyncio.wait(tasks, timeout=budget.remaining() if budget else None)
+        for task in pending:
+            task.cancel()
+        scores = [t.result() for t in tasks if t in done and t.exception() is None]
+        missing = [label for t, label in tasks.items() if t not in done or t.exception() is not None]
+        return scores, missing
+    
+    def _combine(self, scores: List[ViralityScore]) -> ViralityScore:
+        """Average model scores into one ensemble score"""
+        if not scores:
+            return ViralityScore(50, 50, 50, 50, 50, 50, 50, "No model answered within the deadline", 20,
+                                 "Ensemble-TIMEOUT", partial=True)
         n = len([s for s in scores if s.confidence > 30])  # Count non-error scores
         if n == 0:
             return scores[0]  # Return first even if error
         
+        models = {"GPT-5.1": "GPT5.1", "Claude-4-Opus": "Claude4", "Gemini-2.0-Flash": "Gemini2.0"}
         ensemble = ViralityScore(
             overall_score=np.mean([s.overall_score for s in scores]),
             text_quality=np.mean([s.text_quality for s in scores]),
@@ -242,11 +567,65 @@ Provide JSON with scores (0-100 each): overall_score, text_quality, visual_appea
             platform_optimization=np.mean([s.platform_optimization for s in scores]),
             reasoning=f"Ensemble of {n} models. " + scores[0].reasoning[:150],
             confidence=np.mean([s.confidence for s in scores]),
-            model_used=f"Ensemble-GPT5.1-Claude4"
+            model_used="Ensemble-" + "-".join(models.get(s.model_used, s.model_used) for s in scores)
         )
         
         print(f"    ✓ Ensemble Score: {ensemble.overall_score:.1f}/100")
         return ensemble
+    
+    async def ascore_ensemble(self, variant: ContentVariant, context: Dict, deadline=None,
+                              fast: bool = False, cascade_policy=None) -> ViralityScore:
+        """Ensemble scoring with every available model queried concurrently.
+
+        deadline (seconds, default ANALYZE_DEADLINE) caps the wait: models that
+        have not answered by then are cancelled and the ensemble of the rest
+        comes back with partial=True. fast=True asks for integer scores only
+        (no reasoning) for cheap, high-volume scoring. With a cascade_policy
+        (cascade.Policy) the cheapest model scores alone first, and the others
+        are only called when the policy escalates.
+        """
+        with metrics.stage('ensemble'), deadline_scope(deadline) as budget:
+            if cascade_policy is None:
+                scores, missing = await self._await_calls(self._model_calls(variant, context, fast), budget)
+            else:
+                first = self._cascade_scorer()
+                scores, missing = await self._await_calls(self._model_calls(variant, context, fast, [first]), budget)
+                answer = scores[0] if scores and scores[0].confidence > 30 else None
+                reason = cascade_policy.reason(answer.overall_score if answer else 0,
+                                               answer.confidence if answer else None)
+                cascade.record('score', reason)
+                if reason is None:
+                    print(f"    ✓ Cascade settled on {first[0]} (confidence {answer.confidence:.0f})")
+                else:
+                    print(f"    ↑ Cascade escalating ({reason})")
+                    rest = [s for s in self._scorers() if s[1] != first[1]]
+                    more, late = await self._await_calls(self._model_calls(variant, context, fast, rest), budget)
+                    scores, missing = scores + more, missing + late
+        
+        if missing:
+            print(f"    ⏱ Deadline reached, missing: {', '.join(missing)}")
+        ensemble = self._combine(scores)
+        ensemble.partial = ensemble.partial or bool(missing)
+        return ensemble
+    
+    def score_ensemble(self, variant: ContentVariant, context: Dict, deadline=None, fast: bool = False,
+                       cascade_policy=None) -> ViralityScore:
+        """Ensemble scoring using all available models (or a cascade, see ascore_ensemble)"""
+        return run_sync(self.ascore_ensemble(variant, context, deadline, fast, cascade_policy))
+
+def win_probability(diffs: List[float], noise_sd: float = MODEL_NOISE_SD) -> float:
+    """P(A truly beats B) from per-model score differences (A - B).
+
+    Normal approximation: the true difference is estimated by mean(diffs)
+    with standard error sd / sqrt(n), where sd is the models' spread but never
+    below noise_sd, so one or two agreeing models can't look certain.
+    """
+    if not diffs:
+        return 0.5
+    n = len(diffs)
+    sd = max(noise_sd, statistics.stdev(diffs)) if n > 1 else noise_sd
+    z = statistics.fmean(diffs) / (sd / math.sqrt(n))
+    return 0.5 * (1 + math.erf(z / math.sqrt(2)))
 
 # ============================================================================
 # COMPLETE SYSTEM
@@ -259,17 +638,33 @@ class MultimodalAgenticABSystem:
         print("\n" + "="*80)
         print("Multimodal Agentic System - November 21, 2025")
         print("="*80)
-        print(f"Models: GPT-5.1 + Claude 4 Opus")
+        print(f"Models: GPT-5.1 + Claude 4 Opus" + (" + Gemini 2.0 Flash" if GOOGLE_API_KEY else ""))
         
         self.scoring_agent = MultimodalScoringAgent()
+        self.rng = random.Random()  # pairwise order; seed it for reproducible runs
+        self.position_wins = {1: 0, 2: 0}  # pairwise winners by prompt position, to watch for bias
         print("\n✅ System initialized!")
     
-    def predict_ab_winner(self,
-                          variant_a: ContentVariant,
-                          variant_b: ContentVariant,
-                          target_audience: str,
-                          business_category: str) -> ABPrediction:
-        """Predict which variant wins A/B test"""
+    async def apredict_ab_winner(self,
+                                 variant_a: ContentVariant,
+                                 variant_b: ContentVariant,
+                                 target_audience: str,
+                                 business_category: str,
+                                 deadline=None,
+                                 mode: str = 'ensemble',
+                                 stop_at: float = AB_STOP_PROBABILITY,
+                                 cascade_policy=None) -> ABPrediction:
+        """Predict which variant wins A/B test, scoring both variants concurrently
+
+        Both ensembles share one deadline (seconds, default ANALYZE_DEADLINE).
+        mode='adaptive' asks one model at a time and stops once the winner's
+        posterior probability reaches stop_at (see _apredict_adaptive).
+        mode='pairwise' sends both variants to each model in one prompt, in a
+        random order, halving the calls (see _apredict_pairwise).
+        mode='cascade' scores both with the cheapest model and calls the rest
+        only when cascade_policy (default cascade.POLICY) escalates (see
+        _apredict_cascade).
+        """
         
         context = {
             'target_audience': target_audience,
@@ -278,17 +673,297 @@ class MultimodalAgenticABSystem:
         
         print(f"\n📊 A/B Test: {variant_a.id} vs {variant_b.id}")
         
-        # Score both variants
-        print(f"\n[1/2] Scoring Variant A: {variant_a.id}")
-        score_a = self.scoring_agent.score_ensemble(variant_a, context)
+        if mode == 'adaptive':
+            with deadline_scope(deadline):
+                return await self._apredict_adaptive(variant_a, variant_b, context, stop_at)
+        if mode == 'pairwise':
+            with deadline_scope(deadline):
+                return await self._apredict_pairwise(variant_a, variant_b, context)
+        if mode == 'cascade':
+            with deadline_scope(deadline):
+                return await self._apredict_cascade(variant_a, variant_b, context, cascade_policy or cascade.POLICY)
+        if mode != 'ensemble':
+            raise ValueError(f"unknown mode: {mode}")
+        
+        # Score both variants (every variant x model call in flight at once)
+        print(f"\nScoring Variant A: {variant_a.id} and Variant B: {variant_b.id}")
+        with deadline_scope(deadline):
+            score_a, score_b = await asyncio.gather(
+                self.scoring_agent.ascore_ensemble(variant_a, context),
+                self.scoring_agent.ascore_ensemble(variant_b, context)
+            )
+        prediction = self._build_prediction(variant_a, variant_b, score_a, score_b)
+        prediction.calls_made = 2 * len(self.scoring_agent._scorers())
+        return prediction
+    
+    async def _apredict_adaptive(self,
+                                 variant_a: ContentVariant,
+                                 variant_b: ContentVariant,
+                                 context: Dict,
+                                 stop_at: float) -> ABPrediction:
+        """Query models round by round (one model on both variants per round) until decided"""
+        agent = self.scoring_agent
+        scorers = agent._scorers()
+        scores_a, scores_b, diffs = [], [], []
+        p_a = 0.5
+        for label, model, scorer in scorers:
+            print(f"\nRound {len(scores_a) + 1}: {label} on both variants")
+            try:
+                a, b = await asyncio.gather(
+                    agent._ascore_stored(model, scorer, variant_a, context),
+                    agent._ascore_stored(model, scorer, variant_b, context)
+                )
+            except DeadlineExceeded:
+                print("    ⏱ Deadline reached, deciding on the rounds so far")
+                break
+            scores_a.append(a)
+            scores_b.append(b)
+            if a.confidence > 30 and b.confidence > 30:  # error scores carry no signal
+                diffs.append(a.overall_score - b.overall_score)
+            p_a = win_probability(diffs)
+            print(f"    P(A wins) = {p_a:.3f}")
+            if max(p_a, 1 - p_a) >= stop_at:
+                break
+        
+        prediction = self._build_prediction(variant_a, variant_b,
+                                            agent._combine(scores_a), agent._combine(scores_b), p_a)
+        prediction.calls_made = 2 * len(scores_a)
+        prediction.calls_saved = 2 * len(scorers) - prediction.calls_made
+        print(f"    Adaptive: {prediction.calls_made} calls made, {prediction.calls_saved} saved")
+        return prediction
+    
+    async def _apredict_cascade(self,
+                                variant_a: ContentVariant,
+                                variant_b: ContentVariant,
+                                context: Dict,
+                                policy) -> ABPrediction:
+        """Cheapest model on both variants; the other models (all at once) only if the policy escalates"""
+        agent = self.scoring_agent
+        scorers = agent._scorers()
+        label, model, scorer = agent._cascade_scorer()
+        print(f"\nCascade: {label} on both variants")
+        scores_a, scores_b, reason = [], [], None
+        try:
+            a, b = await asyncio.gather(
+                agent._ascore_stored(model, scorer, variant_a, context),
+                agent._ascore_stored(model, scorer, variant_b, context)
+            )
+        except DeadlineExceeded:
+            print("    ⏱ Deadline reached before the first model answered")
+        else:
+            scores_a, scores_b = [a], [b]
+            reason = policy.ab_reason(a.overall_score, a.confidence if a.confidence > 30 else None,
+                                      b.overall_score, b.confidence if b.confidence > 30 else None)
+            cascade.record('ab', reason)
+        
+        if reason is not None:
+            rest = [s for s in scorers if s[1] != model]
+            print(f"    ↑ Escalating ({reason}): {', '.join(l for l, _, _ in rest)} on both variants")
+            results = await asyncio.gather(*(
+                asyncio.gather(agent._ascore_stored(m, sc, variant_a, context),
+                               agent._ascore_stored(m, sc, variant_b, context))
+                for _, m, sc in rest
+            ), return_exceptions=True)
+            answered = [r for r in results if not isinstance(r, BaseException)]
+            if len(answered) < len(results):
+                print("    ⏱ Deadline reached, deciding on the models that answered")
+            scores_a += [x for x, _ in answered]
+            scores_b += [y for _, y in answered]
+        
+        diffs = [x.overall_score - y.overall_score for x, y in zip(scores_a, scores_b)
+                 if x.confidence > 30 and y.confidence > 30]
+        prediction = self._build_prediction(variant_a, variant_b,
+                                            agent._combine(scores_a), agent._combine(scores_b), win_probability(diffs))
+        prediction.calls_made = 2 * len(scores_a)
+        prediction.calls_saved = 2 * len(scorers) - prediction.calls_made
+        print(f"    Cascade: {prediction.calls_made} calls made, {prediction.calls_saved} saved")
+        return prediction
+    
+    async def _apredict_pairwise(self,
+                                 variant_a: ContentVariant,
+                                 variant_b: ContentVariant,
+                                 context: Dict) -> ABPrediction:
+        """Every model scores A and B side by side in one call; the order is randomized per call.
+
+        The models' winner votes decide; the score differences settle a split
+        (or missing) vote and give the confidence.
+        """
+        agent = self.scoring_agent
+        
+        async def compare(model):
+            swap = self.rng.random() < 0.5  # position bias averages out across calls
+            first, second = (variant_b, variant_a) if swap else (variant_a, variant_b)
+            score_1, score_2, winner = await agent.ascore_pair(model, first, second, context)
+            if winner:
+                self.position_wins[winner] += 1
+            if swap:
+                return score_2, score_1, {1: 'B', 2: 'A'}.get(winner)
+            return score_1, score_2, {1: 'A', 2: 'B'}.get(winner)
+        
+        scorers = agent._scorers()
+        print(f"\nPairwise: {', '.join(label for label, _, _ in scorers)} comparing A and B...")
+        results = await asyncio.gather(*(compare(model) for _, model, _ in scorers), return_exceptions=True)
+        answered = [r for r in results if not isinstance(r, BaseException)]
+        if len(answered) < len(results):
+            print("    ⏱ Deadline reached, deciding on the models that answered")
+        
+        scores_a = [a for a, _, _ in answered]
+        scores_b = [b for _, b, _ in answered]
+        diffs = [a.overall_score - b.overall_score for a, b, _ in answered if a.confidence > 30 and b.confidence > 30]
+        votes = [v for _, _, v in answered if v]
+        print(f"    Votes: A={votes.count('A')} B={votes.count('B')}")
+        
+        prediction = self._build_prediction(variant_a, variant_b, agent._combine(scores_a), agent._combine(scores_b),
+                                            win_probability(diffs), votes)
+        prediction.calls_made = len(results)
+        prediction.calls_saved = 2 * len(scorers) - len(results)
+        return prediction
+    
+    async def arank_variants(self,
+                             variants: List[ContentVariant],
+                             target_audience: str,
+                             business_category: str,
+                             deadline=None,
+                             max_finalists: int = RANK_MAX_FINALISTS,
+                             stop_at: float = AB_STOP_PROBABILITY) -> RankingResult:
+        """Rank N variants with calls growing linearly in N.
+
+        1. Every variant is scored once by every model (N x models calls).
+        2. Leaders that the leader does not beat with P >= stop_at (at most
+           max_finalists) go through successive halving: adjacent pairs are
+           compared pairwise, winners advance, until one is left.
+        The last one standing ranks first; the other finalists follow by
+        ensemble score, except that a direct pairwise verdict between two of
+        them wins. Everyone else follows by ensemble score.
+        Raises ValueError for an empty list or repeated variant ids.
+        """
+        if not variants:
+            raise ValueError("rank_variants needs at least one variant")
+        ids = [v.id for v in variants]
+        repeated = sorted({vid for vid in ids if ids.count(vid) > 1})
+        if repeated:
+            raise ValueError(f"variant ids must be unique, repeated: {', '.join(map(str, repeated))}")
+        context = {
+            'target_audience': target_audience,
+            'business_category': business_category
+        }
+        agent = self.scoring_agent
+        print(f"\n🏁 Ranking {len(variants)} variants")
+        
+        with deadline_scope(deadline):
+            per_variant = await asyncio.gather(*(
+                asyncio.gather(*(coro for _, coro in agent._model_calls(v, context)), return_exceptions=True)
+                for v in variants
+            ))
+            model_scores = {}  # variant id -> {model: overall score}, errors left out
+            scores = {}
+            for v, results in zip(variants, per_variant):
+                answered = [r for r in results if isinstance(r, ViralityScore)]
+                model_scores[v.id] = {r.model_used: r.overall_score for r in answered if r.confidence > 30}
+                scores[v.id] = agent._combine(answered)
+            calls = sum(len(r) for r in per_variant)
+            
+            def p_beats(x, y):
+                return win_probability([model_scores[x][m] - model_scores[y][m]
+                                        for m in model_scores[x] if m in model_scores[y]])
+            
+            ranked = sorted((v.id for v in variants), key=lambda vid: scores[vid].overall_score, reverse=True)
+            finalists = [ranked[0]] + [vid for vid in ranked[1:] if p_beats(ranked[0], vid) < stop_at]
+            finalists = finalists[:max(1, max_finalists)]
+            print(f"    Finalists: {', '.join(finalists)}")
+            
+            by_id = {v.id: v for v in variants}
+            pair_p = {}  # (winner, loser) -> P(winner beats loser) from a pairwise call
+            pool = finalists
+            while len(pool) > 1:
+                budget = current_deadline()
+                if budget is not None and budget.expired():
+                    print("    ⏱ Deadline reached, keeping the ensemble order for the rest")
+                    break
+                pairs = list(zip(pool[0::2], pool[1::2]))
+                predictions = await asyncio.gather(*(
+                    self._apredict_pairwise(by_id[a], by_id[b], context) for a, b in pairs
+                ))
+                winners = []
+                for (a, b), prediction in zip(pairs, predictions):
+                    calls += prediction.calls_made
+                    winner, loser = (a, b) if prediction.winner == 'A' else (b, a)
+                    pair_p[(winner, loser)] = prediction.confidence / 100
+                    winners.append(winner)
+                if len(pool) % 2:
+                    winners.append(pool[-1])  # bye
+                pool = winners
+        
+        rest = [vid for vid in finalists if vid != pool[0]]  # already in ensemble order
+        for _ in range(len(rest)):
+            for i in range(len(rest) - 1):
+                if (rest[i + 1], rest[i]) in pair_p:
+                    rest[i], rest[i + 1] = rest[i + 1], rest[i]
+        ranking = [pool[0]] + rest + [vid for vid in ranked if vid not in finalists]
+        confidence = []
+        for x, y in zip(ranking, ranking[1:]):
+            if (x, y) in pair_p:
+                p = pair_p[(x, y)]
+            elif (y, x) in pair_p:
+                p = 1 - pair_p[(y, x)]
+            else:
+                p = p_beats(x, y)
+            confidence.append(round(100 * p, 1))
         
-        print(f"\n[2/2] Scoring Variant B: {variant_b.id}")
-        score_b = self.scoring_agent.score_ensemble(variant_b, context)
+        print(f"    Ranking: {' > '.join(ranking)} ({calls} calls)")
+        return RankingResult(ranking=ranking, scores=scores, confidence=confidence,
+                             finalists=finalists, calls_made=calls)
+    
+    def rank_variants(self,
+                      variants: List[ContentVariant],
+                      target_audience: str,
+                      business_category: str,
+                      deadline=None,
+                      max_finalists: int = RANK_MAX_FINALISTS,
+                      stop_at: float = AB_STOP_PROBABILITY) -> RankingResult:
+        """Rank N variants, best first (see arank_variants)"""
+        return run_sync(self.arank_variants(variants, target_audience, business_category,
+                                            deadline, max_finalists, stop_at))
+    
+    def predict_ab_winner(self,
+                          variant_a: ContentVariant,
+                          variant_b: ContentVariant,
+                          target_audience: str,
+                          business_category: str,
+                          deadline=None,
+                          mode: str = 'ensemble',
+                          stop_at: float = AB_STOP_PROBABILITY,
+                          cascade_policy=None) -> ABPrediction:
+        """Predict which variant wins A/B test"""
+        return run_sync(self.apredict_ab_winner(variant_a, variant_b, target_audience, business_category,
+                                                deadline, mode, stop_at, cascade_policy))
+    
+    def _build_prediction(self,
+                          variant_a: ContentVariant,
+                          variant_b: ContentVariant,
+                          score_a: ViralityScore,
+                          score_b: ViralityScore,
+                          p_a: Optional[float] = None,
+                          votes: Optional[List[str]] = None) -> ABPrediction:
+        """Turn two ensemble scores into an A/B prediction; p_a = P(A wins) when known.
+
+        votes ('A'/'B' per model, pairwise mode) pick the winner by majority;
+        the scores decide when there are none or they split evenly.
+        """
         
         # Determine winner
-        winner = 'A' if score_a.overall_score > score_b.overall_score else 'B'
+        votes = votes or []
+        votes_a, votes_b = votes.count('A'), votes.count('B')
+        if votes_a != votes_b:
+            winner = 'A' if votes_a > votes_b else 'B'
+        else:
+            winner = 'A' if score_a.overall_score > score_b.overall_score else 'B'
         score_diff = abs(score_a.overall_score - score_b.overall_score)
-        confidence = min(50 + score_diff * 0.8, 95)
+        if p_a is None:
+            confidence = min(50 + score_diff * 0.8, 95)
+        else:
+            confidence = min(100 * (p_a if winner == 'A' else 1 - p_a), 99)
+        vote_line = f"\n🗳 Model votes: A={votes_a} B={votes_b}" if votes else ''
         
         reasoning = f"""
 🏆 WINNER: Variant {winner} (Confidence: {confidence:.1f}%)
@@ -307,7 +982,7 @@ class MultimodalAgenticABSystem:
    • Emotional Resonance: {score_b.emotional_resonance:.1f}
    • Clarity: {score_b.clarity:.1f}
 
-📈 Score Difference: {score_diff:.1f} points
+📈 Score Difference: {score_diff:.1f} points{vote_line}
 
 💡 Reasoning: {score_a.reasoning if winner=='A' else score_b.reasoning}
 """
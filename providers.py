@@ -0,0 +1,125 @@
+"""
+Provider client factories
+
+Every OpenAI, Anthropic and Gemini client in the apps and in
+MultimodalScoringAgent is built here, so PROVIDER_BACKEND picks where calls go:
+
+- live (default): the real SDKs
+- mock: the offline stand-ins in mock_providers.py (sampled latency, injected
+  errors/429s, deterministic JSON), for benchmarks and load tests without keys
+
+The SDKs take seconds to import, so module-level clients are wrapped in
+lazy(): the SDK is imported and the client built on first use (or by the
+warm-up in warmup.py), not when the app is imported. Live OpenAI and
+Anthropic clients share one pooled HTTP transport per provider (transport.py).
+"""
+
+import os
+import threading
+
+import transport
+
+BACKEND = os.getenv('PROVIDER_BACKEND', 'live')
+MOCK = BACKEND == 'mock'
+
+if BACKEND not in ('live', 'mock'):
+    raise ValueError(f"PROVIDER_BACKEND must be 'live' or 'mock', not {BACKEND!r}")
+
+if MOCK:
+    print("🧪 PROVIDER_BACKEND=mock: provider calls are simulated offline")
+
+
+def openai_client(api_key, **kwargs):
+    if MOCK:
+        from mock_providers import MockOpenAI
+        return MockOpenAI(api_key, **kwargs)
+    from openai import OpenAI
+    kwargs.setdefault('http_client', transport.http_client('openai'))
+    return OpenAI(api_key=api_key, **kwargs)
+
+
+def async_openai_client(api_key, **kwargs):
+    if MOCK:
+        from mock_providers import MockAsyncOpenAI
+        return MockAsyncOpenAI(api_key, **kwargs)
+    from openai import AsyncOpenAI
+    kwargs.setdefault('http_client', transport.async_http_client('openai'))
+    return AsyncOpenAI(api_key=api_key, **kwargs)
+
+
+def anthropic_client(api_key, **kwargs):
+    if MOCK:
+        from mock_providers import MockAnthropic
+        return MockAnthropic(api_key, **kwargs)
+    import anthropic
+    kwargs.setdefault('http_client', transport.http_client('anthropic'))
+    return anthropic.Anthropic(api_key=api_key, **kwargs)
+
+
+def async_anthropic_client(api_key, **kwargs):
+    if MOCK:
+        from mock_providers import MockAsyncAnthropic
+        return MockAsyncAnthropic(api_key, **kwargs)
+    import anthropic
+    kwargs.setdefault('http_client', transport.async_http_client('anthropic'))
+    return anthropic.AsyncAnthropic(api_key=api_key, **kwargs)
+
+
+_genai = None
+
+
+def gemini_sdk(api_key):
+    """The configured google.generativeai module, or its mock (same surface)"""
+    global _genai
+    if _genai is None:
+        if MOCK:
+            from mock_providers import MockGenAI
+            _genai = MockGenAI()
+        else:
+            import google.generativeai as genai
+            _genai = genai
+    _genai.configure(api_key=api_key)
+    return _genai
+
+
+def gemini_model(api_key, model_name):
+    return gemini_sdk(api_key).GenerativeModel(model_name)
+
+
+class Lazy:
+    """Stands in for a client and builds it on first attribute access"""
+
+    def __init__(self, factory, *args, **kwargs):
+        self._factory = lambda: factory(*args, **kwargs)
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def built(self):
+        return self._client is not None
+
+    def get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+def lazy(factory, *args, **kwargs):
+    return Lazy(factory, *args, **kwargs)
+
+
+def connect(name, client, timeout=5):
+    """Make one cheap authenticated call so the client's connection is open
+    (DNS, TCP, TLS) and the key is checked before real traffic arrives"""
+    if MOCK:
+        return
+    client = client.get() if isinstance(client, Lazy) else client
+    if name == 'gemini':
+        client.count_tokens('warm-up', request_options={'timeout': timeout})
+    else:
+        client.with_options(timeout=timeout).models.list()
@@ -0,0 +1,235 @@
+"""
+Per-provider rate limiting with adaptive (AIMD) concurrency
+
+Each provider (openai, anthropic, gemini) gets one ProviderLimiter shared by
+the Flask apps and MultimodalScoringAgent:
+
+- token buckets for requests/min and tokens/min (estimated before the call)
+- a concurrency limit that is halved on 429 / overload errors and grows back
+  by one slot per window of successful calls (additive increase,
+  multiplicative decrease)
+
+Limits come from <PROVIDER>_RPM, <PROVIDER>_TPM and <PROVIDER>_MAX_CONCURRENCY
+(e.g. OPENAI_RPM=500). limiter_snapshot() reports the live values, which
+are also exported on /metrics.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict
+
+import metrics
+
+# Rough size of an image in prompt tokens, for the tokens/min estimate
+IMAGE_TOKENS = 1000
+
+# After a throttle error, no new request starts for this long (unless the
+# provider sent a longer Retry-After)
+THROTTLE_COOLDOWN = 1.0
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a call could not get a slot within max_wait seconds"""
+
+
+def is_throttle_error(e: Exception) -> bool:
+    """True for 429 / overloaded responses from any of the provider SDKs"""
+    status = getattr(e, 'status_code', None) or getattr(e, 'code', None)
+    if status in (429, 529):
+        return True
+    return type(e).__name__ in ('RateLimitError', 'ResourceExhausted', 'TooManyRequests', 'OverloadedError')
+
+
+def _retry_after(e: Exception) -> float:
+    response = getattr(e, 'response', None)
+    try:
+        return float(response.headers.get('retry-after', 0))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
+
+
+def estimate_tokens(prompt: str, images: int = 0, max_output: int = 0) -> int:
+    """Tokens a call will use: ~4 characters per prompt token, plus images and output"""
+    return len(prompt) // 4 + images * IMAGE_TOKENS + max_output
+
+
+class ProviderLimiter:
+    """Token buckets (requests/min, tokens/min) plus an AIMD concurrency limit"""
+
+    def __init__(self, name: str, rpm: float, tpm: float, max_concurrency: int,
+                 min_concurrency: int = 1, max_wait: float = 60):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_wait = max_wait
+        self.concurrency = float(max_concurrency)
+        self.in_flight = 0
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._refilled = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.throttled = 0
+        self.errors = 0
+        self.wait_seconds = 0.0
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._refilled
+        self._refilled = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def _try_acquire(self, tokens: int) -> float:
+        """Take a slot and return 0, or return how long to wait before trying again"""
+        tokens = min(tokens, self.tpm)  # a single huge call must still fit eventually
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self.in_flight >= int(self.concurrency):
+                return 0.05
+            if self._requests < 1:
+                return (1 - self._requests) * 60 / self.rpm
+            if self._tokens < tokens:
+                return (tokens - self._tokens) * 60 / self.tpm
+            self._requests -= 1
+            self._tokens -= tokens
+            self.in_flight += 1
+            return 0.0
+
+    def _release(self, error: BaseException = None) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+                return  # abandoned (hedge loser, deadline): says nothing about provider capacity
+            self.calls += 1
+            if error is None:
+                # additive increase: +1 slot after `concurrency` successes
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            elif is_throttle_error(error):
+                # multiplicative decrease, and a short pause for everyone
+                self.throttled += 1
+                self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+                pause = max(THROTTLE_COOLDOWN, _retry_after(error))
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            else:
+                self.errors += 1
+
+    def _waited(self, seconds: float) -> None:
+        if seconds:
+            with self._lock:
+                self.wait_seconds += seconds
+
+    @contextmanager
+    def slot(self, tokens: int = 0, max_wait: float = None):
+        """Hold one call's worth of rate and concurrency budget (blocking)"""
+        max_wait = self.max_wait if max_wait is None else min(max_wait, self.max_wait)
+        started = time.monotonic()
+        while True:
+            wait = self._try_acquire(tokens)
+            if not wait:
+                break
+            if time.monotonic() - started + wait > max_wait:
+                raise RateLimitTimeout(f"{self.name}: no capacity within {max_wait:.0f}s")
+            time.sleep(min(wait, 1.0))
+        self._waited(time.monotonic() - started)
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._release(error)
+
+    @asynccontextmanager
+    async def aslot(self, tokens: int = 0, max_wait: float = None):
+        """Async form of slot(): waits with asyncio.sleep instead of blocking the loop"""
+        max_wait = self.max_wait if max_wait is None else min(max_wait, self.max_wait)
+        started = time.monotonic()
+        while True:
+            wait = self._try_acquire(tokens)
+            if not wait:
+                break
+            if time.monotonic() - started + wait > max_wait:
+                raise RateLimitTimeout(f"{self.name}: no capacity within {max_wait:.0f}s")
+            await asyncio.sleep(min(wait, 1.0))
+        self._waited(time.monotonic() - started)
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._release(error)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                'concurrency_limit': round(self.concurrency, 2),
+                'max_concurrency': self.max_concurrency,
+                'in_flight': self.in_flight,
+                'rpm': self.rpm,
+                'tpm': self.tpm,
+                'requests_available': round(self._requests, 1),
+                'tokens_available': int(self._tokens),
+                'paused_for': round(max(0.0, self._paused_until - time.monotonic()), 2),
+                'calls': self.calls,
+                'throttled': self.throttled,
+                'errors': self.errors,
+                'wait_seconds': round(self.wait_seconds, 2),
+            }
+
+
+def _from_env(name: str) -> ProviderLimiter:
+    prefix = name.upper()
+    return ProviderLimiter(
+        name,
+        rpm=float(os.getenv(f'{prefix}_RPM', '300')),
+        tpm=float(os.getenv(f'{prefix}_TPM', '300000')),
+        max_concurrency=int(os.getenv(f'{prefix}_MAX_CONCURRENCY', '16')),
+        max_wait=float(os.getenv('RATE_LIMIT_MAX_WAIT', '60')),
+    )
+
+
+LIMITERS = {name: _from_env(name) for name in ('openai', 'anthropic', 'gemini')}
+
+
+def limiter(provider: str) -> ProviderLimiter:
+    return LIMITERS[provider]
+
+
+def limiter_snapshot() -> Dict:
+    return {name: lim.snapshot() for name, lim in LIMITERS.items()}
+
+
+def _collect():
+    snapshots = limiter_snapshot()
+    gauges = [
+        ('concurrency_limit', 'Current AIMD concurrency limit'),
+        ('in_flight', 'Calls holding a limiter slot'),
+        ('requests_available', 'Requests left in the requests/min bucket'),
+        ('tokens_available', 'Tokens left in the tokens/min bucket'),
+        ('paused_for', 'Seconds until new calls may start after a throttle'),
+    ]
+    counters = [
+        ('throttled', 'Throttle (429/overload) errors seen by the limiter'),
+        ('wait_seconds', 'Seconds calls spent waiting for a limiter slot'),
+    ]
+    families = [(f'abtest_limiter_{field}', 'gauge', help,
+                 [({'provider': name}, snap[field]) for name, snap in snapshots.items()]) for field, help in gauges]
+    families += [(f'abtest_limiter_{field}_total', 'counter', help,
+                  [({'provider': name}, snap[field]) for name, snap in snapshots.items()]) for field, help in counters]
+    return families
+
+
+metrics.add_collector(_collect)
@@ -0,0 +1,380 @@
+"""
+Resilience layer for provider calls: timeouts, hedging and circuit breakers
+
+call_provider() / acall_provider() wrap a single SDK call with, in order:
+
+- a circuit breaker per provider: after BREAKER_FAILURES consecutive failures
+  the provider fails fast (CircuitOpenError) for BREAKER_RESET seconds, then
+  one trial call decides whether it closes again
+- a hedged duplicate: if the call is still running past the provider's
+  observed p95 latency, a second identical request is sent and the first to
+  succeed wins (capped at HEDGE_BUDGET of all calls)
+- the shared rate limiter from rate_limit.py, around every attempt
+- the request deadline (deadline.py): no waiting past it, and running out
+  of time or rate-limit capacity never counts against the breaker
+
+Client-side timeouts (PROVIDER_TIMEOUT, VIDEO_TIMEOUT for full-video Gemini
+calls) are set on the SDK clients themselves. A call that cannot hedge runs on
+the caller's thread with its timeout cut to what is left of the deadline; only
+calls that may hedge use the attempts pool (HEDGE_WORKERS threads).
+breaker_snapshot() exports breaker state and latency percentiles; both, and
+per-call timings, are also on /metrics. Under a traced request (tracing.py)
+each call is a span, with one child span per attempt.
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict
+
+import metrics
+import tracing
+from deadline import DeadlineExceeded, current_deadline, remaining
+from rate_limit import RateLimitTimeout, limiter
+
+PROVIDER_TIMEOUT = float(os.getenv('PROVIDER_TIMEOUT', '30'))
+VIDEO_TIMEOUT = float(os.getenv('VIDEO_TIMEOUT', '120'))
+BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES', '5'))
+BREAKER_RESET = float(os.getenv('BREAKER_RESET', '30'))
+HEDGING = os.getenv('HEDGING', '1') != '0'
+HEDGE_BUDGET = float(os.getenv('HEDGE_BUDGET', '0.1'))
+
+# Latency samples kept per provider, and how many are needed before hedging
+LATENCY_WINDOW = 200
+MIN_SAMPLES = 20
+# Never hedge sooner than this, however fast the provider has been
+MIN_HEDGE_DELAY = 1.0
+
+# Attempts of hedged calls: the primary and, once it is slow, the hedge
+_attempts = ThreadPoolExecutor(max_workers=int(os.getenv('HEDGE_WORKERS', '32')), thread_name_prefix='attempt')
+
+
+class CircuitOpenError(Exception):
+    """The provider's breaker is open; the call was not attempted"""
+
+
+class CircuitBreaker:
+    """closed -> open after repeated failures -> half_open trial -> closed/open"""
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURES, reset_timeout: float = BREAKER_RESET):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self._trial_running = False
+            if self.state == 'closed':
+                return True
+            if self.state == 'half_open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._trial_running = False
+
+    def record_abandoned(self) -> None:
+        """The call was given up on locally; free a half-open trial without judging the provider"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.times_opened += 1
+                    print(f"⚠️  Circuit OPEN for {self.name} ({self.failures} failures)")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self._trial_running = False
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'times_opened': self.times_opened,
+                'rejected': self.rejected,
+                'retry_in': round(max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)), 1)
+                            if self.state == 'open' else 0.0,
+            }
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies, plus the hedge budget"""
+
+    def __init__(self):
+        self._samples = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float):
+        with self._lock:
+            if len(self._samples) < MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging, or None if this call may not hedge"""
+        p95 = self.percentile(0.95)
+        with self._lock:
+            self.calls += 1
+            if not HEDGING or p95 is None or self.hedges >= HEDGE_BUDGET * self.calls:
+                return None
+        return max(p95, MIN_HEDGE_DELAY)
+
+    def snapshot(self) -> Dict:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        with self._lock:
+            return {
+                'samples': len(self._samples),
+                'p50_seconds': round(p50, 3) if p50 is not None else None,
+                'p95_seconds': round(p95, 3) if p95 is not None else None,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+            }
+
+
+BREAKERS = {name: CircuitBreaker(name) for name in ('openai', 'anthropic', 'gemini')}
+LATENCY = {name: LatencyTracker() for name in BREAKERS}
+
+
+def _limited(provider: str, tokens: int, fn, args, kwargs):
+    deadline = current_deadline()
+    if deadline is not None:
+        deadline.check(f"{provider} call")
+    with tracing.span('attempt') as span:
+        waiting = time.monotonic()
+        with limiter(provider).slot(tokens, max_wait=remaining()):
+            span.set(limiter_wait_ms=round((time.monotonic() - waiting) * 1000, 1))
+            with metrics.PROVIDER_SECONDS.time(provider=provider):
+                return fn(*args, **kwargs)
+
+
+def _within(provider: str, kwargs: Dict, seconds: float) -> Dict:
+    """kwargs with the SDK's per-request timeout cut to `seconds`"""
+    if 'request_options' in kwargs:  # Gemini
+        options = dict(kwargs['request_options'] or {})
+        options['timeout'] = min(options.get('timeout') or seconds, seconds)
+        return dict(kwargs, request_options=options)
+    if provider in ('openai', 'anthropic'):
+        return dict(kwargs, timeout=min(kwargs.get('timeout') or seconds, seconds))
+    return kwargs
+
+
+def _inline(provider, tokens, fn, args, kwargs, budget):
+    """The only attempt, on the caller's thread, over by the deadline at the latest"""
+    if budget is None:
+        return _limited(provider, tokens, fn, args, kwargs)
+    try:
+        return _limited(provider, tokens, fn, args, _within(provider, kwargs, budget))
+    except (DeadlineExceeded, RateLimitTimeout):
+        raise
+    except Exception as e:
+        if current_deadline().expired():  # our cut-short timeout, not the provider
+            raise DeadlineExceeded(f"{provider} call did not finish before the deadline") from e
+        raise
+
+
+def _submit(provider, tokens, fn, args, kwargs):
+    # copy_context() so the attempt thread sees the caller's deadline
+    return _attempts.submit(contextvars.copy_context().run, _limited, provider, tokens, fn, args, kwargs)
+
+
+def call_provider(provider: str, tokens: int, fn, *args, hedge: bool = True, **kwargs):
+    """fn(*args, **kwargs) behind the provider's breaker, hedging and rate limiter.
+
+    Under a deadline (deadline.py) DeadlineExceeded is raised once it expires.
+    A call that may not hedge runs on the caller's thread with its timeout cut
+    to the deadline; a hedged call's attempts run in the attempts pool, and an
+    abandoned one ends at its client timeout.
+    """
+    breaker, latency = BREAKERS[provider], LATENCY[provider]
+    if not breaker.allow():
+        metrics.PROVIDER_CALLS.inc(provider=provider, result='circuit_open')
+        raise CircuitOpenError(f"{provider} circuit open - failing fast")
+
+    started = time.monotonic()
+    budget = remaining()
+    delay = latency.hedge_delay() if hedge else None
+    try:
+        with tracing.span(provider, estimated_tokens=tokens, attempts=1) as span:
+            if delay is None:
+                result = _inline(provider, tokens, fn, args, kwargs, budget)
+            else:
+                result = _attempts_until(provider, tokens, fn, args, kwargs, delay, budget)
+            span.set(**tracing.usage_attributes(result))
+    except (DeadlineExceeded, RateLimitTimeout):
+        breaker.record_abandoned()  # our budget ran out; says nothing about the provider
+        metrics.PROVIDER_CALLS.inc(provider=provider, result='abandoned')
+        raise
+    except Exception:
+        breaker.record_failure()
+        metrics.PROVIDER_CALLS.inc(provider=provider, result='error')
+        raise
+    breaker.record_success()
+    metrics.PROVIDER_CALLS.inc(provider=provider, result='ok')
+    latency.record(time.monotonic() - started)
+    return result
+
+
+def _attempts_until(provider, tokens, fn, args, kwargs, delay, budget):
+    """Primary attempt, a hedge after `delay` seconds, and no waiting past `budget`"""
+    latency = LATENCY[provider]
+    expires = None if budget is None else time.monotonic() + budget
+    attempts = [_submit(provider, tokens, fn, args, kwargs)]
+    if budget is None or delay < budget:
+        done, _ = wait(attempts, timeout=delay)
+        if not done:
+            with latency._lock:
+                latency.hedges += 1
+            print(f"  ↻ Hedging {provider} call after {delay:.1f}s")
+            tracing.annotate(attempts=2)
+            attempts.append(_submit(provider, tokens, fn, args, kwargs))
+
+    pending = set(attempts)
+    error = None
+    while pending:
+        left = None if expires is None else max(0.0, expires - time.monotonic())
+        done, pending = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+        if not done:
+            for fut in pending:
+                fut.cancel()
+            raise DeadlineExceeded(f"{provider} call did not finish before the deadline")
+        for fut in done:
+            if fut.exception() is None:
+                if fut is not attempts[0]:
+                    with latency._lock:
+                        latency.hedge_wins += 1
+                return fut.result()  # a slower attempt finishes in the background
+            error = fut.exception()
+    raise error
+
+
+async def acall_provider(provider: str, tokens: int, coro_fn, *args, hedge: bool = True, **kwargs):
+    """Async form of call_provider(); the losing hedge and overdue attempts are cancelled"""
+    breaker, latency = BREAKERS[provider], LATENCY[provider]
+    if not breaker.allow():
+        metrics.PROVIDER_CALLS.inc(provider=provider, result='circuit_open')
+        raise CircuitOpenError(f"{provider} circuit open - failing fast")
+
+    async def attempt():
+        deadline = current_deadline()
+        if deadline is not None:
+            deadline.check(f"{provider} call")
+        with tracing.span('attempt') as span:
+            waiting = time.monotonic()
+            async with limiter(provider).aslot(tokens, max_wait=remaining()):
+                span.set(limiter_wait_ms=round((time.monotonic() - waiting) * 1000, 1))
+                with metrics.PROVIDER_SECONDS.time(provider=provider):
+                    return await coro_fn(*args, **kwargs)
+
+    started = time.monotonic()
+    budget = remaining()
+    delay = latency.hedge_delay() if hedge else None
+    try:
+        with tracing.span(provider, estimated_tokens=tokens, attempts=1) as span:
+            work = attempt() if delay is None else _ahedged(provider, attempt, delay)
+            if budget is None:
+                result = await work
+            else:
+                try:
+                    result = await asyncio.wait_for(work, budget)
+                except asyncio.TimeoutError:
+                    raise DeadlineExceeded(f"{provider} call did not finish before the deadline") from None
+            span.set(**tracing.usage_attributes(result))
+    except (DeadlineExceeded, RateLimitTimeout):
+        breaker.record_abandoned()
+        metrics.PROVIDER_CALLS.inc(provider=provider, result='abandoned')
+        raise
+    except Exception:
+        breaker.record_failure()
+        metrics.PROVIDER_CALLS.inc(provider=provider, result='error')
+        raise
+    breaker.record_success()
+    metrics.PROVIDER_CALLS.inc(provider=provider, result='ok')
+    latency.record(time.monotonic() - started)
+    return result
+
+
+async def _ahedged(provider, attempt, delay):
+    latency = LATENCY[provider]
+    primary = asyncio.ensure_future(attempt())
+    pending = {primary}
+    error = None
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return primary.result()
+
+        with latency._lock:
+            latency.hedges += 1
+        print(f"  ↻ Hedging {provider} call after {delay:.1f}s")
+        tracing.annotate(attempts=2)
+        backup = asyncio.ensure_future(attempt())
+        pending = {primary, backup}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is backup:
+                        with latency._lock:
+                            latency.hedge_wins += 1
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        # also runs when wait_for() cancels us at the deadline
+        for task in pending:
+            task.cancel()
+
+
+def breaker_snapshot() -> Dict:
+    return {name: dict(BREAKERS[name].snapshot(), latency=LATENCY[name].snapshot()) for name in BREAKERS}
+
+
+def _collect():
+    snapshots = breaker_snapshot()
+    states = ('closed', 'half_open', 'open')
+    return [
+        ('abtest_breaker_state', 'gauge', 'Circuit breaker state (1 for the current one)',
+         [({'provider': name, 'state': state}, int(snap['state'] == state))
+          for name, snap in snapshots.items() for state in states]),
+        ('abtest_breaker_consecutive_failures', 'gauge', 'Consecutive failures counted by the breaker',
+         [({'provider': name}, snap['consecutive_failures']) for name, snap in snapshots.items()]),
+        ('abtest_breaker_opened_total', 'counter', 'Times the breaker opened',
+         [({'provider': name}, snap['times_opened']) for name, snap in snapshots.items()]),
+        ('abtest_hedges_total', 'counter', 'Hedged duplicate requests sent',
+         [({'provider': name}, snap['latency']['hedges']) for name, snap in snapshots.items()]),
+        ('abtest_hedge_wins_total', 'counter', 'Hedged requests that answered first',
+         [({'provider': name}, snap['latency']['hedge_wins']) for name, snap in snapshots.items()]),
+    ]
+
+
+metrics.add_collector(_collect)
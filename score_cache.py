@@ -0,0 +1,126 @@
+"""
+Content-addressed cache for virality scores
+
+Scores are keyed by (model, content hash), where the content hash covers the
+prompt template version, caption, media digest and targeting context. Entries
+are evicted least-recently-used once the cache is full and expire after a TTL.
+An optional ScoreStore (score_store.py) sits behind the memory tier so scores
+survive restarts and are shared between worker processes.
+"""
+
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import metrics
+
+
+def media_digest(data: Optional[bytes]) -> str:
+    """SHA-256 of the raw media bytes ('' when there is no media)"""
+    return hashlib.sha256(data).hexdigest() if data else ''
+
+
+def content_hash(*parts) -> str:
+    """Stable hash of the prompt inputs (version, caption, media digest, targeting, ...)"""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part if part is not None else '').encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+class ScoreCache:
+    """Thread-safe in-memory LRU cache with a TTL and hit/miss counters"""
+
+    def __init__(self, max_entries: int = 512, ttl: float = 3600, store=None, name: str = 'score'):
+        self.name = name  # `cache` label on abtest_cache_lookups_total
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.store = store
+        self._entries = OrderedDict()  # (model, content_hash) -> (stored_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, model: str, chash: str):
+        """Cached value for (model, content hash), or None"""
+        key = (model, chash)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                metrics.CACHE_LOOKUPS.inc(cache=self.name, result='hit')
+                return copy.deepcopy(entry[1])
+            if entry is not None:
+                del self._entries[key]
+
+        entry = None
+        if self.store:
+            try:
+                # The cache's own TTL applies to stored scores too
+                entry = self.store.get_entry(model, chash, max_age=self.ttl)
+            except Exception as e:  # a broken store only costs us the hit
+                print(f"Score store read failed: {e}")
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                metrics.CACHE_LOOKUPS.inc(cache=self.name, result='miss')
+                return None
+            self.store_hits += 1
+            metrics.CACHE_LOOKUPS.inc(cache=self.name, result='store_hit')
+        age, value = entry
+        self._remember(key, value, age)
+        return copy.deepcopy(value)
+
+    def put(self, model: str, chash: str, value) -> None:
+        self._remember((model, chash), value)
+        if self.store:
+            try:
+                self.store.put(model, chash, value)
+            except Exception as e:
+                print(f"Score store write failed: {e}")
+
+    def _remember(self, key, value, age: float = 0.0) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() - age, copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.store_hits + self.misses
+            stats = {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'store_hits': self.store_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round((self.hits + self.store_hits) / lookups, 3) if lookups else 0.0,
+            }
+        if self.store:
+            stats['store'] = self.store.stats()
+        return stats
+
+    def collect(self):
+        """Cache size and evictions for metrics.add_collector()"""
+        with self._lock:
+            entries, evictions = len(self._entries), self.evictions
+        labels = {'cache': self.name}
+        return [
+            ('abtest_cache_entries', 'gauge', 'Entries in the in-memory score cache', [(labels, entries)]),
+            ('abtest_cache_evictions_total', 'counter', 'LRU evictions from the score cache', [(labels, evictions)]),
+        ]
@@ -0,0 +1,175 @@
+"""
+Persistent score store backed by SQLite (WAL mode)
+
+Survives restarts and is shared by every worker process on the node. Rows are
+looked up by (content_hash, model), the same key as the in-memory ScoreCache,
+and the least recently used rows are evicted once the store grows past
+max_entries.
+
+Maintenance:
+    python score_store.py stats   [--db scores.db]
+    python score_store.py compact [--db scores.db]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    id INTEGER PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_scores_key ON scores (content_hash, model);
+CREATE INDEX IF NOT EXISTS idx_scores_accessed ON scores (accessed_at);
+"""
+
+# Re-reading a hot row only refreshes its LRU timestamp this often, so reads
+# don't turn into a write per lookup.
+TOUCH_INTERVAL = 60
+# Eviction runs every EVICT_EVERY writes rather than on each one.
+EVICT_EVERY = 100
+
+
+class ScoreStore:
+    """SQLite-backed (content_hash, model) -> JSON payload store"""
+
+    def __init__(self, path: str, max_entries: int = 100000, ttl: Optional[float] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must stay on the thread that opened them
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, model: str, chash: str):
+        """Stored payload for (model, content hash), or None"""
+        entry = self.get_entry(model, chash)
+        return entry[1] if entry is not None else None
+
+    def get_entry(self, model: str, chash: str, max_age: Optional[float] = None):
+        """(age in seconds, payload) for (model, content hash), or None if missing
+        or older than the store's ttl or max_age"""
+        conn = self._conn()
+        row = conn.execute(
+            'SELECT id, payload, created_at, accessed_at FROM scores WHERE content_hash = ? AND model = ?',
+            (chash, model)
+        ).fetchone()
+        if row is None:
+            return None
+        row_id, payload, created_at, accessed_at = row
+        now = time.time()
+        age = now - created_at
+        if self.ttl is not None and age > self.ttl:
+            with conn:
+                conn.execute('DELETE FROM scores WHERE id = ?', (row_id,))
+            return None
+        if max_age is not None and age > max_age:
+            return None
+        if now - accessed_at > TOUCH_INTERVAL:
+            with conn:
+                conn.execute('UPDATE scores SET accessed_at = ? WHERE id = ?', (now, row_id))
+        return age, json.loads(payload)
+
+    def put(self, model: str, chash: str, value) -> None:
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO scores (content_hash, model, payload, created_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (chash, model, json.dumps(value), now, now)
+            )
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop expired rows, then least recently used rows beyond max_entries"""
+        conn = self._conn()
+        removed = 0
+        with conn:
+            if self.ttl is not None:
+                removed += conn.execute('DELETE FROM scores WHERE created_at < ?',
+                                        (time.time() - self.ttl,)).rowcount
+            count = conn.execute('SELECT COUNT(*) FROM scores').fetchone()[0]
+            if count > self.max_entries:
+                removed += conn.execute(
+                    'DELETE FROM scores WHERE id IN (SELECT id FROM scores ORDER BY accessed_at LIMIT ?)',
+                    (count - self.max_entries,)
+                ).rowcount
+        return removed
+
+    def compact(self) -> Dict:
+        """Evict, fold the WAL back into the database and VACUUM it"""
+        removed = self.evict()
+        conn = self._conn()
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        conn.execute('VACUUM')
+        return dict(self.stats(), removed=removed)
+
+    def stats(self) -> Dict:
+        conn = self._conn()
+        entries = conn.execute('SELECT COUNT(*) FROM scores').fetchone()[0]
+        by_model = dict(conn.execute('SELECT model, COUNT(*) FROM scores GROUP BY model').fetchall())
+        return {
+            'path': self.path,
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'by_model': by_model,
+            'db_bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+        }
+
+
+def open_store(path: Optional[str] = None) -> Optional[ScoreStore]:
+    """Store configured by SCORE_STORE_PATH / SCORE_STORE_MAX_ENTRIES / SCORE_STORE_TTL ('' path disables it).
+
+    SCORE_STORE_TTL defaults to SCORE_CACHE_TTL, so a stored score expires when
+    a cached one would; 0 keeps rows until they are evicted.
+    """
+    path = os.getenv('SCORE_STORE_PATH', 'scores.db') if path is None else path
+    if not path:
+        return None
+    ttl = float(os.getenv('SCORE_STORE_TTL') or os.getenv('SCORE_CACHE_TTL', '3600'))
+    return ScoreStore(path,
+                      max_entries=int(os.getenv('SCORE_STORE_MAX_ENTRIES', '100000')),
+                      ttl=ttl if ttl > 0 else None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain the persistent score store')
+    parser.add_argument('command', choices=['stats', 'compact'])
+    parser.add_argument('--db', default=None, help='database path (default: $SCORE_STORE_PATH or scores.db)')
+    args = parser.parse_args()
+
+    store = open_store(args.db)
+    if store is None:
+        parser.error('score store is disabled (SCORE_STORE_PATH is empty)')
+    result = store.compact() if args.command == 'compact' else store.stats()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
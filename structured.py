@@ -0,0 +1,208 @@
+"""
+Structured output for the scoring and recommendation calls
+
+With STRUCTURED_OUTPUT=1 (default) every scoring call sends a compact JSON
+schema in the form the provider supports, instead of asking for JSON in the
+prompt:
+
+- OpenAI: response_format={"type": "json_schema", "strict": true, ...}
+- Anthropic: one forced tool whose input_schema is the schema; the reply is
+  the tool_use input, already a dict
+- Gemini: response_mime_type="application/json" plus response_schema (the
+  OpenAPI subset: no additionalProperties / minimum / maximum)
+
+The replies are bare JSON with a one- or two-sentence reasoning, with no
+markdown fences and no preamble. STRUCTURED_OUTPUT=0 goes back to
+instructions in the prompt.
+
+parse() handles both modes. It calls json.loads directly, and falls back to
+digging the JSON out of free text (```json fences or the outermost braces)
+only when that fails. It then checks the result against the schema: required
+fields, types and 0-100 ranges. Every parse is counted per model and result
+(ok, extracted, invalid_json, schema) in abtest_parse_total and in
+parse_snapshot(). A reply that fails validation raises ParseError; it is not
+papered over with defaults.
+
+Fast mode (?fast=1 on /analyze, score_ensemble(fast=True)) asks for the
+integer scores only, with no reasoning. It uses the *_FAST schemas and caps
+output at FAST_MAX_TOKENS (default 100).
+"""
+
+import json
+import os
+import re
+import threading
+
+import metrics
+
+ENABLED = os.getenv('STRUCTURED_OUTPUT', '1') != '0'
+FAST_MAX_TOKENS = int(os.getenv('FAST_MAX_TOKENS', '100'))
+
+PARSES = metrics.Counter('abtest_parse_total', 'Model replies parsed, by model and result', ('model', 'result'))
+FAILURES = ('invalid_json', 'schema')
+
+_lock = threading.Lock()
+_counts = {}  # model -> {result: n}
+
+
+class ParseError(ValueError):
+    """A model reply that is not valid JSON or does not match its schema"""
+
+
+def integer(low=0, high=100):
+    return {'type': 'integer', 'minimum': low, 'maximum': high}
+
+
+def obj(properties):
+    return {'type': 'object', 'properties': properties, 'required': list(properties), 'additionalProperties': False}
+
+
+def _strip(spec, keys):
+    if isinstance(spec, dict):
+        return {k: _strip(v, keys) for k, v in spec.items() if k not in keys}
+    if isinstance(spec, list):
+        return [_strip(v, keys) for v in spec]
+    return spec
+
+
+class Schema:
+    """A named JSON schema and its per-provider request arguments"""
+
+    def __init__(self, name, description, spec):
+        self.name = name
+        self.spec = spec
+        self.openai = {'response_format': {'type': 'json_schema',
+                                           'json_schema': {'name': name, 'strict': True, 'schema': spec}}}
+        self.anthropic = {'tools': [{'name': name, 'description': description, 'input_schema': spec}],
+                          'tool_choice': {'type': 'tool', 'name': name}}
+        self.gemini = {'response_mime_type': 'application/json',
+                       'response_schema': _strip(spec, ('additionalProperties', 'minimum', 'maximum'))}
+
+
+SCORE_FIELDS = ('overall_score', 'text_quality', 'visual_appeal', 'emotional_resonance', 'clarity', 'brand_alignment')
+REASONING = {'type': 'string', 'description': 'One or two sentences'}
+
+
+def score_spec(fields=SCORE_FIELDS, reasoning=True):
+    properties = {f: integer() for f in fields}
+    if reasoning:
+        properties['reasoning'] = REASONING
+    return obj(properties)
+
+
+# The web apps' per-model score (full and fast) and Gemini's recommendation list
+SCORE = Schema('virality_score', 'Record the virality scores for the post', score_spec())
+SCORE_FAST = Schema('virality_score', 'Record the virality scores for the post', score_spec(reasoning=False))
+# The same plus the model's own confidence, asked of a cascade's first model (cascade.py)
+SCORE_RATED = Schema('virality_score', 'Record the virality scores for the post',
+                     score_spec(SCORE_FIELDS + ('confidence',)))
+SCORE_FAST_RATED = Schema('virality_score', 'Record the virality scores for the post',
+                          score_spec(SCORE_FIELDS + ('confidence',), reasoning=False))
+RECOMMENDATIONS = Schema('recommendations', 'Record the recommendations', {
+    'type': 'array',
+    'items': obj({'weakness_addressed': {'type': 'string'}, 'recommendation': {'type': 'string'},
+                  'impact': integer(0, 100)}),
+})
+
+
+def openai_kwargs(schema):
+    return schema.openai if ENABLED else {}
+
+
+def anthropic_kwargs(schema):
+    return schema.anthropic if ENABLED else {}
+
+
+def gemini_config(schema, **config):
+    """generation_config for generate_content (None if there is nothing to set)"""
+    if ENABLED:
+        config.update(schema.gemini)
+    return config or None
+
+
+def anthropic_reply(response):
+    """The forced tool call's input, or the text of a plain reply"""
+    for block in response.content:
+        if getattr(block, 'type', None) == 'tool_use':
+            return block.input
+    return response.content[0].text
+
+
+def _extract(text):
+    m = re.search(r'```json\s*(.*?)\s*```', text, re.DOTALL)
+    if m:
+        return m.group(1)
+    if '{' in text:
+        return text[text.find('{'):text.rfind('}') + 1]
+    return text
+
+
+def _check(value, spec, path):
+    """The first way `value` breaks `spec`, or None"""
+    kind = spec.get('type')
+    if kind == 'object':
+        if not isinstance(value, dict):
+            return f"{path} is not an object"
+        for key in spec.get('required', ()):
+            if key not in value:
+                return f"{path}.{key} is missing"
+        for key, sub in spec.get('properties', {}).items():
+            if key in value:
+                problem = _check(value[key], sub, f"{path}.{key}")
+                if problem:
+                    return problem
+    elif kind == 'array':
+        if not isinstance(value, list):
+            return f"{path} is not an array"
+        for i, item in enumerate(value):
+            problem = _check(item, spec['items'], f"{path}[{i}]")
+            if problem:
+                return problem
+    elif kind in ('integer', 'number'):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return f"{path} is not a number"
+        if not spec.get('minimum', value) <= value <= spec.get('maximum', value):
+            return f"{path}={value} is out of range"
+    elif kind == 'string' and not isinstance(value, str):
+        return f"{path} is not a string"
+    return None
+
+
+def _count(model, result):
+    PARSES.inc(model=model, result=result)
+    with _lock:
+        counts = _counts.setdefault(model, {})
+        counts[result] = counts.get(result, 0) + 1
+
+
+def parse(reply, schema, model):
+    """Validated JSON from a model reply (text, or an already-decoded tool input)"""
+    result = 'ok'
+    data = reply
+    if isinstance(reply, str):
+        try:
+            data = json.loads(reply)
+        except ValueError:
+            result = 'extracted'
+            try:
+                data = json.loads(_extract(reply))
+            except ValueError as e:
+                _count(model, 'invalid_json')
+                raise ParseError(f"{model}: reply is not JSON ({e})")
+    problem = _check(data, schema.spec, '$')
+    if problem:
+        _count(model, 'schema')
+        raise ParseError(f"{model}: {problem}")
+    _count(model, result)
+    return data
+
+
+def parse_snapshot():
+    with _lock:
+        counts = {model: dict(c) for model, c in _counts.items()}
+    snapshot = {}
+    for model, c in sorted(counts.items()):
+        total = sum(c.values())
+        failed = sum(c.get(r, 0) for r in FAILURES)
+        snapshot[model] = dict(c, total=total, failure_rate=round(failed / total, 4) if total else 0.0)
+    return {'structured_output': ENABLED, 'models': snapshot}
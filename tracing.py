@@ -0,0 +1,390 @@
+"""
+Request tracing: span trees for single slow requests
+
+Every /analyze request gets a request id (the client's X-Request-ID, or a
+new one) that goes back in the X-Request-ID response header. With an
+exporter configured, the request is also traced: the root span covers the
+request, with child spans for frame extraction, each model, each provider
+call and attempt (hedges show up as a second attempt), the Gemini upload and
+every poll, and the recommendations. Spans carry attributes such as bytes
+sent, token usage and attempts.
+
+Spans travel in a context variable like the deadline (deadline.py), so
+provider threads started with copy_context() attach to the right parent.
+A finished trace is written by one or both exporters:
+
+- TRACE_FILE: one JSON line per trace (spans flattened, with parent ids)
+- TRACE_OTLP_ENDPOINT: OTLP/HTTP JSON POSTed from a background thread, e.g.
+  http://localhost:4318/v1/traces
+
+With neither set, span() is a no-op. Local tools:
+    python tracing.py show [REQUEST_ID] [--file traces.jsonl] [--slowest]
+    python tracing.py collect [--port 4318] [--file traces.jsonl]   # OTLP stand-in
+"""
+
+import argparse
+import contextvars
+import functools
+import json
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+import urllib.request
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+TRACE_FILE = os.getenv('TRACE_FILE', '')
+TRACE_OTLP_ENDPOINT = os.getenv('TRACE_OTLP_ENDPOINT', '')
+SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'abtesting')
+ENABLED = bool(TRACE_FILE or TRACE_OTLP_ENDPOINT)
+
+# Client-supplied request ids are kept only if they look like ids
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._:-]{1,64}$')
+
+_current = contextvars.ContextVar('span', default=None)
+
+
+def request_id(supplied: Optional[str] = None) -> str:
+    """The client's X-Request-ID if it is sane, else a new one"""
+    return supplied if supplied and _REQUEST_ID.match(supplied) else uuid.uuid4().hex
+
+
+class Trace:
+    """Spans of one request; exported when the root span ends"""
+
+    def __init__(self, request_id: str):
+        self.trace_id = secrets.token_hex(16)
+        self.request_id = request_id
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span: 'Span') -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start_ns)
+        root = spans[0]
+        return {
+            'trace_id': self.trace_id,
+            'request_id': self.request_id,
+            'name': root.name,
+            'start': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(root.start_ns / 1e9)),
+            'start_ns': root.start_ns,
+            'duration_ms': root.duration_ms,
+            'spans': [s.to_dict(root.start_ns) for s in spans],
+        }
+
+
+class Span:
+    """One timed operation; set attributes with set() while it runs"""
+
+    def __init__(self, trace: Trace, name: str, parent: Optional['Span'], attributes: Dict):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes)
+        self.status = 'ok'
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        return round(((self.end_ns or time.time_ns()) - self.start_ns) / 1e6, 3)
+
+    def to_dict(self, origin_ns: int) -> Dict:
+        return {
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_ms': round((self.start_ns - origin_ns) / 1e6, 3),
+            'duration_ms': self.duration_ms,
+            'status': self.status,
+            'attributes': self.attributes,
+        }
+
+
+class _NoSpan:
+    """Stands in for a span when nothing is being traced"""
+
+    def set(self, **attributes) -> None:
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+def current_span():
+    return _current.get() or NO_SPAN
+
+
+def annotate(**attributes) -> None:
+    """Set attributes on the innermost running span (no-op when untraced)"""
+    current_span().set(**attributes)
+
+
+@contextmanager
+def _run(span: Span):
+    token = _current.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.status = 'error'
+        span.attributes['error'] = f"{type(e).__name__}: {e}"[:300]
+        raise
+    finally:
+        span.end_ns = time.time_ns()
+        _current.reset(token)
+        span.trace.add(span)
+
+
+@contextmanager
+def trace(name: str, request_id: str, **attributes):
+    """Root span of a new trace, exported when the block ends"""
+    if not ENABLED:
+        yield NO_SPAN
+        return
+    root = Span(Trace(request_id), name, None, dict(attributes, request_id=request_id))
+    try:
+        with _run(root) as span:
+            yield span
+    finally:
+        _export(root.trace)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Child of the current span; a no-op outside a trace"""
+    parent = _current.get()
+    if parent is None:
+        yield NO_SPAN
+        return
+    with _run(Span(parent.trace, name, parent, attributes)) as child:
+        yield child
+
+
+def traced(name: str):
+    """Decorator form of span()"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def usage_attributes(response) -> Dict:
+    """Token counts from an OpenAI, Anthropic or Gemini response, where present"""
+    usage = getattr(response, 'usage', None)
+    if usage is not None:
+        prompt = getattr(usage, 'prompt_tokens', None) or getattr(usage, 'input_tokens', None)
+        completion = getattr(usage, 'completion_tokens', None) or getattr(usage, 'output_tokens', None)
+    else:
+        meta = getattr(response, 'usage_metadata', None)
+        prompt = getattr(meta, 'prompt_token_count', None)
+        completion = getattr(meta, 'candidates_token_count', None)
+    attributes = {}
+    if isinstance(prompt, int):
+        attributes['input_tokens'] = prompt
+    if isinstance(completion, int):
+        attributes['output_tokens'] = completion
+    return attributes
+
+
+# ----------------------------------------------------------------------------
+# Exporters
+# ----------------------------------------------------------------------------
+
+_export_lock = threading.Lock()
+_otlp_queue = queue.Queue(maxsize=1000)
+_otlp_thread = None
+
+
+def _export(trace_: Trace) -> None:
+    record = trace_.to_dict()
+    if TRACE_FILE:
+        line = (json.dumps(record, default=str) + '\n').encode('utf-8')
+        try:
+            with _export_lock:
+                # one O_APPEND write per trace, so workers sharing the file don't interleave
+                fd = os.open(TRACE_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, line)
+                finally:
+                    os.close(fd)
+        except OSError as e:
+            print(f"Trace export failed: {e}")
+    if TRACE_OTLP_ENDPOINT:
+        _start_otlp()
+        try:
+            _otlp_queue.put_nowait(record)
+        except queue.Full:
+            print("Trace export queue full - dropping trace")
+
+
+def _start_otlp() -> None:
+    global _otlp_thread
+    with _export_lock:
+        if _otlp_thread is None:
+            _otlp_thread = threading.Thread(target=_otlp_worker, name='trace-export', daemon=True)
+            _otlp_thread.start()
+
+
+def _otlp_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def to_otlp(records: List[Dict]) -> Dict:
+    """OTLP/HTTP JSON body for exported trace records"""
+    spans = []
+    for record in records:
+        for s in record['spans']:
+            start = record['start_ns'] + int(s['start_ms'] * 1e6)
+            spans.append({
+                'traceId': record['trace_id'],
+                'spanId': s['span_id'],
+                'parentSpanId': s['parent_id'] or '',
+                'name': s['name'],
+                'kind': 2 if s['parent_id'] is None else 1,  # SERVER root, INTERNAL children
+                'startTimeUnixNano': str(start),
+                'endTimeUnixNano': str(start + int(s['duration_ms'] * 1e6)),
+                'attributes': [{'key': k, 'value': _otlp_value(v)} for k, v in s['attributes'].items()],
+                'status': {'code': 2 if s['status'] == 'error' else 1},
+            })
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+        'scopeSpans': [{'scope': {'name': 'tracing'}, 'spans': spans}],
+    }]}
+
+
+def _otlp_worker() -> None:
+    while True:
+        batch = [_otlp_queue.get()]
+        while len(batch) < 50:
+            try:
+                batch.append(_otlp_queue.get_nowait())
+            except queue.Empty:
+                break
+        body = json.dumps(to_otlp(batch), default=str).encode('utf-8')
+        req = urllib.request.Request(TRACE_OTLP_ENDPOINT, data=body, method='POST',
+                                     headers={'Content-Type': 'application/json'})
+        try:
+            urllib.request.urlopen(req, timeout=5).close()
+        except Exception as e:
+            print(f"Trace export to {TRACE_OTLP_ENDPOINT} failed: {e}")
+
+
+# ----------------------------------------------------------------------------
+# Local tools: span tree viewer and OTLP collector stand-in
+# ----------------------------------------------------------------------------
+
+def _from_otlp(body: Dict) -> List[Dict]:
+    """Exported trace records back from an OTLP/HTTP JSON body"""
+    traces = {}
+    for resource in body.get('resourceSpans', []):
+        for scope in resource.get('scopeSpans', []):
+            for s in scope.get('spans', []):
+                traces.setdefault(s['traceId'], []).append(s)
+    records = []
+    for trace_id, spans in traces.items():
+        spans.sort(key=lambda s: int(s['startTimeUnixNano']))
+        origin = int(spans[0]['startTimeUnixNano'])
+        flat = []
+        for s in spans:
+            attributes = {a['key']: next(iter(a['value'].values())) for a in s.get('attributes', [])}
+            start, end = int(s['startTimeUnixNano']), int(s['endTimeUnixNano'])
+            flat.append({'span_id': s['spanId'], 'parent_id': s.get('parentSpanId') or None, 'name': s['name'],
+                         'start_ms': round((start - origin) / 1e6, 3), 'duration_ms': round((end - start) / 1e6, 3),
+                         'status': 'error' if s.get('status', {}).get('code') == 2 else 'ok',
+                         'attributes': attributes})
+        root = flat[0]
+        records.append({'trace_id': trace_id, 'request_id': root['attributes'].get('request_id'),
+                        'name': root['name'],
+                        'start': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(origin / 1e9)),
+                        'start_ns': origin, 'duration_ms': root['duration_ms'], 'spans': flat})
+    return records
+
+
+def _print_tree(record: Dict) -> None:
+    print(f"{record['name']}  request_id={record['request_id']}  {record['duration_ms']:.0f}ms  ({record['start']})")
+    children = {}
+    for s in record['spans']:
+        children.setdefault(s['parent_id'], []).append(s)
+
+    def walk(parent_id, depth):
+        for s in children.get(parent_id, []):
+            attrs = ' '.join(f"{k}={v}" for k, v in s['attributes'].items() if k != 'request_id')
+            flag = ' ✗' if s['status'] == 'error' else ''
+            print(f"{s['start_ms']:>9.0f}ms {s['duration_ms']:>9.0f}ms  {'  ' * depth}{s['name']}{flag}  {attrs}")
+            walk(s['span_id'], depth + 1)
+    walk(None, 0)
+
+
+def _show(args) -> None:
+    with open(args.file) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if args.request_id:
+        records = [r for r in records if r['request_id'] == args.request_id]
+    if not records:
+        print("No matching traces")
+        return
+    if args.slowest:
+        records = sorted(records, key=lambda r: r['duration_ms'], reverse=True)[:args.slowest]
+    else:
+        records = records[-1:] if not args.request_id else records
+    for record in records:
+        _print_tree(record)
+        print()
+
+
+def _collect(args) -> None:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            records = _from_otlp(body)
+            with lock, open(args.file, 'a') as f:
+                for record in records:
+                    f.write(json.dumps(record) + '\n')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(b'{}')
+
+        def log_message(self, *a):
+            pass
+
+    print(f"Collecting OTLP/HTTP JSON traces on :{args.port}/v1/traces into {args.file}")
+    ThreadingHTTPServer(('', args.port), Handler).serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Trace viewer and OTLP collector stand-in')
+    sub = parser.add_subparsers(dest='command', required=True)
+    show = sub.add_parser('show', help='Print span trees (default: the last trace)')
+    show.add_argument('request_id', nargs='?')
+    show.add_argument('--file', default=TRACE_FILE or 'traces.jsonl')
+    show.add_argument('--slowest', type=int, nargs='?', const=1, help='The N slowest traces instead')
+    collect = sub.add_parser('collect', help='Receive OTLP/HTTP JSON and append traces to a JSONL file')
+    collect.add_argument('--port', type=int, default=4318)
+    collect.add_argument('--file', default=TRACE_FILE or 'traces.jsonl')
+    args = parser.parse_args()
+    _show(args) if args.command == 'show' else _collect(args)
@@ -0,0 +1,265 @@
+"""
+Shared HTTP transport for the provider SDKs
+
+Left alone, every OpenAI / Anthropic SDK client opens its own httpx pool with
+the library defaults. Idle connections are dropped after 5s, so a burst that
+follows a quiet spell pays for new TCP and TLS handshakes. Here each provider
+gets one pooled transport per process. It is shared by every sync client of
+that provider: the apps' and MultimodalScoringAgent's.
+
+- HTTP_MAX_CONNECTIONS (default 64): connections per provider pool
+- HTTP_MAX_KEEPALIVE (default = HTTP_MAX_CONNECTIONS): idle connections kept
+- HTTP_KEEPALIVE_EXPIRY (default 30): seconds an idle connection is kept
+- HTTP2 (default 1): negotiate HTTP/2 when the h2 package is installed, so
+  concurrent calls share one connection (and one handshake); HTTP/1.1 without it
+
+The pools are built from the httpx module the provider's SDK imports (httpx,
+or the renamed httpx2 fork in newer releases), so the SDK accepts them as its
+http_client.
+
+Async pools cannot cross event loops, so each async client gets its own pool
+with the same settings. MultimodalScoringAgent builds its async clients once,
+on its long-lived event loop. Their stats are counted with the provider's.
+Gemini is not routed here: google.generativeai talks gRPC over its own HTTP/2
+channel.
+
+pool_snapshot() (GET /transport, and /metrics) reports per provider:
+- open / active / idle connections and queued requests
+- how many requests reused a connection
+- the TCP connect and TLS handshake counts and time, from httpcore's
+  ``trace`` request extension. The handshake times are also added to the
+  current tracing span.
+"""
+
+import importlib.util
+import os
+import threading
+import time
+import weakref
+
+import metrics
+import tracing
+
+MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '64'))
+MAX_KEEPALIVE = int(os.getenv('HTTP_MAX_KEEPALIVE', str(MAX_CONNECTIONS)))
+KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '30'))
+HTTP2 = os.getenv('HTTP2', '1') != '0'
+
+COUNTERS = ('requests', 'tcp_connects', 'tls_handshakes', 'connect_seconds', 'tls_seconds')
+
+# httpcore trace step -> (count field, seconds field, span attribute)
+_HANDSHAKES = {
+    'connection.connect_tcp': ('tcp_connects', 'connect_seconds', 'connect_ms'),
+    'connection.start_tls': ('tls_handshakes', 'tls_seconds', 'tls_ms'),
+}
+
+_lock = threading.Lock()
+_clients = {}     # provider -> shared sync httpx client
+_transports = []  # (provider, weakref to an httpx transport), sync and async
+_counters = {}    # provider -> {counter: value}
+
+# Module whose globals show which httpx the provider's SDK was built on
+_SDK_BASE = {'openai': 'openai._base_client', 'anthropic': 'anthropic._base_client'}
+
+
+def _httpx(provider):
+    """The httpx module `provider`'s SDK imports: httpx, or the renamed httpx2 fork"""
+    base = importlib.import_module(_SDK_BASE[provider])
+    module = getattr(base, 'httpx2', None) or getattr(base, 'httpx', None)
+    if module is not None:
+        return module
+    try:
+        import httpx
+    except ImportError:
+        import httpx2 as httpx
+    return httpx
+
+
+def http2_enabled():
+    return HTTP2 and importlib.util.find_spec('h2') is not None
+
+
+def _count(provider, field, amount=1):
+    with _lock:
+        counters = _counters.setdefault(provider, dict.fromkeys(COUNTERS, 0))
+        counters[field] += amount
+
+
+class _Handshakes:
+    """``trace`` extension for one request: times the connect and TLS
+    handshake when the request had to open a new connection"""
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.started = {}
+
+    def __call__(self, event, info):
+        step, _, phase = event.rpartition('.')
+        fields = _HANDSHAKES.get(step)
+        if fields is None:
+            return
+        if phase == 'started':
+            self.started[step] = time.perf_counter()
+        elif phase == 'complete' and step in self.started:
+            seconds = time.perf_counter() - self.started.pop(step)
+            _count(self.provider, fields[0])
+            _count(self.provider, fields[1], seconds)
+            tracing.annotate(**{fields[2]: round(seconds * 1000, 1)})
+
+    async def atrace(self, event, info):
+        self(event, info)
+
+
+def _limits(httpx):
+    return httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE,
+                        keepalive_expiry=KEEPALIVE_EXPIRY)
+
+
+def _register(provider, transport):
+    with _lock:
+        _transports.append((provider, weakref.ref(transport)))
+        _counters.setdefault(provider, dict.fromkeys(COUNTERS, 0))
+
+
+_warned_h2 = False
+
+
+def _http2():
+    global _warned_h2
+    if HTTP2 and not http2_enabled() and not _warned_h2:
+        _warned_h2 = True
+        print("⚠️ HTTP2=1 but the h2 package is not installed; provider calls use HTTP/1.1")
+    return http2_enabled()
+
+
+def http_client(provider):
+    """The process-wide httpx client behind every sync SDK client of `provider`"""
+    with _lock:
+        client = _clients.get(provider)
+    if client is not None:
+        return client
+    httpx = _httpx(provider)
+
+    def on_request(request):
+        _count(provider, 'requests')
+        request.extensions['trace'] = _Handshakes(provider)
+
+    transport = httpx.HTTPTransport(http2=_http2(), limits=_limits(httpx))
+    client = httpx.Client(transport=transport, follow_redirects=True, event_hooks={'request': [on_request]})
+    with _lock:
+        if provider in _clients:  # another thread built it first
+            client.close()
+            return _clients[provider]
+        _clients[provider] = client
+    _register(provider, transport)
+    return client
+
+
+def async_http_client(provider):
+    """A new async httpx client with the shared settings, for one event loop"""
+    httpx = _httpx(provider)
+
+    async def on_request(request):
+        _count(provider, 'requests')
+        request.extensions['trace'] = _Handshakes(provider).atrace
+
+    transport = httpx.AsyncHTTPTransport(http2=_http2(), limits=_limits(httpx))
+    _register(provider, transport)
+    return httpx.AsyncClient(transport=transport, follow_redirects=True, event_hooks={'request': [on_request]})
+
+
+def _pool_state(transport):
+    """(connections, queued requests) of an httpx transport's httpcore pool"""
+    pool = getattr(transport, '_pool', None)
+    connections = list(getattr(pool, 'connections', ()))
+    queued = sum(1 for r in list(getattr(pool, '_requests', ())) if r.is_queued())
+    return connections, queued
+
+
+def pool_snapshot():
+    with _lock:
+        _transports[:] = [(p, ref) for p, ref in _transports if ref() is not None]
+        transports = [(p, ref()) for p, ref in _transports]
+        counters = {p: dict(c) for p, c in _counters.items()}
+    snapshot = {}
+    for provider, counts in sorted(counters.items()):
+        state = dict(max_connections=MAX_CONNECTIONS, keepalive_expiry=KEEPALIVE_EXPIRY, http2=http2_enabled(),
+                     pools=0, connections=0, active=0, idle=0, http2_connections=0, queued=0)
+        for _, transport in (t for t in transports if t[0] == provider):
+            if transport is None:
+                continue
+            connections, queued = _pool_state(transport)
+            state['pools'] += 1
+            state['queued'] += queued
+            for connection in connections:
+                if connection.is_closed():
+                    continue
+                state['connections'] += 1
+                state['idle' if connection.is_idle() else 'active'] += 1
+                state['http2_connections'] += 'HTTP2' in type(getattr(connection, '_connection', None)).__name__
+        state['utilization'] = round(state['active'] / MAX_CONNECTIONS, 3) if MAX_CONNECTIONS else 0.0
+        state.update(counts)
+        state['connect_seconds'] = round(counts['connect_seconds'], 4)
+        state['tls_seconds'] = round(counts['tls_seconds'], 4)
+        state['reused'] = max(counts['requests'] - counts['tcp_connects'], 0)
+        snapshot[provider] = state
+    return snapshot
+
+
+def _collect():
+    snapshots = pool_snapshot()
+    gauges = [
+        ('connections', 'Open connections in the provider pool'),
+        ('active', 'Connections carrying a request'),
+        ('idle', 'Idle keep-alive connections'),
+        ('queued', 'Requests waiting for a pool connection'),
+        ('utilization', 'Active connections / HTTP_MAX_CONNECTIONS'),
+    ]
+    counters = [
+        ('requests', 'HTTP requests sent by the provider SDKs'),
+        ('tcp_connects', 'New TCP connections opened'),
+        ('tls_handshakes', 'TLS handshakes completed'),
+        ('connect_seconds', 'Seconds spent opening TCP connections'),
+        ('tls_seconds', 'Seconds spent in TLS handshakes'),
+    ]
+    families = [(f'abtest_http_pool_{field}', 'gauge', help,
+                 [({'provider': name}, snap[field]) for name, snap in snapshots.items()]) for field, help in gauges]
+    families += [(f'abtest_http_{field}_total', 'counter', help,
+                  [({'provider': name}, snap[field]) for name, snap in snapshots.items()]) for field, help in counters]
+    return families
+
+
+metrics.add_collector(_collect)
+
+
+def check():
+    """Build a sync and an async OpenAI / Anthropic client on the pooled
+    transports, as the apps do (no network calls); raises if the SDK rejects them"""
+    import asyncio
+    import providers
+
+    async def build_async():
+        built = []
+        for make in (providers.async_openai_client, providers.async_anthropic_client):
+            client = make('sk-check', max_retries=0)
+            built.append(type(client).__name__)
+            await client.close()
+        return built
+
+    built = [type(providers.openai_client('sk-check', max_retries=0)).__name__,
+             type(providers.anthropic_client('sk-check', max_retries=0)).__name__]
+    built += asyncio.run(build_async())
+    httpx = {provider: _httpx(provider).__name__ for provider in _SDK_BASE}
+    return {'clients': built, 'httpx': httpx, 'pools': sorted(pool_snapshot())}
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Shared provider HTTP pools')
+    parser.add_argument('command', choices=['check'], help='check: build every SDK client on the shared pools')
+    parser.parse_args()
+    os.environ['PROVIDER_BACKEND'] = 'live'  # the mocks would skip the SDKs
+    import transport  # the module providers.py uses, not this __main__ copy
+    print(json.dumps(transport.check(), indent=2))
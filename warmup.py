@@ -0,0 +1,96 @@
+"""
+Worker warm-up and readiness
+
+Provider SDKs and the video/image codecs are imported lazily, so importing the
+app is fast and a worker starts answering HTTP straight away. Whatever is lazy
+still has to be paid once: without a warm-up, the first analysis imports three
+SDKs and the first video imports OpenCV while a user waits.
+
+WarmUp pays it up front, in a background thread of each worker. GET /ready
+answers 503 until it finishes, so a load balancer or deploy check that polls
+/ready only sends traffic to warm workers.
+
+- WARM_UP (default 1): import the SDKs, build the clients and pre-import the
+  codecs (cv2, numpy, PIL plugins) before reporting ready. 0 reports ready at
+  once and leaves everything to the first request that needs it.
+- WARM_UP_CONNECT (default 0): also make one cheap authenticated call per
+  provider (model list / token count). This opens the pooled connection and
+  checks the keys; the connection is only reused if traffic arrives within
+  HTTP_KEEPALIVE_EXPIRY (transport.py).
+"""
+
+import os
+import threading
+import time
+
+import providers
+
+WARM_UP = os.getenv('WARM_UP', '1') != '0'
+WARM_UP_CONNECT = os.getenv('WARM_UP_CONNECT', '0') != '0'
+
+
+def import_codecs():
+    import cv2, numpy
+    import PIL.Image
+    PIL.Image.init()  # registers every format plugin (JPEG, PNG, WebP, ...)
+
+
+class WarmUp:
+    """Runs the warm-up once per process and reports readiness"""
+
+    def __init__(self, clients):
+        self.clients = clients  # name -> providers.Lazy
+        self.state = 'pending'
+        self.steps = {}
+        self.errors = {}
+        self.seconds = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def start(self):
+        """Start warming in the background; safe to call more than once"""
+        with self._lock:
+            if self.state != 'pending':
+                return
+            if not WARM_UP:
+                self.state = 'done'
+                self.seconds = 0.0
+                self._done.set()
+                return
+            self.state = 'running'
+        threading.Thread(target=self.run, name='warm-up', daemon=True).start()
+
+    def _step(self, name, fn):
+        started = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            # A failed step leaves that piece lazy; it is retried on first use
+            self.errors[name] = str(e)[:200]
+            print(f"⚠️ Warm-up {name} failed: {e}")
+        self.steps[name] = round(time.perf_counter() - started, 3)
+
+    def run(self):
+        started = time.perf_counter()
+        for name, client in self.clients.items():
+            self._step(f'{name}_client', client.get)
+        self._step('codecs', import_codecs)
+        if WARM_UP_CONNECT:
+            for name, client in self.clients.items():
+                if client.built:
+                    self._step(f'{name}_connect', lambda: providers.connect(name, client))
+        self.seconds = round(time.perf_counter() - started, 3)
+        self.state = 'done'
+        self._done.set()
+        print(f"🔥 Warm-up finished in {self.seconds}s")
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    @property
+    def ready(self):
+        return self._done.is_set()
+
+    def status(self):
+        return {'ready': self.ready, 'state': self.state, 'seconds': self.seconds,
+                'steps': dict(self.steps), 'errors': dict(self.errors)}